@@ -1,15 +1,18 @@
 import sys
 import mido
-import threading
-import time
-import numpy as np
 import pyqtgraph as pg
 
 from PyQt5.QtWidgets import (
     QApplication, QHBoxLayout, QMainWindow, QSlider, QWidget, QVBoxLayout,
-    QSpinBox, QComboBox, QPushButton, QStackedWidget, QLabel
+    QSpinBox, QComboBox, QPushButton, QStackedWidget, QLabel, QCheckBox
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
+
+from util.envelope import adsr_curve
+from util.midi_output import get_output_service
+from util.sequencer import SequencerParams, StepSequencer
+from util.workers import WorkerManager
+from ui.gui_bridge import GuiBridge
 
 
 class MidiTool(QMainWindow):
@@ -48,6 +51,14 @@ class MidiTool(QMainWindow):
         self.plot_widget.plotItem.vb.suggestPadding(0)
 
         adsr_layout.addWidget(self.plot_widget)
+        self.envelope_curve = self.plot_widget.plot(pen='g')  # Reused for every redraw
+
+        # Slider moves only mark the graph dirty; it redraws once per display frame
+        self.graph_timer = QTimer()
+        self.graph_timer.setSingleShot(True)
+        refresh_rate = QApplication.primaryScreen().refreshRate() if QApplication.primaryScreen() else 60
+        self.graph_timer.setInterval(int(1000 / (refresh_rate or 60)))
+        self.graph_timer.timeout.connect(self.update_graph)
 
         # Slider layout
         slider_layout = QHBoxLayout()
@@ -60,7 +71,7 @@ class MidiTool(QMainWindow):
         self.attack_slider = QSlider(Qt.Vertical)
         self.attack_slider.setRange(0, 5000)
         self.attack_slider.setValue(1000)
-        self.attack_slider.valueChanged.connect(self.update_graph)
+        self.attack_slider.valueChanged.connect(self.schedule_graph_update)
         self.style_slider(self.attack_slider, "#ff6600")  # orange for attack
         slider_layout.addWidget(self._labeled_slider("Attack (ms)", self.attack_slider))
 
@@ -68,7 +79,7 @@ class MidiTool(QMainWindow):
         self.decay_slider = QSlider(Qt.Vertical)
         self.decay_slider.setRange(0, 5000)
         self.decay_slider.setValue(500)
-        self.decay_slider.valueChanged.connect(self.update_graph)
+        self.decay_slider.valueChanged.connect(self.schedule_graph_update)
         self.style_slider(self.decay_slider, "#ffaa00")
         slider_layout.addWidget(self._labeled_slider("Decay (ms)", self.decay_slider))
 
@@ -76,7 +87,7 @@ class MidiTool(QMainWindow):
         self.sustain_slider = QSlider(Qt.Vertical)
         self.sustain_slider.setRange(0, 100)
         self.sustain_slider.setValue(60)
-        self.sustain_slider.valueChanged.connect(self.update_graph)
+        self.sustain_slider.valueChanged.connect(self.schedule_graph_update)
         self.style_slider(self.sustain_slider, "#33ccff")
         slider_layout.addWidget(self._labeled_slider("Sustain (%)", self.sustain_slider))
 
@@ -84,7 +95,7 @@ class MidiTool(QMainWindow):
         self.release_slider = QSlider(Qt.Vertical)
         self.release_slider.setRange(0, 5000)
         self.release_slider.setValue(1500)
-        self.release_slider.valueChanged.connect(self.update_graph)
+        self.release_slider.valueChanged.connect(self.schedule_graph_update)
         self.style_slider(self.release_slider, "#cc33ff")
         slider_layout.addWidget(self._labeled_slider("Release (ms)", self.release_slider))
 
@@ -98,6 +109,9 @@ class MidiTool(QMainWindow):
         adsr_layout.addWidget(QLabel("Octave Range"))
         adsr_layout.addWidget(self.octave_range_input)
 
+        self.envelope_cc_checkbox = QCheckBox("Send envelope as CC11 (Expression)")
+        adsr_layout.addWidget(self.envelope_cc_checkbox)
+
         self.stacked_widget.addWidget(self.adsr_view)
         self.update_graph()
 
@@ -141,6 +155,30 @@ class MidiTool(QMainWindow):
         hold_layout.addWidget(QLabel("Number of Bars"))
         hold_layout.addWidget(self.bars_input)
 
+        self.swing_input = QSpinBox()
+        self.swing_input.setRange(0, 50)
+        self.swing_input.setValue(0)
+        hold_layout.addWidget(QLabel("Swing (% of a step)"))
+        hold_layout.addWidget(self.swing_input)
+
+        self.gate_input = QSpinBox()
+        self.gate_input.setRange(5, 100)
+        self.gate_input.setValue(90)
+        hold_layout.addWidget(QLabel("Gate (% of a step)"))
+        hold_layout.addWidget(self.gate_input)
+
+        # Sequencer engine; widget changes reach it live at step boundaries
+        self.sequencer = StepSequencer(send=None)
+        self.workers = WorkerManager()  # At most one sequencer thread
+        self.gui = GuiBridge(parent=self)  # Widget updates from the sequencer thread
+        for spin in (self.midi_note_input, self.velocity_input, self.bpm_input, self.note_duration_input,
+                     self.bars_input, self.octave_range_input, self.swing_input, self.gate_input):
+            spin.valueChanged.connect(self.update_sequencer)
+        for slider in (self.attack_slider, self.decay_slider, self.sustain_slider, self.release_slider):
+            slider.valueChanged.connect(self.update_sequencer)
+        self.arp_direction_dropdown.currentIndexChanged.connect(self.update_sequencer)
+        self.envelope_cc_checkbox.toggled.connect(self.update_sequencer)
+
         self.stacked_widget.addWidget(self.note_hold_view)
 
     def toggle_view(self, checked):
@@ -151,80 +189,64 @@ class MidiTool(QMainWindow):
             self.stacked_widget.setCurrentIndex(0)
             self.toggle_view_button.setText("Switch to Note Hold View")
 
+    def schedule_graph_update(self):
+        if not self.graph_timer.isActive():
+            self.graph_timer.start()
+
+    def envelope_params(self):
+        """(attack, decay, sustain, release) from the sliders, times in seconds."""
+        return (self.attack_slider.value() / 1000.0,
+                self.decay_slider.value() / 1000.0,
+                self.sustain_slider.value() / 100.0,
+                self.release_slider.value() / 1000.0)
+
     def update_graph(self):
-        a = self.attack_slider.value() / 1000.0
-        d = self.decay_slider.value() / 1000.0
-        s = self.sustain_slider.value() / 100.0
-        r = self.release_slider.value() / 1000.0
-
-        t = np.linspace(0, a + d + r, 500)
-        y = []
-
-        for x in t:
-            if x < a:
-                y.append(x / a)
-            elif x < a + d:
-                y.append(1 - (1 - s) * ((x - a) / d))
-            elif x < a + d + r:
-                y.append(s * (1 - ((x - a - d) / r)))
-            else:
-                y.append(0)
-
-        self.plot_widget.clear()
-        self.plot_widget.plot(t, y, pen='g')
+        t, y = adsr_curve(*self.envelope_params(), resolution=500)
+        self.envelope_curve.setData(t, y)
+
+    def sequencer_params(self):
+        """Read every sequencer setting from the widgets (GUI thread only)."""
+        return SequencerParams(
+            base_note=self.midi_note_input.value(),
+            velocity=self.velocity_input.value(),
+            bpm=self.bpm_input.value(),
+            duration_beats=self.note_duration_input.value(),
+            bars=self.bars_input.value(),
+            direction=self.arp_direction_dropdown.currentText().lower(),
+            octave_range=self.octave_range_input.value(),
+            swing=self.swing_input.value() / 100.0,
+            gate=self.gate_input.value() / 100.0,
+            envelope=self.envelope_params() if self.envelope_cc_checkbox.isChecked() else None)
+
+    def update_sequencer(self):
+        """Hand changed settings to a running sequencer; they apply at the next step."""
+        if self.workers.is_running("sequencer"):
+            self.sequencer.update(self.sequencer_params())
 
     def toggle_note(self, is_on):
         if is_on:
-            self.hold_thread = threading.Thread(target=self.play_note_loop)
-            self.hold_thread.daemon = True
-            self.hold_thread.start()
+            self.workers.start("sequencer", self.play_note_loop, self.sequencer_params(), replace=True)
         else:
-            self.stop_requested = True
+            self.workers.stop("sequencer")
 
-    def play_note_loop(self):
+    def play_note_loop(self, worker, params):
         try:
             port_name = mido.get_output_names()[0]
-            base_note = self.midi_note_input.value()
-            velocity = self.velocity_input.value()
-            bpm = self.bpm_input.value()
-            duration_beats = self.note_duration_input.value()
-            bars = self.bars_input.value()
-            beat_duration = 60.0 / bpm
-            note_duration_sec = duration_beats * beat_duration
-            total_beats = bars * 4
-
-            # ARP config
-            direction = self.arp_direction_dropdown.currentText().lower()
-            octave_range = self.octave_range_input.value()
-
-            # Build note sequence
-            arp_notes = []
-            for octv in range(octave_range):
-                arp_notes.append(base_note + 12 * octv)
-            if direction == "down":
-                arp_notes = sorted(arp_notes, reverse=True)
-            elif direction == "up-down":
-                arp_notes = arp_notes + arp_notes[::-1][1:-1]
-
-            self.stop_requested = False
-            beat_count = 0
-
-            with mido.open_output(port_name) as outport:
-                while not self.stop_requested and beat_count < total_beats:
-                    for note in arp_notes:
-                        if self.stop_requested or beat_count >= total_beats:
-                            break
-                        outport.send(mido.Message('note_on', note=note, velocity=velocity, channel=0))
-                        time.sleep(note_duration_sec * 0.9)
-                        outport.send(mido.Message('note_off', note=note, velocity=velocity, channel=0))
-                        time.sleep(note_duration_sec * 0.1)
-                        beat_count += duration_beats
-
-            self.hold_button.setChecked(False)
+            output = get_output_service()
+            output.open(port_name)
+            self.sequencer.send = lambda data: output.send(data, port_name)
+            self.sequencer.run(params, stop_event=worker.stop_event)
+
+            if not worker.stopping:
+                self.gui.post("hold_button", self.hold_button.setChecked, False)  # Ran to the end on its own
 
         except Exception as e:
             print("MIDI Error:", e)
 
+    def closeEvent(self, event):
+        self.workers.stop_all()
+        super().closeEvent(event)
+
     def _labeled_slider(self, label_text, slider):
         wrapper = QWidget()
         v_layout = QVBoxLayout()
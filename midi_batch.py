@@ -0,0 +1,159 @@
+"""Batch-analyze MIDI files: BPM, length and note statistics.
+
+Walks the given folders, analyzes files in parallel and streams one
+result per file as JSONL or CSV. Re-running with the same output file
+skips files that are already in it, so an interrupted run resumes.
+
+    python3 midi_batch.py ~/samples -o catalogue.jsonl
+    python3 midi_batch.py ~/samples ~/packs -o catalogue.csv --workers 8
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from util.midi_index import FIELDS, analyze_file, channel_list, iter_midi_files
+
+COLUMNS = ('path', 'mtime', 'size') + FIELDS
+REPORT_INTERVAL = 2.0  # Seconds between throughput reports
+
+
+def load_done(path, fmt):
+    """Paths already in an output file. Drops a half-written last line."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    good_end = 0
+    header = None
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        while True:
+            line = f.readline()
+            if not line:
+                break
+            try:
+                if not line.endswith('\n'):
+                    raise ValueError("Incomplete line")
+                if fmt == 'csv':
+                    row = next(csv.reader([line]))
+                    if header is None:
+                        header = row
+                    else:
+                        # A row cut short has fewer fields than the header
+                        if len(row) != len(header):
+                            raise ValueError("Incomplete row")
+                        record = dict(zip(header, row))
+                        if not record.get('path'):
+                            raise ValueError("Row without path")
+                        done.add(record['path'])
+                else:
+                    done.add(json.loads(line)['path'])
+                good_end = f.tell()
+            except (ValueError, KeyError, StopIteration, csv.Error):
+                break
+    if good_end < os.path.getsize(path):
+        with open(path, 'r+b') as f:
+            f.truncate(good_end)
+    return done
+
+
+class ResultWriter:
+    def __init__(self, stream, fmt, write_header):
+        self.stream = stream
+        self.fmt = fmt
+        if fmt == 'csv':
+            self.writer = csv.DictWriter(stream, fieldnames=COLUMNS)
+            if write_header:
+                self.writer.writeheader()
+
+    def write(self, record):
+        record = dict(record)
+        if self.fmt == 'csv':
+            record['channels'] = ",".join(str(channel) for channel in channel_list(record['channels']))
+            self.writer.writerow({column: record.get(column) for column in COLUMNS})
+        else:
+            record['channels'] = channel_list(record['channels'])
+            self.stream.write(json.dumps({column: record.get(column) for column in COLUMNS}) + "\n")
+
+
+def iter_paths(roots, done):
+    for root in roots:
+        if os.path.isfile(root):
+            if root not in done:
+                yield root
+            continue
+        for path, _, _ in iter_midi_files(root):
+            if path not in done:
+                yield path
+
+
+def run(roots, output, fmt, workers, resume):
+    done = load_done(output, fmt) if output and resume else set()
+    if done:
+        print(f"Resuming: {len(done)} files already analyzed", file=sys.stderr)
+    if output:
+        write_header = not (resume and os.path.exists(output) and os.path.getsize(output))
+        stream = open(output, 'a' if resume else 'w', newline='', encoding='utf-8')
+    else:
+        write_header = True
+        stream = sys.stdout
+    writer = ResultWriter(stream, fmt, write_header)
+
+    count = errors = 0
+    start = last_report = time.perf_counter()
+    paths = iter_paths(roots, done)
+    workers = workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=workers)
+    max_pending = workers * 8
+    pending = set()
+    try:
+        while True:
+            # Keep a bounded window of work in flight so huge trees stay cheap
+            for path in paths:
+                pending.add(pool.submit(analyze_file, path))
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                record = future.result()
+                writer.write(record)
+                count += 1
+                errors += record['error'] is not None
+            now = time.perf_counter()
+            if now - last_report >= REPORT_INTERVAL:
+                stream.flush()
+                print(f"{count} files, {count / (now - start):.1f} files/s", file=sys.stderr)
+                last_report = now
+    except KeyboardInterrupt:
+        print("Interrupted, re-run with the same output to resume", file=sys.stderr)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        stream.flush()
+        if stream is not sys.stdout:
+            stream.close()
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"Done: {count} files ({errors} errors) in {elapsed:.1f} s, {rate:.1f} files/s", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('roots', nargs='+', help="Folders or files to analyze")
+    parser.add_argument('-o', '--output', help="Output file (.jsonl or .csv), stdout if omitted")
+    parser.add_argument('--format', choices=('jsonl', 'csv'), help="Output format, default from the file name")
+    parser.add_argument('--workers', type=int, help="Worker processes, default one per CPU")
+    parser.add_argument('--no-resume', action='store_true', help="Overwrite the output instead of resuming")
+    args = parser.parse_args()
+
+    fmt = args.format
+    if fmt is None:
+        fmt = 'csv' if args.output and args.output.lower().endswith('.csv') else 'jsonl'
+    run(args.roots, args.output, fmt, args.workers, not args.no_resume)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,34 @@
-import mido
+"""Log every MIDI input port.
+
+Prints messages to the terminal by default, writes a rotating JSONL log
+with --log, or a compact binary capture with --capture that
+midi_replay.py can play back. All ports feed one background writer;
+drops are reported on stderr if the output cannot keep up.
+
+    python3 midi_log.py
+    python3 midi_log.py --log rehearsal.jsonl --max-mb 256
+    python3 midi_log.py --capture rehearsal.mcap
+"""
+import argparse
+import signal
 import threading
 
-def log_messages(port_name):
-    try:
-        with mido.open_input(port_name) as inport:
-            print(f"[{port_name}] Listening...")
-            for msg in inport:
-                print(f"[{port_name}] {msg}")
-    except Exception as e:
-        print(f"Error on {port_name}: {e}")
+import mido
+
+from util.midi_logger import CaptureLog, JsonlLog, MidiLogger, TextLog
+
 
 def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--log', help="Write a rotating JSONL log here instead of printing")
+    parser.add_argument('--capture', help="Write a rotating binary capture here instead of printing")
+    parser.add_argument('--max-mb', type=float, default=64, help="Rotate the log after this many MB")
+    parser.add_argument('--backups', type=int, default=5, help="Rotated logs to keep")
+    parser.add_argument('--ignore-clock', action='store_true', help="Skip clock and active sensing")
+    args = parser.parse_args()
+
     input_ports = mido.get_input_names()
-    
+
     if not input_ports:
         print("No MIDI input ports found.")
         return
@@ -21,20 +37,28 @@ def main():
     for i, name in enumerate(input_ports):
         print(f"{i}: {name}")
 
-    # Start a thread for each input port
-    threads = []
-    for port in input_ports:
-        thread = threading.Thread(target=log_messages, args=(port,), daemon=True)
-        thread.start()
-        threads.append(thread)
+    if args.capture:
+        log = CaptureLog(args.capture, int(args.max_mb * 1024 * 1024), args.backups)
+    elif args.log:
+        log = JsonlLog(args.log, int(args.max_mb * 1024 * 1024), args.backups)
+    else:
+        log = TextLog()
+    logger = MidiLogger(log, input_ports, ignore_timing=args.ignore_clock)
+    logger.start()
 
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
     print("\nPress Ctrl+C to stop.")
     try:
-        # Keep the main thread alive
-        while True:
+        # Sleep until interrupted; the timeout keeps Ctrl+C responsive
+        while not stopped.wait(0.5):
             pass
     except KeyboardInterrupt:
-        print("\nStopping MIDI logger...")
+        pass
+    print("\nStopping MIDI logger...")
+    logger.stop()
+    print(f"Logged {logger.logged} messages, dropped {sum(logger.dropped)}")
+
 
 if __name__ == "__main__":
     main()
@@ -1,20 +1,31 @@
-from PyQt5.QtCore import QSettings, QThread, pyqtSignal, QMetaObject, Qt
+from PyQt5.QtCore import QSettings, QThread, pyqtSignal, Qt
 
 import sys
 import os
 import time
-import threading
-import mido
-from mido import MidiFile, MidiTrack, Message, bpm2tempo
+from mido import Message
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QPushButton, QVBoxLayout, QHBoxLayout, QLabel,
-    QFileDialog, QTreeView, QFileSystemModel, QSpinBox, QStackedWidget, QProgressBar, QFrame, QListWidget, QGridLayout, QLineEdit
+    QFileDialog, QTreeView, QSpinBox, QStackedWidget, QProgressBar, QFrame, QTableView, QGridLayout, QLineEdit,
+    QCheckBox, QComboBox, QListWidget, QAbstractItemView
 )
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt, QTimer, QStandardPaths
 from PyQt5.QtGui import QPainter, QColor
 # import rtmidih
-import simpleaudio as sa  # For playing .wav files
 from ui.potmeter_widget import Potmeter
+from util.midi_input import MidiInput
+from util.smf_reader import SmfFile
+from util.file_player import FileTimeline
+from util.transport import STATE_COLORS, Transport
+from util.quantize import GRIDS, QuantizeSettings
+from util.sample_engine import SampleEngine
+from util.sample_cache import SampleCache
+from ui.midi_index_model import MidiIndexModel, MidiIndexFilterModel, MidiIndexerThread
+from ui.note_table_model import NoteTableModel, note_columns
+from ui.piano_roll_widget import PianoRollWidget
+from ui.gui_bridge import GuiBridge
+from util.piano_roll import NoteRects
+from util.notes import midi_note_to_name
 
 class StatusLED(QFrame):
     def __init__(self, parent=None):
@@ -32,7 +43,6 @@ class StatusLED(QFrame):
             
 
     def paintEvent(self, event):
-        print("paintEvent called")
         painter = QPainter(self)
         try:
             painter.setRenderHint(QPainter.Antialiasing)
@@ -45,26 +55,69 @@ class StatusLED(QFrame):
 
 
 class MidiLoaderThread(QThread):
-    midi_loaded = pyqtSignal(list)  # Signal to send loaded MIDI messages
+    timeline_loaded = pyqtSignal(object)  # FileTimeline, ready to play
+    notes_loaded = pyqtSignal(object)  # Note-on columns of the file, see note_columns()
+    roll_loaded = pyqtSignal(object)  # NoteRects of the whole file, once loaded
+    load_failed = pyqtSignal(str)
 
-    def __init__(self, file_path):
-        super().__init__()
+    def __init__(self, file_path, parent=None):
+        super().__init__(parent)
         self.file_path = file_path
 
     def run(self):
         try:
-            mid = mido.MidiFile(self.file_path)
-            messages = [msg for msg in mid if not msg.is_meta]
-            self.midi_loaded.emit(messages)
+            # One decode feeds the player, the note list and the piano roll
+            with SmfFile(self.file_path) as smf:
+                events = smf.to_arrays()
+                # Every event resolved to seconds up front, playback starts from this
+                timeline = FileTimeline.from_events(smf, events)
+                if not len(timeline):
+                    self.load_failed.emit("No MIDI events in file")
+                    return
+                self.timeline_loaded.emit(timeline)
+                length = smf.length
+            if self.isInterruptionRequested():
+                return
+            self.notes_loaded.emit(note_columns(events.seconds, events.status, events.data1, events.data2))
+            if self.isInterruptionRequested():
+                return
+            self.roll_loaded.emit(NoteRects.from_events(
+                events.seconds, events.status, events.data1, events.data2, length))
         except Exception as e:
             print(f"Error loading MIDI: {e}")
-            self.midi_loaded.emit([])  # Emit an empty list on error
+            self.load_failed.emit(str(e))
+
+
+class MidiExportThread(QThread):
+    progress = pyqtSignal(int)  # Percent done
+    export_finished = pyqtSignal(str)
+    export_failed = pyqtSignal(str)
+
+    def __init__(self, transport, buffer, path):
+        super().__init__()
+        self.transport = transport
+        self.buffer = buffer
+        self.path = path
+
+    def run(self):
+        try:
+            self.transport.export(self.path, self.buffer,
+                                  progress=lambda total, done: self.progress.emit(done * 100 // max(total, 1)))
+            self.export_finished.emit(self.path)
+        except Exception as e:
+            print(f"Error saving MIDI: {e}")
+            self.export_failed.emit(str(e))
 
 
 class MidiLooperPlayerApp(QWidget):
+    loop_changed = pyqtSignal()  # The loop buffer was swapped, possibly from another thread
+    queue_track_changed = pyqtSignal(int, object)  # Queue row and FileTimeline now playing
+
     def __init__(self):
         super().__init__()
 
+        # Status, LEDs and progress go through here, so any thread may set them
+        self.gui = GuiBridge(parent=self)
         self.setAcceptDrops(True)
         self.led = StatusLED()
         self.status = QLabel("Status: Idle")
@@ -73,17 +126,27 @@ class MidiLooperPlayerApp(QWidget):
         self.resize(800, 600)
         self.setAcceptDrops(True)
 
-        self.outport = mido.open_output()  # Use IAC for macOS global output
-        self.recorded_messages = []
-        self.is_recording = False
-        self.is_playing = False
-        self.is_overdubbing = False
-        self.playing_midi_file = False
-        self.midi_player_messages = []
-        self.midi_player_channel = 0
-        self.looper_channel = 0
+        # Looper and file player; the window only shows its state and forwards clicks
+        self.transport = Transport(  # No port, use IAC for macOS global output
+            on_status=self.set_status,
+            on_state=lambda part, state: self.gui.post((part, "state"), self.show_state, part, state),
+            on_progress=self.set_progress_value,
+            on_loop_changed=self.loop_changed.emit,
+            on_track=self.queue_track_changed.emit)
+        self.midi_player_path = None
+        self.queue_track_changed.connect(self.on_queue_track_changed)
+        self.loader_thread = None
+        self.export_thread = None
         self.settings = QSettings("MyCompany", "MidiLooperApp")
-        self.wav_cache = {}  # Cache for loaded .wav files
+        self.sample_engine = SampleEngine()  # Plays the pad samples
+        # Decoded samples shared between pads, budget in MB from the settings
+        self.sample_cache = SampleCache(int(self.settings.value("sample_cache_mb", 256)) * 1024 * 1024)
+        try:
+            self.sample_engine.start()
+        except Exception as e:
+            print(f"Error opening audio output: {e}")
+        self.pad_input = None
+        self.pad_start_note = 60
         self.button_grid = None
         self.num_buttons = 16  # Default number of buttons
         self.init_ui()
@@ -106,9 +169,16 @@ class MidiLooperPlayerApp(QWidget):
         self.toggle_btn.setCheckable(True)
         self.toggle_btn.clicked.connect(self.toggle_view)
 
+        # Live count of worker threads, doubled threads show up here first
+        self.workers_label = QLabel()
+        self.workers_timer = QTimer(self)
+        self.workers_timer.timeout.connect(self.update_workers_label)
+        self.workers_timer.start(500)
+
         main_layout = QVBoxLayout(self)
         main_layout.addWidget(self.toggle_btn)
         main_layout.addWidget(self.stack)
+        main_layout.addWidget(self.workers_label)
 
     def setup_looper_view(self):
         layout = QVBoxLayout()
@@ -116,59 +186,109 @@ class MidiLooperPlayerApp(QWidget):
         # BPM label and selector in one row
         bpm_layout = QHBoxLayout()
         bpm_label = QLabel("BPM:")
-        self.bpm = 120
         self.bpm_spin = QSpinBox()
         self.bpm_spin.setRange(40, 300)
-        self.bpm_spin.setValue(self.bpm)  # Default BPM
+        self.bpm_spin.setValue(self.transport.bpm)  # Default BPM
         bpm_layout.addWidget(bpm_label)
         bpm_layout.addWidget(self.bpm_spin)
+        self.bpm_spin.valueChanged.connect(self.transport.set_bpm)
+
+        # Quantize is previewed on a copy, the recorded take is kept as is
+        quantize_layout = QHBoxLayout()
+        self.quantize_checkbox = QCheckBox("Quantize")
+        self.quantize_grid_combo = QComboBox()
+        self.quantize_grid_combo.addItems(GRIDS)
+        self.quantize_grid_combo.setCurrentText("1/16")
+        self.quantize_strength_spin = QSpinBox()
+        self.quantize_strength_spin.setRange(0, 100)
+        self.quantize_strength_spin.setValue(100)
+        self.quantize_strength_spin.setPrefix("Strength: ")
+        self.quantize_strength_spin.setSuffix("%")
+        self.quantize_swing_spin = QSpinBox()
+        self.quantize_swing_spin.setRange(0, 50)
+        self.quantize_swing_spin.setPrefix("Swing: ")
+        self.quantize_swing_spin.setSuffix("%")
+        self.quantize_humanize_spin = QSpinBox()
+        self.quantize_humanize_spin.setRange(0, 50)
+        self.quantize_humanize_spin.setPrefix("Humanize: ")
+        self.quantize_humanize_spin.setSuffix(" ms")
+        self.quantize_checkbox.toggled.connect(self.apply_quantize)
+        self.quantize_grid_combo.currentTextChanged.connect(self.apply_quantize)
+        self.quantize_strength_spin.valueChanged.connect(self.apply_quantize)
+        self.quantize_swing_spin.valueChanged.connect(self.apply_quantize)
+        self.quantize_humanize_spin.valueChanged.connect(self.apply_quantize)
+        quantize_layout.addWidget(self.quantize_checkbox)
+        quantize_layout.addWidget(self.quantize_grid_combo)
+        quantize_layout.addWidget(self.quantize_strength_spin)
+        quantize_layout.addWidget(self.quantize_swing_spin)
+        quantize_layout.addWidget(self.quantize_humanize_spin)
 
         self.track_progress = QProgressBar()
 
+        # Notes of the loop, redrawn whenever the loop buffer is swapped
+        self.loop_roll = PianoRollWidget(self.loop_playhead)
+        self.loop_changed.connect(self.update_loop_roll)
+
         # Control buttons with ASCII icons
         controls_layout = QHBoxLayout()
 
         self.play_btn = QPushButton("▶")  # ASCII for Play
         self.play_btn.setToolTip("Play")
-        self.play_btn.clicked.connect(self.play)
+        self.play_btn.clicked.connect(self.transport.play)
         # self.play_btn.clicked.connect(self.play_queue)
 
         self.stop_btn = QPushButton("■")  # ASCII for Stop
         self.stop_btn.setToolTip("Stop")
-        self.stop_btn.clicked.connect(self.stop)
+        self.stop_btn.clicked.connect(self.transport.stop)
 
         self.record_loop_btn = QPushButton("●")  # ASCII for Record
         self.record_loop_btn.setToolTip("Record & Loop")
         # TODO: rework record or record and loop func
-        self.record_loop_btn.clicked.connect(self.record)
-        # self.record_loop_btn.clicked.connect(self.record_and_loop)
+        self.record_loop_btn.clicked.connect(self.transport.record)
+        # self.record_loop_btn.clicked.connect(self.transport.record_and_loop)
 
 
         self.overdub_btn = QPushButton("⟳")  # ASCII for Overdub
         self.overdub_btn.setToolTip("Overdub")
-        self.overdub_btn.clicked.connect(self.overdub)
+        self.overdub_btn.clicked.connect(self.transport.overdub)
+
+        self.undo_btn = QPushButton("↶")  # ASCII for Undo
+        self.undo_btn.setToolTip("Undo last overdub")
+        self.undo_btn.clicked.connect(self.transport.undo_overdub)
 
         # Add buttons to the horizontal layout
         controls_layout.addWidget(self.play_btn)
         controls_layout.addWidget(self.stop_btn)
         controls_layout.addWidget(self.record_loop_btn)
         controls_layout.addWidget(self.overdub_btn)
+        controls_layout.addWidget(self.undo_btn)
 
         # Additional buttons
         self.save_btn = QPushButton("Save")
         self.save_btn.clicked.connect(self.save)
 
         self.panic_btn = QPushButton("Panic (All Notes Off)")
-        self.panic_btn.clicked.connect(self.panic)
+        self.panic_btn.clicked.connect(self.transport.panic)
 
         self.looper_channel_spin = QSpinBox()
         self.looper_channel_spin.setRange(0, 15)
         self.looper_channel_spin.setPrefix("Looper Ch: ")
+        self.looper_channel_spin.valueChanged.connect(self.transport.set_looper_channel)
 
         self.looper_led = QLabel("●")
         self.set_led(self.looper_led, "gray")
 
 
+        # Configurable start note, also the note of the first pad
+        start_note_layout = QHBoxLayout()
+        start_note_label = QLabel("Start Note:")
+        self.start_note_spin = QSpinBox()
+        self.start_note_spin.setRange(0, 127)  # MIDI note range
+        self.start_note_spin.setValue(60)  # Default to C4
+        self.start_note_spin.valueChanged.connect(self.set_pad_start_note)
+        start_note_layout.addWidget(start_note_label)
+        start_note_layout.addWidget(self.start_note_spin)
+
         # Sample button grid
         self.grid_layout = QGridLayout()
         self.update_button_grid()
@@ -183,23 +303,21 @@ class MidiLooperPlayerApp(QWidget):
         self.keyboard_input_btn.setCheckable(True)
         self.keyboard_input_btn.toggled.connect(self.toggle_keyboard_input)
 
-        # Configurable start note
-        start_note_layout = QHBoxLayout()
-        start_note_label = QLabel("Start Note:")
-        self.start_note_spin = QSpinBox()
-        self.start_note_spin.setRange(0, 127)  # MIDI note range
-        self.start_note_spin.setValue(60)  # Default to C4
-        start_note_layout.addWidget(start_note_label)
-        start_note_layout.addWidget(self.start_note_spin)
-
+        # Play the pads from a MIDI controller
+        self.midi_pads_btn = QPushButton("Enable MIDI Pads")
+        self.midi_pads_btn.setCheckable(True)
+        self.midi_pads_btn.toggled.connect(self.toggle_midi_pads)
 
 
         # Add widgets to the main layout
         layout.addWidget(self.led)
         layout.addLayout(bpm_layout)
         layout.addWidget(self.bpm_spin)
+        layout.addLayout(quantize_layout)
         layout.addWidget(self.track_progress)
+        layout.addWidget(self.loop_roll)
         layout.addWidget(self.keyboard_input_btn)
+        layout.addWidget(self.midi_pads_btn)
         layout.addLayout(start_note_layout)
         layout.addLayout(controls_layout)  
         # layout.addWidget(self.record_btn)
@@ -225,20 +343,31 @@ class MidiLooperPlayerApp(QWidget):
 
         self.button_grid = []
         for i in range(self.num_buttons):
-            # Calculate the note name for the button
-            note_number = 60 + i  # Start from MIDI note 60 (C4)
-            note_name = midi_note_to_name(note_number)
-
-            # Create a button with the note name
-            button = QPushButton(note_name)
-            button.clicked.connect(lambda _, b=i: self.assign_sample_to_button(b))
+            # Create a button with the note name, right click to (re)assign
+            button = QPushButton(self.pad_label(i))
+            button.clicked.connect(lambda _, b=i: self.press_pad(b))
+            button.setContextMenuPolicy(Qt.CustomContextMenu)
+            button.customContextMenuRequested.connect(lambda _, b=i: self.assign_sample_to_button(b))
             self.grid_layout.addWidget(button, i // 4, i % 4)  # Arrange in a 4-column grid
             self.button_grid.append(button)
 
+    def pad_label(self, button_index):
+        note_name = midi_note_to_name(self.pad_start_note + button_index)
+        if button_index in self.sample_engine.pads:
+            return f"{note_name} (Sample Assigned)"
+        return note_name
+
+    def set_pad_start_note(self, note):
+        self.pad_start_note = note
+        for i, button in enumerate(self.button_grid):
+            button.setText(self.pad_label(i))
+
     def adjust_button_grid(self):
         """Adjust the number of buttons in the grid."""
         try:
             self.num_buttons = int(self.num_buttons_input.text())
+            for pad in [pad for pad in self.sample_engine.pads if pad >= self.num_buttons]:
+                self.sample_cache.release(self.sample_engine.pads.pop(pad))
             self.update_button_grid()
         except ValueError:
             self.set_status("Invalid number of buttons", "red")
@@ -246,8 +375,11 @@ class MidiLooperPlayerApp(QWidget):
     def assign_wav_to_button(self, button_index, wav_path):
         """Assign a .wav file to a button."""
         try:
-            wave_obj = sa.WWaveObject.from_wave_file(wav_path)
-            self.wav_cache[button_index] = wave_obj
+            sample = self.sample_cache.acquire(wav_path)
+            old = self.sample_engine.pads.get(button_index)
+            self.sample_engine.assign(button_index, sample)
+            if old is not None:
+                self.sample_cache.release(old)
             self.set_status(f"Assigned {wav_path} to Button {button_index + 1}", "green")
         except Exception as e:
             self.set_status(f"Failed to load .wav: {e}", "red")
@@ -258,29 +390,61 @@ class MidiLooperPlayerApp(QWidget):
         if wav_path:
             self.assign_wav_to_button(button_index, wav_path)
             # Update the button text to indicate a sample is assigned
-            note_number = 60 + button_index  # Start from MIDI note 60 (C4)
-            note_name = midi_note_to_name(note_number)
-            self.button_grid[button_index].setText(f"{note_name} (Sample Assigned)")
+            self.button_grid[button_index].setText(self.pad_label(button_index))
+
+    def press_pad(self, button_index):
+        """Play the pad, or pick a sample for it first."""
+        if button_index in self.sample_engine.pads:
+            self.play_assigned_wav(button_index)
+        else:
+            self.assign_sample_to_button(button_index)
 
     def play_assigned_wav(self, button_index):
         """Play the .wav file assigned to a button."""
-        if button_index in self.wav_cache:
-            self.wav_cache[button_index].play()
-        else:
+        if not self.sample_engine.trigger(button_index):
             self.set_status(f"No .wav assigned to Button {button_index + 1}", "red")
 
+    def toggle_midi_pads(self, enabled):
+        if not enabled:
+            if self.pad_input is not None:
+                self.pad_input.close()
+                self.pad_input = None
+            self.midi_pads_btn.setText("Enable MIDI Pads")
+            return
+        # Triggered straight from the rtmidi callback, no GUI round trip
+        pad_input = MidiInput(on_event=self._on_pad_midi)
+        try:
+            pad_input.open()
+        except IOError as e:
+            self.set_status(f"MIDI pads failed: {e}", "red")
+            self.midi_pads_btn.setChecked(False)
+            return
+        self.pad_input = pad_input
+        self.midi_pads_btn.setText("Disable MIDI Pads")
+
+    def _on_pad_midi(self, stamp, data):
+        if len(data) == 3 and data[0] & 0xF0 == 0x90 and data[2] > 0:
+            pad = data[1] - self.pad_start_note
+            if 0 <= pad < self.num_buttons:
+                self.sample_engine.trigger(pad, data[2])
+
     def setup_file_browser_view(self):
         layout = QHBoxLayout()  # Change to QHBoxLayout to place widgets side by side
 
         # Set bpm for file
         file_bpm_layout = QHBoxLayout()
         file_bpm_label = QLabel("BPM:")
-        self.file_bpm = 120
         self.file_bpm_spin = QSpinBox()
-        self.bpm_spin.setRange(40, 300)
-        self.bpm_spin.setValue(self.file_bpm)  # Default BPM
+        self.file_bpm_spin.setRange(20, 300)
+        self.file_bpm_spin.setValue(self.transport.file_bpm)
+        self.file_bpm_spin.valueChanged.connect(self.transport.set_file_bpm)
+        self.file_bar_spin = QSpinBox()
+        self.file_bar_spin.setRange(1, 1)
+        self.file_bar_spin.setPrefix("Bar: ")
+        self.file_bar_spin.editingFinished.connect(self.seek_file_bar)
         file_bpm_layout.addWidget(file_bpm_label)
         file_bpm_layout.addWidget(self.file_bpm_spin)
+        file_bpm_layout.addWidget(self.file_bar_spin)
 
         # Left side: File browser
         file_browser_layout = QVBoxLayout()
@@ -289,18 +453,50 @@ class MidiLooperPlayerApp(QWidget):
         self.add_folder_btn.clicked.connect(self.add_folder)
 
         self.tree = QTreeView()
-        self.model = QFileSystemModel()
+        self.model = MidiIndexModel()
         self.model.setNameFilters(["*.mid", "*.midi"])
         self.model.setNameFilterDisables(False)
-        self.tree.setModel(self.model)
+        self.tree_proxy = MidiIndexFilterModel()
+        self.tree_proxy.setSourceModel(self.model)
+        self.tree.setModel(self.tree_proxy)
+        self.tree.setSortingEnabled(True)
+        self.tree.sortByColumn(0, Qt.AscendingOrder)
         self.tree.clicked.connect(self.play_selected_midi)
 
+        # Background metadata index for the extra tree columns
+        index_dir = QStandardPaths.writableLocation(QStandardPaths.GenericDataLocation)
+        self.indexer = MidiIndexerThread(os.path.join(index_dir, "MidiLooperApp", "midi_index.sqlite"))
+        self.indexer.index_loaded.connect(self.model.set_records)
+        self.indexer.file_indexed.connect(self.model.update_record)
+        self.model.index_requested.connect(self.indexer.request)
+        self.indexer.start()
+
+        # Filter by name and BPM range
+        filter_layout = QHBoxLayout()
+        self.name_filter_input = QLineEdit()
+        self.name_filter_input.setPlaceholderText("Filter by name")
+        self.name_filter_input.textChanged.connect(self.tree_proxy.set_name_filter)
+        self.bpm_min_spin = QSpinBox()
+        self.bpm_min_spin.setRange(0, 300)
+        self.bpm_min_spin.setPrefix("BPM from: ")
+        self.bpm_min_spin.setSpecialValueText("BPM from: any")
+        self.bpm_max_spin = QSpinBox()
+        self.bpm_max_spin.setRange(0, 300)
+        self.bpm_max_spin.setPrefix("to: ")
+        self.bpm_max_spin.setSpecialValueText("to: any")
+        self.bpm_min_spin.valueChanged.connect(self.update_bpm_filter)
+        self.bpm_max_spin.valueChanged.connect(self.update_bpm_filter)
+        filter_layout.addWidget(self.name_filter_input)
+        filter_layout.addWidget(self.bpm_min_spin)
+        filter_layout.addWidget(self.bpm_max_spin)
+
         self.player_channel_spin = QSpinBox()
         self.player_channel_spin.setRange(0, 15)
         self.player_channel_spin.setPrefix("Player Ch: ")
+        self.player_channel_spin.valueChanged.connect(self.transport.set_player_channel)
 
         self.player_stop_btn = QPushButton("Stop MIDI File")
-        self.player_stop_btn.clicked.connect(self.stop_midi_file)
+        self.player_stop_btn.clicked.connect(self.transport.stop_file)
 
         self.player_progress = QProgressBar()
 
@@ -313,36 +509,90 @@ class MidiLooperPlayerApp(QWidget):
         self.potmeter.valueChanged.connect(self.update_potmeter_label)
 
         file_browser_layout.addWidget(self.add_folder_btn)
+        file_browser_layout.addLayout(filter_layout)
         file_browser_layout.addWidget(self.tree)
         file_browser_layout.addWidget(self.player_channel_spin)
         file_browser_layout.addWidget(self.player_progress)
         file_browser_layout.addWidget(self.player_stop_btn)
         file_browser_layout.addWidget(self.player_led)
         file_browser_layout.addLayout(file_bpm_layout)
-        file_browser_layout.addWidget(self.file_bpm_spin)
         # file_browser_layout.addWidget(self.potmeter)
 
-        # Right side: Note list
-        self.note_list = QListWidget()
+        # Play queue, files follow each other without a gap
+        queue_layout = QHBoxLayout()
+        self.add_to_queue_btn = QPushButton("Add to Queue")
+        self.add_to_queue_btn.clicked.connect(self.add_to_queue)
+        self.play_queue_btn = QPushButton("Play Queue")
+        self.play_queue_btn.clicked.connect(lambda: self.play_queue())
+        self.next_in_queue_btn = QPushButton("Next")
+        self.next_in_queue_btn.clicked.connect(self.play_next_in_queue)
+        self.clear_queue_btn = QPushButton("Clear Queue")
+        self.clear_queue_btn.clicked.connect(self.clear_queue)
+        self.crossfade_spin = QSpinBox()
+        self.crossfade_spin.setRange(0, 10000)
+        self.crossfade_spin.setSingleStep(250)
+        self.crossfade_spin.setPrefix("Crossfade: ")
+        self.crossfade_spin.setSuffix(" ms")
+        queue_layout.addWidget(self.add_to_queue_btn)
+        queue_layout.addWidget(self.play_queue_btn)
+        queue_layout.addWidget(self.next_in_queue_btn)
+        queue_layout.addWidget(self.clear_queue_btn)
+        queue_layout.addWidget(self.crossfade_spin)
+        self.midi_queue = QListWidget()
+        self.midi_queue.setDragDropMode(QAbstractItemView.InternalMove)
+        self.midi_queue.itemDoubleClicked.connect(lambda item: self.play_queue(self.midi_queue.row(item)))
+        file_browser_layout.addLayout(queue_layout)
+        file_browser_layout.addWidget(self.midi_queue)
+
+        # Right side: Note list, rows are formatted lazily by the model
+        self.note_model = NoteTableModel()
+        self.note_table = QTableView()
+        self.note_table.setModel(self.note_model)
+        self.note_table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)  # File order until sorted
+        self.note_table.setSortingEnabled(True)
+        self.note_table.verticalHeader().setVisible(False)
+        self.note_table.verticalHeader().setDefaultSectionSize(20)
+
+        note_filter_layout = QHBoxLayout()
+        self.note_filter_spin = QSpinBox()
+        self.note_filter_spin.setRange(-1, 127)
+        self.note_filter_spin.setValue(-1)
+        self.note_filter_spin.setPrefix("Note: ")
+        self.note_filter_spin.setSpecialValueText("Note: any")
+        self.channel_filter_spin = QSpinBox()
+        self.channel_filter_spin.setRange(-1, 15)
+        self.channel_filter_spin.setValue(-1)
+        self.channel_filter_spin.setPrefix("Ch: ")
+        self.channel_filter_spin.setSpecialValueText("Ch: any")
+        self.note_filter_spin.valueChanged.connect(self.update_note_filter)
+        self.channel_filter_spin.valueChanged.connect(self.update_note_filter)
+        note_filter_layout.addWidget(self.note_filter_spin)
+        note_filter_layout.addWidget(self.channel_filter_spin)
+
+        note_layout = QVBoxLayout()
+        note_layout.addLayout(note_filter_layout)
+        note_layout.addWidget(self.note_table)
+        self.file_roll = PianoRollWidget(self.file_playhead)
+        note_layout.addWidget(self.file_roll)
 
         # Add both layouts to the main layout
         layout.addLayout(file_browser_layout)
-        layout.addWidget(self.note_list)
+        layout.addLayout(note_layout)
         
         self.file_browser_view.setLayout(layout)
 
         last_folder = self.settings.value("lastMidiFolder")
         if last_folder and os.path.isdir(last_folder):
-            self.model.setRootPath(last_folder)
-            self.tree.setRootIndex(self.model.index(last_folder))
+            self.set_browser_folder(last_folder)
 
     def update_potmeter_label(self, value):
         self.potmeter_label.setText(f"Parameter: {value}")
 
     def set_status(self, text, color=None):
-        self.status.setText(f"Status: {text}")
+        """Show a status message, from any thread; the latest one per frame wins."""
+        self.gui.post("status", self.status.setText, f"Status: {text}")
         if color:
-            self.led.set_color(color)
+            self.gui.post("led", self.led.set_color, color)
 
     def update_progress(self):
         if self.recording or self.playing or self.overdubbing:
@@ -350,6 +600,10 @@ class MidiLooperPlayerApp(QWidget):
             progress_value = int((elapsed % 10) * 100)  # wrap every 10s
             self.track_bar.setValue(progress_value)
 
+    def update_workers_label(self):
+        self.workers_label.setText(f"Workers: {len(self.transport.workers)}")
+        self.workers_label.setToolTip("\n".join(f"{name.capitalize()}: {summary}" for name, summary in self.transport.stats().items()))
+
     def toggle_view(self):
         if self.toggle_btn.isChecked():
             self.toggle_btn.setText("Switch to Looper")
@@ -358,262 +612,219 @@ class MidiLooperPlayerApp(QWidget):
             self.toggle_btn.setText("Switch to File Browser")
             self.stack.setCurrentWidget(self.looper_view)
 
-    def record(self):
-        self.recorded_messages.clear()
-        self.is_recording = True
-        self.set_led(self.looper_led, "red")
-        self.set_status("Pre-counting...", "gray")
-        threading.Thread(target=self._record_thread).start()
-
-    def record_and_loop(self):
-        self.record()
-        threading.Thread(target=self._auto_stop_and_play).start()
-
-    def _auto_stop_and_play(self):
-        time.sleep(4 * 60 / self.bpm_spin.value())  # one bar pre-count
-        self.is_recording = False
-        self.set_led(self.looper_led, "green")
-        self.set_status("Pre-counting...", "gray")
-        self.play()
-
-    def play_pre_count(self):
-        beat_interval = 60 / self.bpm
-        for _ in range(4):  # 4 beat count-in
-            # QSound.play("/usr/share/sounds/freedesktop/stereo/complete.oga")  # adjust path for your system
-            # update status led with the count
-            self.set_status(f"{_+1}", "gray")
-            time.sleep(beat_interval)
-
-    def _record_thread(self):
-        self.play_pre_count()
-        start = time.time()
-        self.set_status("Recording...", "red")
-        with mido.open_input() as inport:
-            while self.is_recording:
-                for msg in inport.iter_pending():
-                    msg.time = time.time() - start
-                    self.recorded_messages.append(msg)
-
-    def play(self):
-        if not self.recorded_messages:
-            self.set_status("Nothing to play", "gray")
-            return
-        self.is_playing = True
-        self.set_led(self.looper_led, "green")
-        self.set_status("Looping playback...", "green")
-        self.loop_start_time = time.time()
-        self.timer.start(100)
-        threading.Thread(target=self._loop_play).start()
-
-    def _loop_play(self):
-        while self.is_playing:
-            start = time.time()
-            for msg in self.recorded_messages:
-                if not self.is_playing:
-                    return
-                time.sleep(max(0, msg.time - (time.time() - start)))
-                msg.channel = self.looper_channel_spin.value()
-                self.outport.send(msg)
+    def show_state(self, part, state):
+        """Follow a looper or player state change of the transport, on the GUI thread."""
+        if part == "looper":
+            self.set_led(self.looper_led, STATE_COLORS[state])
+            if state in ("playing", "overdubbing"):
+                if not self.timer.isActive():
+                    self.timer.start(100)
+                    self.loop_roll.start()
+            elif state == "stopped":
+                self.timer.stop()
+                self.loop_roll.stop()
+                self.track_progress.setValue(0)
+        else:
+            self.set_led(self.player_led, STATE_COLORS[state])
+            if state == "playing":
+                self.file_roll.start()
+            else:
+                self.file_roll.stop()
+
+    def update_loop_roll(self):
+        rects = NoteRects.from_buffer(self.transport.loop_buffer)
+        first = self.loop_roll.rects is None or not len(self.loop_roll.rects)
+        self.loop_roll.set_notes(rects)
+        if first:
+            self.loop_roll.zoom_to_fit()
+
+    def loop_playhead(self):
+        return self.transport.loop_position()
+
+    def quantize_settings(self):
+        return QuantizeSettings(
+            grid=GRIDS[self.quantize_grid_combo.currentText()],
+            strength=self.quantize_strength_spin.value() / 100,
+            swing=self.quantize_swing_spin.value() / 100,
+            humanize_ms=self.quantize_humanize_spin.value())
+
+    def apply_quantize(self):
+        """Play a quantized copy of the take, or the take itself when unticked."""
+        self.transport.set_quantize(self.quantize_settings() if self.quantize_checkbox.isChecked() else None)
 
     def update_progress(self):
-        if not self.is_playing or not self.recorded_messages:
+        if not self.transport.is_playing or not self.transport.loop_buffer:
             self.track_progress.setValue(0)
             return
-        duration = self.recorded_messages[-1].time
-        elapsed = (time.time() - self.loop_start_time) % duration
-        percent = int((elapsed / duration) * 100)
+        percent = int(self.transport.loop_scheduler.position() * 100)
         self.track_progress.setValue(percent)
 
-    def stop(self):
-        self.is_recording = False
-        self.is_playing = False
-        self.is_overdubbing = False
-        self.timer.stop()
-        # self.panic()
-        self.track_progress.setValue(0)
-        self.set_led(self.looper_led, "gray")
-        self.set_status("Stop", "gray")
-        self.set_led(self.player_led, "gray")
-
     def save(self):
-        if not self.recorded_messages:
-            self.status.setText("Status: Nothing to save")
+        if not self.transport.loop_buffer:
+            self.set_status("Nothing to save")
+            return
+
+        if self.export_thread is not None and self.export_thread.isRunning():
+            self.set_status("Still saving")
             return
 
         path, _ = QFileDialog.getSaveFileName(self, "Save MIDI", "", "MIDI files (*.mid)")
         if path:
-            mid = MidiFile()
-            track = MidiTrack()
-            mid.tracks.append(track)
-
-            prev_time = 0
-            for msg in self.recorded_messages:
-                delta = int((msg.time - prev_time) * mido.second2tick(1, ticks_per_beat=480, tempo=bpm2tempo(self.bpm)))
-                prev_time = msg.time
-                msg.time = delta
-                track.append(msg)
-
-            mid.save(path)
-            self.status.setText(f"Status: Saved to {path}")
-
-    def overdub(self):
-        self.is_overdubbing = True
-        self.set_led(self.looper_led, "yellow")
-
-    def panic(self):
-        for ch in range(16):
-            self.outport.send(Message('control_change', control=123, value=0, channel=ch))
+            # Copy the columns now; the loop can keep playing or recording meanwhile
+            buffer = self.transport.loop_buffer.snapshot()
+            self.export_thread = MidiExportThread(self.transport, buffer, path)
+            self.export_thread.progress.connect(lambda percent: self.set_status(f"Saving {percent}%"))
+            self.export_thread.export_finished.connect(lambda path: self.set_status(f"Saved to {path}"))
+            self.export_thread.export_failed.connect(lambda error: self.set_status(f"Save failed: {error}"))
+            self.save_btn.setEnabled(False)
+            self.export_thread.finished.connect(lambda: self.save_btn.setEnabled(True))
+            self.export_thread.start()
 
     def add_folder(self):
         folder = QFileDialog.getExistingDirectory(self, "Select MIDI Folder")
         if folder:
             self.settings.setValue("lastMidiFolder", folder)  # Save path
-            self.model.setRootPath(folder)
-            self.tree.setRootIndex(self.model.index(folder))
+            self.set_browser_folder(folder)
+
+    def set_browser_folder(self, folder):
+        self.model.setRootPath(folder)
+        self.tree.setRootIndex(self.tree_proxy.mapFromSource(self.model.index(folder)))
+        self.indexer.scan(folder)
+
+    def update_bpm_filter(self):
+        self.tree_proxy.set_bpm_range(self.bpm_min_spin.value(), self.bpm_max_spin.value())
 
 
     def play_selected_midi(self, index):
-        file_path = self.model.filePath(index)
+        file_path = self.model.filePath(self.tree_proxy.mapToSource(index))
         if os.path.isfile(file_path):
             self.load_and_play_midi(file_path)
 
     def load_and_play_midi(self, file_path):
+        """Load a file into the note list and piano roll, and play it."""
         # Stop the currently playing MIDI file, if any
-        self.stop_midi_file()
-
-        # Set status and clear the note list
+        self.transport.stop_file()
         self.set_status("Loading MIDI file...", "gray")
-        self.note_list.clear()
 
-        # Create and start the loader thread
-        self.loader_thread = MidiLoaderThread(file_path)
-        self.loader_thread.midi_loaded.connect(self.on_midi_loaded)
+        # Clear the note list
+        self.note_model.clear()
+        self.file_roll.set_notes(None)
+
+        # Create and start the loader thread, dropping any load still running
+        if self.loader_thread is not None:
+            self.loader_thread.requestInterruption()
+        self.midi_player_path = file_path
+        # Owned by the window, so a replaced loader may finish on its own
+        self.loader_thread = MidiLoaderThread(file_path, self)
+        self.loader_thread.finished.connect(self.on_loader_finished)
+        self.loader_thread.timeline_loaded.connect(self.on_timeline_loaded)
+        self.loader_thread.notes_loaded.connect(self.on_notes_loaded)
+        self.loader_thread.roll_loaded.connect(self.on_roll_loaded)
+        self.loader_thread.load_failed.connect(self.on_midi_load_failed)
         self.loader_thread.start()
 
-    def on_midi_loaded(self, messages):
-        self.midi_player_messages = messages
-        if not messages:
-            self.set_status("Failed to load MIDI file", "red")
+    def on_loader_finished(self):
+        loader = self.sender()
+        if loader is self.loader_thread:
+            self.loader_thread = None
+        loader.deleteLater()
+
+    def on_timeline_loaded(self, timeline):
+        if self.sender() is not self.loader_thread:
+            return  # Late result from a previous file
+
+        # The note list and piano roll keep loading while it plays
+        if self.transport.play_file(timeline):
+            self.show_file_timeline(timeline)
+
+    def show_file_timeline(self, timeline):
+        """Point the BPM and bar spins at a newly playing file."""
+        self.file_bpm_spin.blockSignals(True)
+        self.file_bpm_spin.setValue(round(self.transport.file_bpm * self.transport.file_player.speed))
+        self.file_bpm_spin.blockSignals(False)
+        self.file_bar_spin.setRange(1, max(timeline.bar_count, 1))
+        self.file_bar_spin.setValue(1)
+
+    def seek_file_bar(self):
+        self.transport.seek_bar(self.file_bar_spin.value() - 1)
+
+    def on_notes_loaded(self, columns):
+        if self.sender() is self.loader_thread:
+            self.note_model.append_notes(columns)
+
+    def on_roll_loaded(self, rects):
+        if self.sender() is self.loader_thread:
+            self.file_roll.set_notes(rects)
+
+    def file_playhead(self):
+        return self.transport.file_position()
+
+    def update_note_filter(self):
+        note = self.note_filter_spin.value()
+        channel = self.channel_filter_spin.value()
+        self.note_model.set_filter(None if note < 0 else note, None if channel < 0 else channel)
+
+    def on_midi_load_failed(self, error):
+        if self.sender() is not self.loader_thread:
             return
-
-        self.playing_midi_file = True
-        self.set_led(self.player_led, "green")
-        self.set_status("MIDI file loaded", "green")
-
-        # Populate the note list
-        self.panic()
-        self.note_list.clear()
-        for msg in self.midi_player_messages:
-            if msg.type == 'note_on':
-                self.note_list.addItem(f"Note: {msg.note}, Velocity: {msg.velocity}, Time: {msg.time}")
-
-        # Start playback in a separate thread
-        threading.Thread(target=self._loop_play_midi_file).start()
-
-    def _loop_play_midi_file(self):
-        """Play the loaded MIDI file and update the progress bar."""
-        if not self.midi_player_messages:
-            return
-
-        # Calculate the total duration of the MIDI file in seconds
-        ticks_per_beat = self.midi_player_messages[0].ticks_per_beat if hasattr(self.midi_player_messages[0], 'ticks_per_beat') else 480
-        tempo = bpm2tempo(self.bpm_spin.value())  # Convert BPM to microseconds per beat
-        total_ticks = sum(msg.time for msg in self.midi_player_messages)
-        total_duration = mido.tick2second(total_ticks, ticks_per_beat, tempo)
-
-        # start_time = time.time()
-        # elapsed_time = 0
-
-        # while self.playing_midi_file:
-        #     start_time = time.time()
-        #     elapsed_time = 0
-        #     for msg in self.midi_player_messages:
-        #         if not self.playing_midi_file:
-        #             break
-
-        #         # Calculate the time to wait for the next message
-        #         wait_time = mido.tick2second(msg.time, ticks_per_beat, tempo)
-        #         time.sleep(wait_time)
-
-        #         # Send the MIDI message
-        #         msg.channel = self.player_channel_spin.value()
-        #         self.outport.send(msg)
-
-        #         # Update the progress bar
-        #         elapsed_time = time.time() - start_time
-        #         progress = int((elapsed_time / total_duration) * 100)
-        #         self.set_progress_value(progress)
-
-        #     # Reset the progress bar when playback is complete
-        #     self.set_progress_value(0)
-        while self.playing_midi_file:
-            start = time.time()
-            for msg in self.midi_player_messages:
-                if not self.playing_midi_file:
-                    return
-                time.sleep(max(0, msg.time - (time.time() - start)))
-                msg.channel = self.player_channel_spin.value()
-                self.outport.send(msg)
-            self.set_progress_value(100)
-            time.sleep(0.1)
-            self.set_progress_value(0)
-
-    def stop_midi_file(self):
-        self.playing_midi_file = False
-        self.panic()
-        self.set_progress_value(0)
-        self.set_led(self.player_led, "gray")
+        self.transport.stop_file()
+        self.set_status(f"Failed to load MIDI file: {error}", "red")
 
     def set_led(self, label, color):
-        try:
-            label.setStyleSheet(f"color: {color}; font-size: 24px")
-        except Exception as e:
-                print(f"Error setting set_led: {e}")
+        """Colour one of the ● labels, from any thread."""
+        self.gui.post((label, "led"), label.setStyleSheet, f"color: {color}; font-size: 24px")
 
     def dragEnterEvent(self, event):
         if event.mimeData().hasUrls():
             event.acceptProposedAction()
 
     def dropEvent(self, event):
-        for url in event.mimeData().urls():
-            file_path = url.toLocalFile()
-            if file_path.lower().endswith(('.mid', '.midi')):
-                self.load_and_play_midi(file_path)
-    def play_queue(self):
-        if self.midi_queue.count() == 0:
-            self.set_status("No MIDI files in the queue", "red")
-            return
-
-        self.current_queue_index = 0
-        self.play_next_in_queue()
-
-    def play_next_in_queue(self):
-        if self.current_queue_index >= self.midi_queue.count():
-            self.current_queue_index = 0  # Loop back to the first file
+        paths = [url.toLocalFile() for url in event.mimeData().urls()
+                 if url.toLocalFile().lower().endswith(('.mid', '.midi'))]
+        if len(paths) == 1:
+            self.load_and_play_midi(paths[0])
+        else:
+            # Several files at once go to the queue
+            self.midi_queue.addItems(paths)
 
-        file_path = self.midi_queue.item(self.current_queue_index).text()
-        self.current_queue_index += 1
+    def add_to_queue(self):
+        for index in self.tree.selectionModel().selectedRows():
+            file_path = self.model.filePath(self.tree_proxy.mapToSource(index))
+            if os.path.isfile(file_path):
+                self.midi_queue.addItem(file_path)
 
-        self.load_and_play_midi(file_path)
+    def clear_queue(self):
+        self.midi_queue.clear()
 
-        # Start a thread to monitor when the current file finishes
-        threading.Thread(target=self._monitor_playback).start()
+    def play_queue(self, index=0):
+        paths = [self.midi_queue.item(row).text() for row in range(self.midi_queue.count())]
+        self.transport.play_queue(paths, index, self.crossfade_spin.value() / 1000)
 
-    def _monitor_playback(self):
-        while self.playing_midi_file:
-            time.sleep(0.1)  # Check every 100ms
+    def play_next_in_queue(self):
+        if not self.transport.next_in_queue():
+            self.play_queue()
 
-        # When the current file finishes, play the next one
-        self.play_next_in_queue()
+    def on_queue_track_changed(self, index, timeline):
+        if not self.transport.playing_file or index >= self.midi_queue.count():
+            return
+        self.midi_queue.setCurrentRow(index)
+        self.midi_player_path = self.midi_queue.item(index).text()
+        self.show_file_timeline(timeline)
+        self.show_file_notes(timeline)
+
+    def show_file_notes(self, timeline):
+        """Fill the note list and piano roll from a timeline the queue already loaded."""
+        if self.loader_thread is not None:
+            self.loader_thread.requestInterruption()
+            self.loader_thread = None  # Anything it still emits is ignored
+        status, data1, data2 = timeline.message_columns()
+        self.note_model.clear()
+        self.note_model.append_notes(note_columns(timeline.seconds, status, data1, data2))
+        self.file_roll.set_notes(NoteRects.from_events(timeline.seconds, status, data1, data2, timeline.length))
 
     def set_progress_value(self, value):
-        """Thread-safe method to update the progress bar."""
-        return;
-        try:
-            QMetaObject.invokeMethod(self.player_progress, "setValue", Qt.QueuedConnection, value)
-            # self.player_progress.setValue(value)
-        except Exception as e:
-                print(f"Error set_progress_value: {e}")
+        """Update the file progress bar, from any thread."""
+        self.gui.post("player_progress", self.player_progress.setValue, value)
 
     def keyPressEvent(self, event):
         if not self.keyboard_input_btn.isChecked():
@@ -624,7 +835,8 @@ class MidiLooperPlayerApp(QWidget):
         if note is not None and note not in self.active_notes:
             print(f"Key pressed: {key}, mapped to note: {note}")
             self.active_notes.add(note)
-            self.outport.send(Message('note_on', note=note, velocity=64))
+            self.transport.send(Message('note_on', note=note, velocity=64).bytes())
+            self.sample_engine.trigger(note - self.pad_start_note)
 
     def keyReleaseEvent(self, event):
         if not self.keyboard_input_btn.isChecked():
@@ -634,7 +846,7 @@ class MidiLooperPlayerApp(QWidget):
         note = self.map_key_to_midi(key)
         if note is not None and note in self.active_notes:
             self.active_notes.remove(note)
-            self.outport.send(Message('note_off', note=note, velocity=64))
+            self.transport.send(Message('note_off', note=note, velocity=64).bytes())
 
     def map_key_to_midi(self, key):
         """Map keyboard keys to MIDI notes."""
@@ -659,6 +871,15 @@ class MidiLooperPlayerApp(QWidget):
             return start_note + key_map[key]
         return None
 
+    def closeEvent(self, event):
+        if self.pad_input is not None:
+            self.pad_input.close()
+        self.sample_engine.stop()
+        self.transport.close()
+        self.indexer.stop()
+        self.indexer.wait(2000)
+        super().closeEvent(event)
+
     def toggle_keyboard_input(self, enabled):
         if enabled:
             self.keyboard_input_btn.setText("Disable Keyboard Input")
@@ -667,13 +888,6 @@ class MidiLooperPlayerApp(QWidget):
             self.keyboard_input_btn.setText("Enable Keyboard Input")
             self.set_status("Keyboard input disabled", "gray")
 
-def midi_note_to_name(note_number):
-    """Convert MIDI note number to note name."""
-    note_names = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
-    octave = (note_number // 12) - 1
-    note = note_names[note_number % 12]
-    return f"{note}{octave}"
-
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = MidiLooperPlayerApp()
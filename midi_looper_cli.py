@@ -0,0 +1,155 @@
+"""Run the looper and file player without a window.
+
+Same engine as midi_looper.py, driven by commands on stdin, one per
+line, so it runs on a headless box, over ssh or from a script. PyQt5 is
+never imported, which also makes it start much faster. Without a
+terminal (e.g. as a service) it keeps playing until SIGTERM.
+
+    python3 midi_looper_cli.py --port "IAC Driver Bus 1"
+    python3 midi_looper_cli.py --load song.mid
+    python3 midi_looper_cli.py --queue a.mid b.mid c.mid --crossfade 2
+
+Commands:
+    record | loop          record after a one bar count-in; loop stops after one bar and plays it
+    play | stop            loop the take / stop the looper
+    overdub | undo         toggle overdubbing / remove the last overdub layer
+    quantize GRID [STRENGTH% [SWING%]] | quantize off
+    bpm N | channel N      looper tempo and output channel
+    save PATH              write the loop as a MIDI file
+    load PATH              play a file in a loop
+    queue PATH... | next   play files back to back / skip to the next one
+    file-stop | file-bpm N | bar N | file-channel N
+    panic | status | quit
+"""
+import argparse
+import shlex
+import signal
+import sys
+import threading
+
+from util.quantize import GRIDS, QuantizeSettings
+from util.transport import Transport
+
+
+def quantize(transport, grid, strength="100", swing="0"):
+    if grid == "off":
+        transport.set_quantize(None)
+        return
+    if grid not in GRIDS:
+        print(f"Unknown grid {grid}, one of {', '.join(GRIDS)}")
+        return
+    transport.set_quantize(QuantizeSettings(GRIDS[grid], float(strength) / 100, float(swing) / 100))
+
+
+def save(transport, path):
+    if not transport.loop_buffer:
+        print("Nothing to save")
+        return
+    print(f"Saved to {transport.export(path)}")
+
+
+def status(transport):
+    buffer = transport.loop_buffer
+    looper = ("recording" if transport.is_recording else "overdubbing" if transport.is_overdubbing
+              else "playing" if transport.is_playing else "stopped")
+    print(f"Looper: {looper}, {transport.bpm} BPM, {len(buffer)} events, {buffer.duration:.2f} s, "
+          f"{buffer.layer_count} layers")
+    position = transport.file_position()
+    if position is not None:
+        paths = transport.playlist.paths
+        queue = f", queue {transport.playlist.current + 1}/{len(paths)}" if transport.playlist.playing else ""
+        print(f"Player: {position:.1f} s at {round(transport.file_bpm * transport.file_player.speed)} BPM{queue}")
+    else:
+        print("Player: stopped")
+    for name, summary in transport.stats().items():
+        print(f"{name.capitalize()}: {summary}")
+
+
+COMMANDS = {
+    'record': lambda t: t.record(),
+    'loop': lambda t: t.record_and_loop(),
+    'play': lambda t: t.play(),
+    'stop': lambda t: t.stop(),
+    'overdub': lambda t: t.overdub(),
+    'undo': lambda t: t.undo_overdub(),
+    'quantize': quantize,
+    'bpm': lambda t, bpm: t.set_bpm(int(bpm)),
+    'channel': lambda t, channel: t.set_looper_channel(int(channel)),
+    'save': save,
+    'load': lambda t, path: t.load_file(path),
+    'queue': lambda t, *paths: t.play_queue(list(paths)),
+    'next': lambda t: t.next_in_queue() or print("No queue playing"),
+    'file-stop': lambda t: t.stop_file(),
+    'file-bpm': lambda t, bpm: t.set_file_bpm(int(bpm)),
+    'bar': lambda t, bar: t.seek_bar(int(bar) - 1),
+    'file-channel': lambda t, channel: t.set_player_channel(int(channel)),
+    'panic': lambda t: t.panic(),
+    'status': status,
+}
+
+
+def read_commands(transport, stopped):
+    """Run commands from stdin until quit; end of input only quits on a terminal."""
+    for line in sys.stdin:
+        try:
+            words = shlex.split(line)
+        except ValueError as e:
+            print(f"Error: {e}")
+            continue
+        if not words:
+            continue
+        name, args = words[0].lower(), words[1:]
+        if name in ('quit', 'exit'):
+            stopped.set()
+            return
+        command = COMMANDS.get(name)
+        if command is None:
+            print(f"Unknown command {name}, one of {', '.join(COMMANDS)}, quit")
+            continue
+        try:
+            command(transport, *args)
+        except Exception as e:
+            print(f"Error in {name}: {e}")
+    if sys.stdin.isatty():
+        stopped.set()  # Ctrl+D
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', help="Output port, default the first one")
+    parser.add_argument('--bpm', type=int, default=120, help="Looper tempo")
+    parser.add_argument('--channel', type=int, default=0, help="Looper output channel, 0-15")
+    parser.add_argument('--player-channel', type=int, default=0, help="File player output channel, 0-15")
+    parser.add_argument('--load', help="Play this file in a loop")
+    parser.add_argument('--queue', nargs='+', help="Play these files back to back")
+    parser.add_argument('--crossfade', type=float, default=0.0, help="Fade between queued files over this many seconds")
+    args = parser.parse_args()
+
+    transport = Transport(args.port, args.bpm,
+                          on_status=lambda text, color: print(f"Status: {text}"),
+                          on_state=lambda part, state: print(f"{part.capitalize()}: {state}"))
+    transport.set_looper_channel(args.channel)
+    transport.set_player_channel(args.player_channel)
+    if args.queue:
+        transport.play_queue(args.queue, crossfade=args.crossfade)
+    elif args.load:
+        transport.load_file(args.load)
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    threading.Thread(target=read_commands, args=(transport, stopped), daemon=True).start()
+    print("Type a command, or quit. Ctrl+C stops too.")
+    try:
+        # Sleep until interrupted; the timeout keeps Ctrl+C responsive
+        while not stopped.wait(0.5):
+            pass
+    except KeyboardInterrupt:
+        pass
+    print("\nStopping looper...")
+    transport.close()
+    transport.panic()
+    transport.output.close()
+
+
+if __name__ == "__main__":
+    main()
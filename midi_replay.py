@@ -0,0 +1,57 @@
+"""Replay a capture written by midi_log.py --capture.
+
+Every recorded port goes to one output port, at the original speed or
+scaled with --speed. --start seeks straight to a point in the capture.
+
+    python3 midi_replay.py rehearsal.mcap --info
+    python3 midi_replay.py rehearsal.mcap --start 3600 --speed 2
+"""
+import argparse
+
+import mido
+
+from util.capture import CaptureReader, replay
+from util.midi_output import get_output_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('capture', help="Capture file")
+    parser.add_argument('--port', help="Output port, default the first one")
+    parser.add_argument('--speed', type=float, default=1.0, help="Playback speed factor")
+    parser.add_argument('--start', type=float, default=0.0, help="Start at this many seconds")
+    parser.add_argument('--only', type=int, action='append', help="Only replay this recorded port id (repeatable)")
+    parser.add_argument('--info', action='store_true', help="Print the recorded ports and length, then exit")
+    args = parser.parse_args()
+
+    with CaptureReader(args.capture) as reader:
+        if args.info:
+            print(f"{reader.records} records, {reader.duration_ns / 1e9:.1f} s")
+            for i, name in enumerate(reader.ports):
+                print(f"{i}: {name}")
+            return
+        if args.speed <= 0:
+            parser.error("--speed must be positive")
+
+        port_name = args.port or (mido.get_output_names() or [None])[0]
+        if port_name is None:
+            print("No MIDI output ports found.")
+            return
+        output = get_output_service()
+        output.open(port_name)
+
+        def send(port, data):
+            if args.only is None or port in args.only:
+                output.send(data, port_name)
+
+        print(f"Replaying {args.capture} to {port_name}, Ctrl+C to stop")
+        try:
+            replay(reader, send, args.speed, int(args.start * 1e9))
+        except KeyboardInterrupt:
+            pass
+        output.panic(port_name)
+        output.close()
+
+
+if __name__ == "__main__":
+    main()
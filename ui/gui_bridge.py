@@ -0,0 +1,43 @@
+from PyQt5.QtCore import QObject, QTimer
+
+FRAME_MS = 16  # Drain at display rate, about 60 Hz
+
+
+class GuiBridge(QObject):
+    """Mailbox for widget updates from any thread, applied on the GUI thread.
+
+    post(key, apply, *args) stores the update under key, replacing any
+    update for that key that has not been applied yet, so a worker
+    posting progress thousands of times a second costs one setValue per
+    frame. A single timer drains the mailbox. Posting is a dict store
+    and draining pops key by key, both atomic in CPython, so no lock is
+    needed and an update posted mid-drain is never lost, only applied on
+    the next frame.
+    """
+
+    def __init__(self, interval_ms=FRAME_MS, parent=None):
+        super().__init__(parent)
+        self._pending = {}
+        self.applied = 0
+        self.coalesced = 0
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.drain)
+        self.timer.start()
+
+    def post(self, key, apply, *args):
+        if key in self._pending:
+            self.coalesced += 1
+        self._pending[key] = (apply, args)
+
+    def drain(self):
+        for key in list(self._pending):
+            update = self._pending.pop(key, None)
+            if update is None:
+                continue
+            apply, args = update
+            try:
+                apply(*args)
+            except Exception as e:
+                print(f"Error applying GUI update {key}: {e}")
+            self.applied += 1
@@ -0,0 +1,231 @@
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from PyQt5.QtCore import QSortFilterProxyModel, QThread, QTimer, Qt, pyqtSignal
+from PyQt5.QtWidgets import QFileSystemModel
+
+from util.midi_index import MidiIndex, channel_list, update_index
+
+SORT_ROLE = Qt.UserRole  # Raw value of a cell, used for sorting
+FS_COLUMNS = 4  # Name, Size, Type, Date Modified
+META_COLUMNS = ("BPM", "Length", "Notes", "Range", "Channels", "Tracks")
+
+
+class MidiIndexerThread(QThread):
+    """Keeps the metadata index up to date in the background.
+
+    Paths and folder scans are queued with request() and scan(); files are
+    analyzed in a process pool and every finished record is emitted.
+    """
+    index_loaded = pyqtSignal(dict)  # Every record in the index, on startup
+    file_indexed = pyqtSignal(dict)  # One new or refreshed record
+
+    def __init__(self, db_path, workers=None):
+        super().__init__()
+        self.db_path = db_path
+        self.workers = workers
+        self.requests = queue.Queue()
+        self.stopping = threading.Event()
+
+    def request(self, path):
+        self.requests.put(('file', path))
+
+    def scan(self, root):
+        self.requests.put(('scan', root))
+
+    def stop(self):
+        """Stop soon, also in the middle of a scan; files not done yet are indexed next time."""
+        self.stopping.set()
+        self.requests.put(None)
+
+    def run(self):
+        index = MidiIndex(self.db_path)
+        self.index_loaded.emit(index.load_all())
+        pool = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            while True:
+                item = self.requests.get()
+                items = [item]
+                # Handle everything queued meanwhile as one batch
+                while item is not None:
+                    try:
+                        item = self.requests.get_nowait()
+                    except queue.Empty:
+                        break
+                    items.append(item)
+
+                paths = set()
+                for item in items:
+                    if item is None:
+                        break
+                    kind, path = item
+                    if kind == 'scan':
+                        index.prune(path)
+                        paths.update(index.stale_files(path))
+                    elif os.path.isfile(path):
+                        paths.add(path)
+                if None in items or self.stopping.is_set():
+                    break
+                try:
+                    for record in update_index(index, sorted(paths), pool):
+                        if self.stopping.is_set():
+                            break
+                        self.file_indexed.emit(record)
+                except Exception as e:
+                    print(f"Error indexing MIDI files: {e}")
+        finally:
+            # Drop the queued files, the running ones finish in their processes
+            pool.shutdown(wait=False, cancel_futures=True)
+            index.close()
+
+
+class MidiIndexModel(QFileSystemModel):
+    """QFileSystemModel with extra columns filled from the metadata index.
+
+    Files that are missing from the index, or whose size or modification
+    time changed, are requested from the indexer when first shown.
+    """
+    index_requested = pyqtSignal(str)
+    metadata_changed = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.records = {}
+        self.requested = set()
+
+    def columnCount(self, parent=None):
+        return FS_COLUMNS + len(META_COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if section >= FS_COLUMNS and orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return META_COLUMNS[section - FS_COLUMNS]
+        return super().headerData(section, orientation, role)
+
+    def set_records(self, records):
+        self.records.update(records)
+        self.metadata_changed.emit()
+
+    def update_record(self, record):
+        path = record['path']
+        self.records[path] = record
+        self.requested.discard(path)
+        first = self.index(path, FS_COLUMNS)
+        if first.isValid():
+            self.dataChanged.emit(first, first.sibling(first.row(), self.columnCount() - 1))
+        self.metadata_changed.emit()
+
+    def record(self, index):
+        """Index record for a file, or None while it is (re)indexed."""
+        if self.isDir(index):
+            return None
+        path = self.filePath(index)
+        record = self.records.get(path)
+        mtime = self.lastModified(index).toMSecsSinceEpoch() / 1000
+        if record is None or record['size'] != self.size(index) or abs(record['mtime'] - mtime) > 0.002:
+            if path not in self.requested:
+                self.requested.add(path)
+                self.index_requested.emit(path)
+            return None
+        return record
+
+    def data(self, index, role=Qt.DisplayRole):
+        column = index.column()
+        if column < FS_COLUMNS:
+            if role == SORT_ROLE:
+                if column == 1:
+                    return self.size(index)
+                if column == 3:
+                    return self.lastModified(index).toMSecsSinceEpoch()
+                return super().data(index, Qt.DisplayRole).lower()
+            return super().data(index, role)
+        if role not in (Qt.DisplayRole, SORT_ROLE):
+            return None
+        record = self.record(index)
+        if record is None:
+            return None if role == SORT_ROLE or self.isDir(index) else "…"
+        if record['error']:
+            return None if role == SORT_ROLE else "error"
+
+        name = META_COLUMNS[column - FS_COLUMNS]
+        if name == "BPM":
+            return record['bpm'] if role == SORT_ROLE else f"{record['bpm']:.1f}"
+        if name == "Length":
+            duration = record['duration'] or 0
+            return duration if role == SORT_ROLE else f"{int(duration // 60)}:{int(duration % 60):02d}"
+        if name == "Notes":
+            return record['notes']
+        if name == "Range":
+            if record['note_min'] is None:
+                return None if role == SORT_ROLE else ""
+            return record['note_min'] if role == SORT_ROLE else f"{record['note_min']}-{record['note_max']}"
+        if name == "Channels":
+            channels = channel_list(record['channels'])
+            return len(channels) if role == SORT_ROLE else ",".join(str(channel) for channel in channels)
+        if name == "Tracks":
+            return record['tracks']
+        return None
+
+
+class MidiIndexFilterModel(QSortFilterProxyModel):
+    """Sorts and filters the file tree by name and indexed metadata.
+
+    Folders are always kept and sort before files.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setSortRole(SORT_ROLE)
+        self.name_filter = ""
+        self.bpm_min = 0
+        self.bpm_max = 0
+        # Coalesce bursts of index updates into one re-sort/re-filter
+        self.refresh_timer = QTimer()
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(250)
+        self.refresh_timer.timeout.connect(self.invalidate)
+
+    def setSourceModel(self, model):
+        super().setSourceModel(model)
+        model.metadata_changed.connect(self.refresh_timer.start)
+
+    def set_name_filter(self, text):
+        self.name_filter = text.lower()
+        self.invalidateFilter()
+
+    def set_bpm_range(self, bpm_min, bpm_max):
+        """Only show files with bpm_min <= BPM <= bpm_max; 0 disables a bound."""
+        self.bpm_min = bpm_min
+        self.bpm_max = bpm_max
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        model = self.sourceModel()
+        index = model.index(source_row, 0, source_parent)
+        if model.isDir(index):
+            return True
+        if self.name_filter and self.name_filter not in model.fileName(index).lower():
+            return False
+        if self.bpm_min or self.bpm_max:
+            record = model.record(index)
+            if record is None or record['bpm'] is None:
+                return False
+            if self.bpm_min and record['bpm'] < self.bpm_min:
+                return False
+            if self.bpm_max and record['bpm'] > self.bpm_max:
+                return False
+        return True
+
+    def lessThan(self, left, right):
+        model = self.sourceModel()
+        left_dir = model.isDir(left)
+        right_dir = model.isDir(right)
+        if left_dir != right_dir:
+            # Keep folders on top in both sort orders
+            return left_dir if self.sortOrder() == Qt.AscendingOrder else right_dir
+        left_value = model.data(left, SORT_ROLE)
+        right_value = model.data(right, SORT_ROLE)
+        if left_value is None or right_value is None:
+            return left_value is None and right_value is not None
+        return left_value < right_value
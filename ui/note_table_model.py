@@ -0,0 +1,140 @@
+import numpy as np
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, QTimer, Qt
+
+from util.notes import midi_note_to_name
+
+COLUMNS = ("Time", "Note", "Velocity", "Channel")
+PAGE_SIZE = 500  # Rows handed to the view per fetchMore
+
+
+def note_columns(times, status, data1, data2):
+    """(times, notes, velocities, channels) arrays of the note-ons among decoded event columns."""
+    status = np.asarray(status)
+    data2 = np.asarray(data2)
+    on = np.flatnonzero((status & 0xF0 == 0x90) & (data2 > 0))
+    return (np.asarray(times, dtype=np.float64)[on], np.asarray(data1, dtype=np.uint8)[on],
+            data2[on].astype(np.uint8), (status[on] & 0x0F).astype(np.uint8))
+
+
+class NoteTableModel(QAbstractTableModel):
+    """Note-ons of the loaded file, backed by NumPy columns.
+
+    Rows are only formatted when the view asks for them, and the view
+    gets them a page at a time through fetchMore, so showing a file costs
+    the same whatever its size. Sorting and filtering work on the arrays
+    and only rebuild the row order (self.view). Notes that arrive while
+    a sort or filter is active are folded in by a coalescing timer.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.columns = [np.empty(0, dtype=dtype) for dtype in (np.float64, np.uint8, np.uint8, np.uint8)]
+        self.count = 0
+        self.view = None  # Row -> note index, None while in file order and unfiltered
+        self.fetched = 0
+        self.sort_column = None
+        self.sort_order = Qt.AscendingOrder
+        self.note_filter = None
+        self.channel_filter = None
+        self.refresh_timer = QTimer()
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(250)
+        self.refresh_timer.timeout.connect(self.rebuild_view)
+
+    def clear(self):
+        self.beginResetModel()
+        self.columns = [np.empty(0, dtype=column.dtype) for column in self.columns]
+        self.count = 0
+        self.view = None
+        self.fetched = 0
+        self.endResetModel()
+
+    def append_notes(self, columns):
+        """Add (times, notes, velocities, channels) arrays from note_columns()."""
+        added = len(columns[0])
+        if not added:
+            return
+        needed = self.count + added
+        if needed > len(self.columns[0]):
+            # Grow by doubling, so appending every chunk stays amortised O(1)
+            capacity = max(needed, 2 * len(self.columns[0]), 1024)
+            for i, column in enumerate(self.columns):
+                grown = np.empty(capacity, dtype=column.dtype)
+                grown[:self.count] = column[:self.count]
+                self.columns[i] = grown
+        for column, values in zip(self.columns, columns):
+            column[self.count:needed] = values
+        self.count = needed
+        if self.view is None:
+            if self.fetched < PAGE_SIZE:
+                self.fetchMore(QModelIndex())
+        else:
+            self.refresh_timer.start()
+
+    def visible_count(self):
+        return self.count if self.view is None else len(self.view)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.fetched
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.fetched < self.visible_count()
+
+    def fetchMore(self, parent=QModelIndex()):
+        rows = min(PAGE_SIZE, self.visible_count() - self.fetched)
+        if rows <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.fetched, self.fetched + rows - 1)
+        self.fetched += rows
+        self.endInsertRows()
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return COLUMNS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        i = index.row() if self.view is None else self.view[index.row()]
+        column = index.column()
+        if column == 0:
+            return f"{self.columns[0][i]:.3f}"
+        if column == 1:
+            note = int(self.columns[1][i])
+            return f"{note} ({midi_note_to_name(note)})"
+        return str(int(self.columns[column][i]))
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column = column if column >= 0 else None  # -1 is file order
+        self.sort_order = order
+        self.rebuild_view()
+
+    def set_filter(self, note=None, channel=None):
+        """Only show one note and/or one channel; None shows all."""
+        self.note_filter = note
+        self.channel_filter = channel
+        self.rebuild_view()
+
+    def rebuild_view(self):
+        self.refresh_timer.stop()
+        view = None
+        if self.sort_column is not None:
+            keys = self.columns[self.sort_column][:self.count]
+            view = np.argsort(keys, kind='stable')
+            if self.sort_order == Qt.DescendingOrder:
+                view = view[::-1]
+        if self.note_filter is not None or self.channel_filter is not None:
+            mask = np.ones(self.count, dtype=bool)
+            if self.note_filter is not None:
+                mask &= self.columns[1][:self.count] == self.note_filter
+            if self.channel_filter is not None:
+                mask &= self.columns[3][:self.count] == self.channel_filter
+            view = np.flatnonzero(mask) if view is None else view[mask[view]]
+        self.beginResetModel()
+        self.view = view
+        self.fetched = min(max(self.fetched, PAGE_SIZE), self.visible_count())
+        self.endResetModel()
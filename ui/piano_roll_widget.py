@@ -0,0 +1,148 @@
+import collections
+
+from PyQt5.QtCore import QRectF, QTimer, Qt
+from PyQt5.QtGui import QColor, QImage, QPainter, QPen, QPixmap
+from PyQt5.QtWidgets import QWidget
+
+from util.piano_roll import render_tile
+
+TILE_PX = 256  # Tile width in pixels
+BASE_PPS = 100  # Pixels per second at zoom level 0
+MIN_LEVEL, MAX_LEVEL = -8, 6
+MAX_TILES = 256  # Pixmaps kept in the cache
+FRAME_MS = 16  # Playhead refresh, about 60 fps
+
+
+class PianoRollWidget(QWidget):
+    """Piano roll of a NoteRects, drawn from cached pixmap tiles.
+
+    Every zoom level doubles the pixels per second and has its own row
+    of TILE_PX wide tiles; a tile is rendered once with NumPy and reused
+    for every frame until it falls out of the LRU cache. Tiles hold one
+    pixel row per pitch and are stretched to the widget height, so
+    resizing never re-renders. A frame is a handful of drawPixmap calls
+    plus the playhead, which polls position_source() (seconds or None)
+    every FRAME_MS while running.
+
+    Scroll with the wheel or by dragging, Ctrl+wheel zooms.
+    """
+
+    def __init__(self, position_source=None, parent=None):
+        super().__init__(parent)
+        self.position_source = position_source
+        self.rects = None
+        self.level = 0
+        self.offset = 0.0  # Seconds at the left edge
+        self.playhead = None
+        self.follow = True
+        self.tiles = collections.OrderedDict()
+        self.low_pitch, self.high_pitch = 48, 72
+        self._drag_x = None
+        self.setMinimumHeight(120)
+        self.frame_timer = QTimer(self)
+        self.frame_timer.setInterval(FRAME_MS)
+        self.frame_timer.timeout.connect(self.update_playhead)
+
+    @property
+    def pixels_per_second(self):
+        return BASE_PPS * 2.0 ** self.level
+
+    def set_notes(self, rects):
+        self.rects = rects
+        self.tiles.clear()
+        if rects is not None:
+            low, high = rects.pitch_range
+            # At least two octaves, with a little room above and below
+            middle = (low + high) // 2
+            low, high = min(low - 1, middle - 12), max(high + 1, middle + 12)
+            self.low_pitch, self.high_pitch = max(low, 0), min(high, 127)
+            if self.offset > rects.duration:
+                self.offset = 0.0
+        self.update()
+
+    def start(self):
+        self.frame_timer.start()
+
+    def stop(self):
+        self.frame_timer.stop()
+        self.playhead = None
+        self.update()
+
+    def update_playhead(self):
+        position = self.position_source() if self.position_source is not None else None
+        if position is None and self.playhead is None:
+            return
+        self.playhead = position
+        if position is not None and self.follow and not self._drag_x:
+            visible = self.width() / self.pixels_per_second
+            if not self.offset <= position < self.offset + visible:
+                self.offset = max(position - visible * 0.1, 0.0)  # Page along with the playhead
+        self.update()
+
+    def zoom_to_fit(self):
+        if self.rects is None or self.rects.duration <= 0 or self.width() <= 0:
+            return
+        level = MIN_LEVEL
+        while level < MAX_LEVEL and BASE_PPS * 2.0 ** (level + 1) * self.rects.duration <= self.width():
+            level += 1
+        self.level = level
+        self.offset = 0.0
+        self.update()
+
+    def _tile(self, index):
+        key = (self.level, index)
+        pixmap = self.tiles.get(key)
+        if pixmap is not None:
+            self.tiles.move_to_end(key)
+            return pixmap
+        seconds = TILE_PX / self.pixels_per_second
+        pixels = render_tile(self.rects, index * seconds, (index + 1) * seconds, TILE_PX,
+                             self.low_pitch, self.high_pitch)
+        image = QImage(pixels.data, TILE_PX, pixels.shape[0], TILE_PX * 4, QImage.Format_ARGB32)
+        pixmap = QPixmap.fromImage(image)  # Copies, so pixels can go
+        self.tiles[key] = pixmap
+        if len(self.tiles) > MAX_TILES:
+            self.tiles.popitem(last=False)
+        return pixmap
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(0x20, 0x20, 0x20))
+        if self.rects is not None and len(self.rects):
+            pps = self.pixels_per_second
+            first = int(self.offset * pps // TILE_PX)
+            last = int((self.offset * pps + self.width()) // TILE_PX)
+            for index in range(max(first, 0), last + 1):
+                x = index * TILE_PX - self.offset * pps
+                pixmap = self._tile(index)
+                painter.drawPixmap(QRectF(x, 0, TILE_PX, self.height()), pixmap, QRectF(pixmap.rect()))
+        if self.playhead is not None:
+            x = (self.playhead - self.offset) * self.pixels_per_second
+            painter.setPen(QPen(QColor("red"), 2))
+            painter.drawLine(int(x), 0, int(x), self.height())
+        painter.end()
+
+    def wheelEvent(self, event):
+        steps = event.angleDelta().y() / 120
+        if event.modifiers() & Qt.ControlModifier:
+            # Zoom around the mouse position
+            anchor = self.offset + event.pos().x() / self.pixels_per_second
+            level = min(max(self.level + (1 if steps > 0 else -1), MIN_LEVEL), MAX_LEVEL)
+            if level != self.level:
+                self.level = level
+                self.offset = max(anchor - event.pos().x() / self.pixels_per_second, 0.0)
+        else:
+            self.offset = max(self.offset - steps * self.width() * 0.2 / self.pixels_per_second, 0.0)
+        self.update()
+
+    def mousePressEvent(self, event):
+        self._drag_x = event.pos().x()
+
+    def mouseMoveEvent(self, event):
+        if self._drag_x is not None:
+            self.offset = max(self.offset - (event.pos().x() - self._drag_x) / self.pixels_per_second, 0.0)
+            self._drag_x = event.pos().x()
+            self.update()
+
+    def mouseReleaseEvent(self, event):
+        self._drag_x = None
@@ -0,0 +1,207 @@
+import mmap
+import struct
+import time
+
+from util.scheduler import wait_until
+
+# File layout: a 16 byte header, then 8 byte records of
+# (microseconds since the previous record, port id, 3 data bytes).
+MAGIC = b'MIDICAP\x01'
+HEADER = struct.Struct('<8sq')  # magic, wall clock (time_ns) of time zero
+RECORD = struct.Struct('<IB3s')
+MAX_DELTA = 0xFFFFFFFF
+
+# Port ids below SYNC are input ports; the rest mark special records
+SYNC = 0xFC       # absolute time in us: low 32 bits in the delta, high 24 in the data
+PORT_NAME = 0xFD  # data is (port id, name length, name...)
+EXTEND = 0xFE     # 3 more bytes of the message before it
+GAP = 0xFF        # only moves time forward, for gaps longer than MAX_DELTA
+
+SYNC_EVERY = 512  # Every record at a multiple of this is a SYNC (one per 4 KB)
+
+
+def message_length(status):
+    """Bytes in a message starting with status. SysEx runs up to its 0xF7."""
+    if status < 0xF0:
+        return 2 if status & 0xF0 in (0xC0, 0xD0) else 3
+    return {0xF1: 2, 0xF2: 3, 0xF3: 2}.get(status, 1)
+
+
+class CaptureWriter:
+    """Appends MIDI messages to a capture file.
+
+    Records are fixed width, so a file is always readable up to the last
+    whole record even if the writer never closed it. Every SYNC_EVERY-th
+    record holds the absolute time, which is the sparse index seeking
+    uses. Messages longer than 3 bytes continue in EXTEND records.
+    """
+
+    def __init__(self, path, port_names=(), origin_ns=None):
+        self.path = path
+        self.stream = open(path, 'wb')
+        # perf_counter_ns of time zero, matching the wall clock in the header
+        self.origin_ns = time.perf_counter_ns() if origin_ns is None else origin_ns
+        self.records = 0
+        self.time_us = 0
+        self._buffer = bytearray()
+        self.stream.write(HEADER.pack(MAGIC, time.time_ns()))
+        for port, name in enumerate(port_names):
+            encoded = name.encode('utf-8')[:255]
+            self._message(0, PORT_NAME, bytes((port, len(encoded))) + encoded)
+
+    @property
+    def size(self):
+        return HEADER.size + self.records * RECORD.size
+
+    def _record(self, delta, port, data):
+        if self.records % SYNC_EVERY == 0:
+            self._buffer += RECORD.pack(self.time_us & MAX_DELTA, SYNC, (self.time_us >> 32).to_bytes(3, 'little'))
+            self.records += 1
+        self._buffer += RECORD.pack(delta, port, data)
+        self.records += 1
+        self.time_us += delta
+
+    def _message(self, delta, port, data):
+        self._record(delta, port, data[:3])
+        for i in range(3, len(data), 3):
+            self._record(0, EXTEND, data[i:i + 3])
+
+    def write(self, stamp_ns, port, data):
+        """Add one message; stamp_ns is on the perf_counter_ns clock."""
+        # Ports are merged in batches, keep time from running backwards
+        delta = max((stamp_ns - self.origin_ns) // 1000 - self.time_us, 0)
+        while delta > MAX_DELTA:
+            self._record(MAX_DELTA, GAP, b'')
+            delta -= MAX_DELTA
+        self._message(delta, port, data)
+
+    def flush(self):
+        self.stream.write(self._buffer)
+        self.stream.flush()
+        self._buffer.clear()
+
+    def close(self):
+        self.flush()
+        self.stream.close()
+
+
+class CaptureReader:
+    """Memory-mapped capture file.
+
+    Nothing is parsed up front: seek() bisects the SYNC records, which sit
+    at fixed offsets, and iter_events() decodes from there on.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        size = self.file.seek(0, 2)
+        if size < HEADER.size:
+            self.file.close()
+            raise ValueError(f"{path} is not a MIDI capture")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.start_wall_ns = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a MIDI capture")
+        self.records = (size - HEADER.size) // RECORD.size
+        self.ports = []
+        for _, port, data in self._messages(0):
+            if port != PORT_NAME:
+                break
+            self.ports.append(bytes(data[2:2 + data[1]]).decode('utf-8', 'replace'))
+        self._duration_ns = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        self.file.close()
+
+    def _sync_time(self, record):
+        delta, port, high = RECORD.unpack_from(self.mm, HEADER.size + record * RECORD.size)
+        return delta | int.from_bytes(high, 'little') << 32
+
+    def seek(self, time_ns):
+        """Index of the last SYNC record before time_ns (or the first one).
+
+        Every message at or after time_ns comes after that record.
+        """
+        target = -(-time_ns // 1000)
+        low, high = 0, (self.records - 1) // SYNC_EVERY if self.records else 0
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self._sync_time(middle * SYNC_EVERY) < target:
+                low = middle
+            else:
+                high = middle - 1
+        return low * SYNC_EVERY
+
+    def _messages(self, first):
+        """(time_us, port, data) from record first on, including PORT_NAME messages."""
+        time_us = 0
+        current = None
+        end = HEADER.size + self.records * RECORD.size
+        chunk = SYNC_EVERY * RECORD.size
+        # Decode a page at a time, so a long replay never copies the whole file
+        for offset in range(HEADER.size + first * RECORD.size, end, chunk):
+            for delta, port, data in RECORD.iter_unpack(self.mm[offset:min(offset + chunk, end)]):
+                if port == SYNC:
+                    time_us = delta | int.from_bytes(data, 'little') << 32
+                    continue
+                if port == EXTEND:
+                    if current is not None:
+                        current[2] += data
+                    continue
+                if current is not None:
+                    yield current
+                current = None
+                time_us += delta
+                if port != GAP:
+                    current = [time_us, port, bytearray(data)]
+        if current is not None:
+            yield current
+
+    def iter_events(self, start_ns=0, end_ns=None):
+        """(time_ns, port, bytes) for every message from start_ns on."""
+        start_us = -(-start_ns // 1000)  # Times are whole microseconds
+        for time_us, port, data in self._messages(self.seek(start_ns)):
+            if port == PORT_NAME or time_us < start_us:
+                continue
+            if end_ns is not None and time_us * 1000 > end_ns:
+                return
+            if data[0] == 0xF0:
+                end = data.find(0xF7)
+                data = data[:end + 1] if end >= 0 else data
+            else:
+                data = data[:message_length(data[0])]
+            yield time_us * 1000, port, bytes(data)
+
+    @property
+    def duration_ns(self):
+        if self._duration_ns is None:
+            self._duration_ns = 0
+            last_sync = (self.records - 1) // SYNC_EVERY * SYNC_EVERY if self.records else 0
+            for time_us, _, _ in self._messages(last_sync):
+                self._duration_ns = time_us * 1000
+        return self._duration_ns
+
+
+def replay(reader, send, speed=1.0, start_ns=0, stop_event=None):
+    """Send the captured messages against absolute deadlines, speed times as fast.
+
+    send(port, data) is called for every message. Returns False if
+    stop_event ended the replay early.
+    """
+    origin = time.perf_counter_ns()
+    for stamp_ns, port, data in reader.iter_events(start_ns):
+        if not wait_until(origin + int((stamp_ns - start_ns) / speed), stop_event):
+            return False
+        send(port, data)
+    return True
@@ -0,0 +1,81 @@
+import numpy as np
+
+EXPRESSION_CC = 11
+
+
+def adsr_levels(t, attack, decay, sustain, release):
+    """ADSR level (0..1) at times t, all in seconds.
+
+    Every argument broadcasts, so one call can render a single curve, a
+    curve at any resolution, or a whole batch of parameter sets (pass
+    parameters shaped (N, 1) against t shaped (N, samples) or (samples,)).
+    The release follows straight after the decay, as drawn in the editor.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    attack = np.asarray(attack, dtype=np.float64)
+    decay = np.asarray(decay, dtype=np.float64)
+    sustain = np.asarray(sustain, dtype=np.float64)
+    release = np.asarray(release, dtype=np.float64)
+    # Zero-length stages are never selected below; keep the division finite
+    safe_attack = np.where(attack > 0, attack, 1.0)
+    safe_decay = np.where(decay > 0, decay, 1.0)
+    safe_release = np.where(release > 0, release, 1.0)
+    return np.select(
+        [t < attack, t < attack + decay, t < attack + decay + release],
+        [t / safe_attack,
+         1 - (1 - sustain) * ((t - attack) / safe_decay),
+         sustain * (1 - (t - attack - decay) / safe_release)],
+        0.0)
+
+
+def adsr_curve(attack, decay, sustain, release, resolution=500):
+    """(t, level) arrays spanning the whole envelope."""
+    t = np.linspace(0, attack + decay + release, resolution)
+    return t, adsr_levels(t, attack, decay, sustain, release)
+
+
+def adsr_curves(params, resolution=500):
+    """Render a batch of (attack, decay, sustain, release) rows at once.
+
+    Returns (t, level) arrays shaped (len(params), resolution).
+    """
+    params = np.asarray(params, dtype=np.float64).reshape(-1, 4)
+    attack, decay, sustain, release = (params[:, i:i + 1] for i in range(4))
+    t = np.linspace(0, 1, resolution) * (attack + decay + release)
+    return t, adsr_levels(t, attack, decay, sustain, release)
+
+
+def held_levels(t, attack, decay, sustain):
+    """Level while a note is held: attack, decay, then sustain forever."""
+    t = np.asarray(t, dtype=np.float64)
+    safe_attack = attack if attack > 0 else 1.0
+    safe_decay = decay if decay > 0 else 1.0
+    return np.select(
+        [t < attack, t < attack + decay],
+        [t / safe_attack, 1 - (1 - sustain) * ((t - attack) / safe_decay)],
+        sustain)
+
+
+def gate_levels(t, attack, decay, sustain, release, gate):
+    """Level of a note held for gate seconds, releasing from wherever it was."""
+    t = np.asarray(t, dtype=np.float64)
+    held = held_levels(t, attack, decay, sustain)
+    if release > 0:
+        level_at_gate = float(held_levels(gate, attack, decay, sustain))
+        released = level_at_gate * np.clip(1 - (t - gate) / release, 0, 1)
+    else:
+        released = np.zeros_like(t)
+    return np.where(t < gate, held, released)
+
+
+def envelope_cc_events(attack, decay, sustain, release, gate, length, rate=100):
+    """CC values for one note as (times, values) arrays, times in seconds.
+
+    Sampled at rate Hz up to length (usually the step length, so a long
+    release never runs into the next note), with repeated values dropped.
+    """
+    t = np.arange(0, length, 1.0 / rate)
+    values = np.rint(gate_levels(t, attack, decay, sustain, release, gate) * 127).astype(np.int64)
+    keep = np.ones(len(values), dtype=bool)
+    keep[1:] = values[1:] != values[:-1]
+    return t[keep], values[keep]
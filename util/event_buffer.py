@@ -0,0 +1,127 @@
+from array import array
+from bisect import bisect_right
+
+import mido
+
+
+class EventBuffer:
+    """Compact column store for recorded MIDI events.
+
+    Events live in parallel arrays (time in seconds, status, data1, data2,
+    overdub layer) next to their raw MIDI bytes, so playback can send
+    prebuilt bytes without building or validating mido.Message objects.
+    Buffers are never edited while playing: merges and undo return a new
+    buffer that the player swaps in, and a buffer still being recorded
+    into is not played (read a snapshot() of it instead).
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.times = array('d')
+        self.status = array('B')
+        self.data1 = array('B')
+        self.data2 = array('B')
+        self.layers = array('H')
+        self.raw = []
+        self.length = None  # loop length in seconds, defaults to the last event
+        self._channel_cache = {}
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def duration(self):
+        if self.length is not None:
+            return self.length
+        return self.times[-1] if self.times else 0.0
+
+    @property
+    def layer_count(self):
+        return max(self.layers) + 1 if self.layers else 0
+
+    def append(self, time, data, layer=0):
+        """Add one event from its raw bytes, e.g. msg.bytes()."""
+        data = bytes(data)
+        self.times.append(time)
+        self.status.append(data[0])
+        self.data1.append(data[1] if len(data) > 1 else 0)
+        self.data2.append(data[2] if len(data) > 2 else 0)
+        self.layers.append(layer)
+        self.raw.append(data)
+        self._channel_cache.clear()
+
+    def _extend_from(self, other, start, stop):
+        self.times.extend(other.times[start:stop])
+        self.status.extend(other.status[start:stop])
+        self.data1.extend(other.data1[start:stop])
+        self.data2.extend(other.data2[start:stop])
+        self.layers.extend(other.layers[start:stop])
+        self.raw.extend(other.raw[start:stop])
+        self._channel_cache.clear()
+
+    def snapshot(self):
+        """Copy of the events so far, safe to read while this buffer is still appended to."""
+        out = EventBuffer()
+        out.length = self.length
+        out._extend_from(self, 0, len(self.raw))  # raw is appended last
+        return out
+
+    def merged(self, times, raws, layer):
+        """Return a new buffer with sorted events merged in as layer.
+
+        Runs of existing events between insert points are copied as array
+        slices, so this is a single O(n + m) pass with no re-sort.
+        """
+        out = EventBuffer()
+        out.length = self.duration
+        start = 0
+        for time, data in zip(times, raws):
+            stop = bisect_right(self.times, time, start)
+            out._extend_from(self, start, stop)
+            out.append(time, data, layer)
+            start = stop
+        out._extend_from(self, start, len(self))
+        return out
+
+    def without_layer(self, layer):
+        """Return a new buffer with every event of layer removed."""
+        out = EventBuffer()
+        out.length = self.duration
+        start = 0
+        for index, event_layer in enumerate(self.layers):
+            if event_layer == layer:
+                out._extend_from(self, start, index)
+                start = index + 1
+        out._extend_from(self, start, len(self))
+        return out
+
+    def raw_for_channel(self, channel):
+        """Raw bytes of every event with channel messages moved to channel.
+
+        Built once per channel and cached until the buffer changes.
+        """
+        cached = self._channel_cache.get(channel)
+        if cached is None:
+            cached = []
+            for data in self.raw:
+                cached.append(rechannel(data, channel))
+            self._channel_cache[channel] = cached
+        return cached
+
+
+def rechannel(data, channel):
+    """Return raw bytes with a channel message moved to channel."""
+    if data[0] >= 0xF0:
+        return data
+    return bytes(((data[0] & 0xF0) | channel,)) + data[1:]
+
+
+def send_raw(port, data):
+    """Send raw MIDI bytes, skipping mido.Message when the backend allows it."""
+    rt = getattr(port, '_rt', None)
+    if rt is not None:
+        rt.send_message(data)
+    else:
+        port.send(mido.Message.from_bytes(data))
@@ -0,0 +1,247 @@
+from bisect import bisect_right
+import threading
+import time
+
+import numpy as np
+
+from util.scheduler import SPIN_THRESHOLD_NS, LatenessStats, wait_until
+from util.smf_reader import META, SmfFile
+
+TIME_SIGNATURE = 0x58
+
+
+class FileTimeline:
+    """Every playable event of a file, resolved once to seconds.
+
+    Ticks go through the file's TempoMap a single time at load; playback
+    only adds a per-pass origin and multiplies by a speed factor, so a
+    tempo override never touches the events again. Bars follow the time
+    signature events (4/4 until the first one).
+    """
+
+    def __init__(self, seconds, ticks, payloads, tempo_map, end_tick, signatures=()):
+        self.seconds = np.asarray(seconds, dtype=np.float64)
+        self.ticks = np.asarray(ticks, dtype=np.int64)
+        self.payloads = payloads
+        self.tempo_map = tempo_map
+        self.end_tick = end_tick
+        self.length = tempo_map.tick2second(end_tick)
+        self.bpm = tempo_map.average_bpm(end_tick)
+        self.signatures = list(signatures)
+        beat_ticks = tempo_map.ticks_per_beat
+        if beat_ticks & 0x8000:
+            beat_ticks = round(0.5 / tempo_map.scales[0])  # SMPTE has no beats, call it 120 BPM
+        # (start tick, start bar, ticks per bar) for every time signature
+        self.bar_segments = [(0, 0, beat_ticks * 4)]
+        for tick, numerator, denominator in signatures:
+            start, bar, bar_ticks = self.bar_segments[-1]
+            bars = -(-(tick - start) // bar_ticks)  # A change mid-bar starts the next bar
+            new_bar_ticks = max(beat_ticks * 4 * numerator // denominator, 1)
+            if bars == 0:
+                self.bar_segments[-1] = (start, bar, new_bar_ticks)
+            else:
+                self.bar_segments.append((start + bars * bar_ticks, bar + bars, new_bar_ticks))
+        self._bar_starts = [bar for _, bar, _ in self.bar_segments]
+
+    def __len__(self):
+        return len(self.seconds)
+
+    @classmethod
+    def from_file(cls, path):
+        with SmfFile(path) as smf:
+            return cls.from_events(smf, smf.to_arrays())
+
+    @classmethod
+    def from_events(cls, smf, events):
+        """Timeline of an open SmfFile from its to_arrays(), for callers that need the arrays too."""
+        is_meta = events.status == META
+        signatures = []
+        for i in np.flatnonzero(is_meta & (events.data1 == TIME_SIGNATURE) & (events.length >= 2)):
+            offset = int(events.offset[i])
+            signatures.append((int(events.ticks[i]), smf.buffer[offset], 2 ** smf.buffer[offset + 1]))
+        keep = np.flatnonzero(~is_meta)
+        status = events.status[keep]
+        # Channel messages sliced out of one packed buffer, sysex decoded one by one
+        raw = np.stack([status, events.data1[keep], events.data2[keep]], axis=1).tobytes()
+        kind = status & 0xF0
+        sizes = np.where((kind == 0xC0) | (kind == 0xD0), 2, 3).tolist()
+        payloads = [raw[3 * i:3 * i + size] for i, size in enumerate(sizes)]
+        for i in np.flatnonzero(status >= 0xF0):
+            j = keep[i]
+            payloads[i] = smf.event_bytes(int(events.status[j]), int(events.data1[j]), int(events.data2[j]),
+                                          int(events.offset[j]), int(events.length[j]))
+        return cls(events.seconds[keep], events.ticks[keep], payloads,
+                   smf.tempo_map(), smf.end_tick, signatures)
+
+    def message_columns(self):
+        """(status, data1, data2) arrays of every event, 0 where a message has no such byte."""
+        raw = b"".join((data + b"\0\0")[:3] for data in self.payloads)
+        raw = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        return raw[:, 0], raw[:, 1], raw[:, 2]
+
+    @property
+    def bar_count(self):
+        start, bar, bar_ticks = self.bar_segments[-1]
+        return bar + max(-(-(self.end_tick - start) // bar_ticks), 0)
+
+    def bar_tick(self, bar):
+        """Tick where bar (counted from 0) starts, O(log n)."""
+        segment = max(bisect_right(self._bar_starts, bar) - 1, 0)
+        start, first_bar, bar_ticks = self.bar_segments[segment]
+        return start + (bar - first_bar) * bar_ticks
+
+    def bar_seconds(self, bar):
+        return self.tempo_map.tick2second(self.bar_tick(bar))
+
+    def index_at(self, seconds):
+        """Index of the first event at or after seconds, O(log n)."""
+        return int(np.searchsorted(self.seconds, seconds, side='left'))
+
+
+class FilePlayer:
+    """Plays a FileTimeline against absolute perf_counter_ns deadlines.
+
+    The clock is (version, origin_ns, speed): the file position is
+    (now - origin) * speed seconds. set_speed() and seek() re-anchor the
+    clock so playback continues from the current position, and wake the
+    playback thread so a long wait picks up the change straight away.
+    run() blocks, like LoopScheduler.run().
+    """
+
+    def __init__(self, send, panic=None, spin_threshold_ns=SPIN_THRESHOLD_NS):
+        self.send = send
+        self.panic = panic
+        self.spin_threshold_ns = spin_threshold_ns
+        self.stats = LatenessStats()
+        self.stop_event = threading.Event()
+        self.timeline = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._clock = (0, None, 1.0)
+        self._seek = None  # Seconds to jump to, taken by the playback thread
+
+    @property
+    def speed(self):
+        return self._clock[2]
+
+    def position(self, at_ns=None):
+        """Position in the file in seconds, or None when not playing."""
+        _, origin, speed = self._clock
+        if origin is None:
+            return None
+        if at_ns is None:
+            at_ns = time.perf_counter_ns()
+        return max((at_ns - origin) * speed / 1e9, 0.0)
+
+    def _set_clock(self, origin, speed, seek=None, version=None):
+        """Publish a new clock; with version, only if nobody changed it meanwhile."""
+        with self._lock:
+            if version is not None and self._clock[0] != version:
+                return False
+            self._clock = (self._clock[0] + 1, origin, speed)
+            if seek is not None:
+                self._seek = seek
+        self._wake.set()
+        return True
+
+    def set_speed(self, speed):
+        """Play at speed times the file's tempo, keeping the current position."""
+        speed = max(speed, 0.01)
+        now = time.perf_counter_ns()
+        with self._lock:
+            version, origin, old_speed = self._clock
+            if origin is not None:
+                origin = now - int((now - origin) * old_speed / speed)
+            self._clock = (version + 1, origin, speed)
+        self._wake.set()
+
+    def seek(self, seconds):
+        now = time.perf_counter_ns()
+        speed = self._clock[2]
+        self._set_clock(now - int(seconds / speed * 1e9), speed, seek=seconds)
+
+    def seek_bar(self, bar):
+        if self.timeline is not None:
+            self.seek(self.timeline.bar_seconds(bar))
+
+    def stop(self):
+        self.stop_event.set()
+        self._wake.set()
+
+    def run(self, timeline, loop=True, progress=None, next_timeline=None, started=None, stop_event=None):
+        """Play timeline until stop(), looping if asked.
+
+        progress(percent) is called whenever the whole percent changes.
+        next_timeline() is asked for the file to follow as soon as the last
+        event of a pass is sent; it returns a FileTimeline that starts
+        exactly where this one ends, or None to loop (or stop).
+        started(timeline) is called when a following timeline takes over.
+        A caller's stop_event is used as is, never cleared; stop() still
+        has to be called to wake the wait.
+        """
+        self.timeline = timeline
+        if stop_event is None:
+            stop_event = self.stop_event
+            stop_event.clear()
+        self.stats.reset()
+        self._seek = None
+        length = max(timeline.length, 0.1)
+        seconds = timeline.seconds
+        self._set_clock(time.perf_counter_ns(), self._clock[2])
+        version = None
+        index = 0
+        percent = -1
+        following = None
+        asked = False
+        try:
+            while not stop_event.is_set():
+                self._wake.clear()
+                if stop_event.is_set():
+                    break  # Stopped just before the clear
+                clock = self._clock
+                if clock[0] != version:
+                    version, origin, speed = clock
+                    with self._lock:
+                        seek, self._seek = self._seek, None
+                    if seek is not None:
+                        index = timeline.index_at(seek)
+                        if self.panic is not None:
+                            self.panic()
+                if index < len(timeline):
+                    event_time = seconds[index]
+                else:
+                    event_time = length
+                    if next_timeline is not None and not asked:
+                        asked = True
+                        following = next_timeline()
+                        continue  # That may have taken a while, look at the clock again
+                deadline = origin + int(event_time / speed * 1e9)
+                if not wait_until(deadline, self._wake, self.spin_threshold_ns):
+                    continue  # Clock changed or stopping, look again
+                if index >= len(timeline):
+                    if progress is not None:
+                        progress(100)
+                    if following is None and not loop:
+                        break
+                    # Next pass starts exactly where this one ended, no gap
+                    if self._set_clock(origin + int(length / speed * 1e9), speed, version=version):
+                        index = 0
+                        percent = -1
+                        if following is not None:
+                            timeline = self.timeline = following
+                            length = max(timeline.length, 0.1)
+                            seconds = timeline.seconds
+                            if started is not None:
+                                started(timeline)
+                        following = None
+                        asked = False
+                    continue
+                self.send(timeline.payloads[index])
+                self.stats.add(time.perf_counter_ns() - deadline)
+                index += 1
+                if progress is not None and int(event_time / length * 100) != percent:
+                    percent = int(event_time / length * 100)
+                    progress(percent)
+        finally:
+            with self._lock:
+                self._clock = (self._clock[0] + 1, None, self._clock[2])
@@ -0,0 +1,104 @@
+import os
+import struct
+
+import numpy as np
+from mido import bpm2tempo
+
+from util.quantize import PPQ, seconds_to_ticks
+
+PROGRESS_EVERY = 4096  # Events between progress callbacks
+
+
+def _vlq(value):
+    """MIDI variable-length quantity."""
+    out = bytearray((value & 0x7F,))
+    value >>= 7
+    while value:
+        out.insert(0, 0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(out)
+
+
+def _meta(delta, kind, data):
+    return _vlq(delta) + bytes((0xFF, kind)) + _vlq(len(data)) + data
+
+
+def _chunk(kind, data):
+    return kind + struct.pack('>I', len(data)) + data
+
+
+def _track_name(name):
+    return _meta(0, 0x03, name.encode('utf-8'))
+
+
+def _event_track(ticks, raws, end_tick, name, progress=None):
+    """One MTrk body: delta ticks come from one np.diff over the whole track."""
+    deltas = np.diff(ticks, prepend=0).tolist()
+    out = bytearray(_track_name(name))
+    carry = 0  # delta of skipped events moves on to the next one
+    for i, (delta, data) in enumerate(zip(deltas, raws)):
+        delta += carry
+        if data[0] == 0xF0:
+            out += _vlq(delta) + b'\xF0' + _vlq(len(data) - 1) + data[1:]
+        elif data[0] >= 0xF0:
+            carry = delta  # System common and real-time messages have no place in a file
+            continue
+        else:
+            out += _vlq(delta) + data
+        carry = 0
+        if progress is not None and i % PROGRESS_EVERY == 0:
+            progress(len(deltas), i)
+    last = int(ticks[-1]) if len(ticks) else 0
+    out += _meta(max(end_tick - last, 0) + carry, 0x2F, b'')
+    return bytes(out)
+
+
+def export_buffer(buffer, path, bpm, split_layers=False, ppq=PPQ, progress=None):
+    """Write an EventBuffer as a standard MIDI file.
+
+    Times convert to ticks at bpm in one vectorised pass. With
+    split_layers every overdub layer becomes its own track of a type 1
+    file after a tempo track, otherwise everything goes in one type 0
+    track. The end of track sits at the loop length, so the file loops
+    like the buffer did. progress(total, done) is called now and then.
+    The buffer is only read, pass a snapshot if it can still change.
+    """
+    total = len(buffer)
+    ticks = np.rint(seconds_to_ticks(np.frombuffer(buffer.times, dtype=np.float64), bpm, ppq)).astype(np.int64)
+    end_tick = int(round(float(seconds_to_ticks(buffer.duration, bpm, ppq))))
+    tempo = _meta(0, 0x51, bpm2tempo(bpm).to_bytes(3, 'big'))
+    time_signature = _meta(0, 0x58, bytes((4, 2, 24, 8)))
+
+    def report(done):
+        if progress is not None:
+            progress(total, done)
+
+    if split_layers:
+        layers = np.frombuffer(buffer.layers, dtype=np.uint16)
+        tracks = [tempo + time_signature + _meta(end_tick, 0x2F, b'')]
+        done = 0
+        for layer in np.unique(layers).tolist():
+            index = np.flatnonzero(layers == layer)
+            name = "Take" if layer == 0 else f"Overdub {layer}"
+            tracks.append(_event_track(ticks[index], [buffer.raw[i] for i in index.tolist()], end_tick, name,
+                                       lambda _, i, start=done: report(start + i)))
+            done += len(index)
+        midi_format = 1
+    else:
+        body = _event_track(ticks, buffer.raw, end_tick, "Loop", lambda _, i: report(i))
+        tracks = [tempo + time_signature + body]
+        midi_format = 0
+
+    # Write next to the target and rename, so a failed export never leaves half a file
+    temp_path = path + ".part"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(_chunk(b'MThd', struct.pack('>HHH', midi_format, len(tracks), ppq)))
+            for track in tracks:
+                f.write(_chunk(b'MTrk', track))
+        os.replace(temp_path, path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    report(total)
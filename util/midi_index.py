@@ -0,0 +1,155 @@
+import os
+import sqlite3
+
+import numpy as np
+
+from util.smf_reader import SmfFile
+
+MIDI_EXTENSIONS = ('.mid', '.midi')
+
+FIELDS = ('duration', 'bpm', 'tracks', 'notes', 'note_min', 'note_max', 'channels', 'error')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    duration REAL,
+    bpm REAL,
+    tracks INTEGER,
+    notes INTEGER,
+    note_min INTEGER,
+    note_max INTEGER,
+    channels INTEGER,
+    error TEXT
+)
+"""
+
+
+def analyze_file(path):
+    """Read one MIDI file and return its metadata as a dict.
+
+    channels is a 16-bit mask of the channels with channel messages.
+    Runs in worker processes, so it only takes and returns plain data.
+    """
+    record = dict.fromkeys(FIELDS)
+    record['mtime'] = 0.0
+    record['size'] = 0
+    try:
+        stat = os.stat(path)
+        record['mtime'] = stat.st_mtime
+        record['size'] = stat.st_size
+        with SmfFile(path) as smf:
+            events = smf.to_arrays()
+            # Length and tempo straight from the decoded columns, no second pass
+            end_tick = int(events.ticks[-1]) if len(events) else 0
+            record['duration'] = float(events.seconds[-1]) if len(events) else 0.0
+            record['bpm'] = smf.tempo_map().average_bpm(end_tick)
+            record['tracks'] = len(smf.tracks)
+        channel_mask = events.status < 0xF0
+        notes = ((events.status & 0xF0) == 0x90) & (events.data2 > 0)
+        record['notes'] = int(notes.sum())
+        if record['notes']:
+            record['note_min'] = int(events.data1[notes].min())
+            record['note_max'] = int(events.data1[notes].max())
+        channels = np.unique(events.status[channel_mask] & 0x0F)
+        record['channels'] = int(sum(1 << int(channel) for channel in channels))
+    except Exception as e:
+        record['error'] = str(e) or type(e).__name__
+    record['path'] = path
+    return record
+
+
+def channel_list(mask):
+    """Channels of a channel mask as a list of ints."""
+    return [channel for channel in range(16) if mask and mask & (1 << channel)]
+
+
+def iter_midi_files(root):
+    """Yield (path, mtime, size) of every MIDI file below root."""
+    stack = [root]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.lower().endswith(MIDI_EXTENSIONS):
+                        stat = entry.stat()
+                        yield entry.path, stat.st_mtime, stat.st_size
+                except OSError:
+                    continue
+
+
+class MidiIndex:
+    """On-disk SQLite metadata index keyed by path, mtime and size.
+
+    A connection belongs to the thread that created it, so open the index
+    on the thread that uses it.
+    """
+
+    def __init__(self, db_path):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(db_path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(SCHEMA)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def load_all(self):
+        """{path: record} for every indexed file."""
+        columns = ('path', 'mtime', 'size') + FIELDS
+        cursor = self.db.execute(f"SELECT {', '.join(columns)} FROM files")
+        return {row[0]: dict(zip(columns, row)) for row in cursor}
+
+    def is_current(self, path, mtime, size):
+        row = self.db.execute("SELECT mtime, size FROM files WHERE path = ?", (path,)).fetchone()
+        return row is not None and row[0] == mtime and row[1] == size
+
+    def store(self, records):
+        columns = ('path', 'mtime', 'size') + FIELDS
+        self.db.executemany(
+            f"INSERT OR REPLACE INTO files ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [tuple(record.get(column) for column in columns) for record in records])
+        self.db.commit()
+
+    def remove(self, paths):
+        self.db.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in paths])
+        self.db.commit()
+
+    def prune(self, root):
+        """Drop entries below root whose files no longer exist."""
+        prefix = os.path.join(root, '')
+        rows = self.db.execute("SELECT path FROM files WHERE substr(path, 1, ?) = ?", (len(prefix), prefix))
+        self.remove([path for path, in rows if not os.path.exists(path)])
+
+    def stale_files(self, root):
+        """Paths below root that are missing from the index or have changed."""
+        known = {path: (mtime, size) for path, mtime, size in
+                 self.db.execute("SELECT path, mtime, size FROM files")}
+        return [path for path, mtime, size in iter_midi_files(root)
+                if known.get(path) != (mtime, size)]
+
+
+def update_index(index, paths, pool, batch_size=64):
+    """Analyze paths in a process pool and store them; yields each record."""
+    batch = []
+    try:
+        for record in pool.map(analyze_file, paths, chunksize=16):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                index.store(batch)
+                batch = []
+            yield record
+    finally:
+        # Also when the caller stops early, keep what was analyzed
+        if batch:
+            index.store(batch)
@@ -0,0 +1,90 @@
+import threading
+import time
+
+import rtmidi
+
+from util.ring_buffer import RingBuffer
+from util.scheduler import LatenessStats
+
+
+class MidiInput:
+    """Callback-driven MIDI input with driver timestamps.
+
+    rtmidi calls back on its own thread as soon as a message arrives, so
+    nothing polls and recording costs next to no CPU. Each message is
+    stamped on the perf_counter_ns clock from rtmidi's driver delta times,
+    clamped to the arrival time, and the callback delay is kept in
+    self.latency. Events go into a preallocated ring buffer (seconds,
+    bytes) unless an on_event(stamp_ns, data) hook is given. Clock and
+    active sensing are filtered out unless ignore_timing is False.
+    """
+
+    def __init__(self, port_name=None, capacity=8192, on_event=None, ignore_timing=True):
+        self.port_name = port_name
+        self.ignore_timing = ignore_timing
+        self.ring = RingBuffer(capacity)
+        self.on_event = on_event
+        self.ready = threading.Event()
+        self.latency = LatenessStats()
+        self._midi_in = None
+        self._last_ns = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open(self):
+        """Open port_name, or the first input when it is None; IOError if there is no such port."""
+        midi_in = rtmidi.MidiIn()
+        try:
+            ports = midi_in.get_ports()
+            if not ports:
+                raise IOError("No MIDI input ports found")
+            if self.port_name is None:
+                index = 0
+            elif self.port_name in ports:
+                index = ports.index(self.port_name)
+            else:
+                raise IOError(f"MIDI input port not found: {self.port_name}")
+            # Clock and active sensing are not part of a take
+            midi_in.ignore_types(sysex=False, timing=self.ignore_timing, active_sense=self.ignore_timing)
+            self._last_ns = None
+            midi_in.set_callback(self._callback)
+            midi_in.open_port(index)
+        except Exception:
+            # Leave nothing half open behind
+            midi_in.cancel_callback()
+            midi_in.close_port()
+            raise
+        self._midi_in = midi_in
+        return self
+
+    def close(self):
+        if self._midi_in is not None:
+            self._midi_in.cancel_callback()
+            self._midi_in.close_port()
+            self._midi_in = None
+        self.ready.set()
+
+    def wait(self, timeout=None):
+        """Block until events are pending in the ring buffer (or timeout)."""
+        ready = self.ready.wait(timeout)
+        self.ready.clear()
+        return ready
+
+    def _callback(self, event, data=None):
+        message, delta = event
+        now = time.perf_counter_ns()
+        if self._last_ns is None:
+            stamp = now
+        else:
+            stamp = min(self._last_ns + int(delta * 1e9), now)
+        self._last_ns = stamp
+        self.latency.add(now - stamp)
+        if self.on_event is not None:
+            self.on_event(stamp, bytes(message))
+        else:
+            self.ring.push(stamp / 1e9, bytes(message))
+            self.ready.set()
@@ -0,0 +1,206 @@
+import json
+import os
+import sys
+import threading
+import time
+
+import mido
+
+from util.capture import CaptureWriter
+from util.midi_input import MidiInput
+from util.ring_buffer import RingBuffer
+
+FLUSH_INTERVAL = 0.05  # Seconds between writer passes
+REPORT_INTERVAL = 5.0  # Seconds between drop reports
+
+
+class TextLog:
+    """Human readable "[port] message" lines, written a batch at a time."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def start(self, port_names):
+        self.port_names = port_names
+
+    def write(self, events):
+        lines = []
+        for stamp_ns, port, data in events:
+            try:
+                text = str(mido.Message.from_bytes(data))
+            except ValueError:
+                text = data.hex(' ')
+            lines.append(f"[{self.port_names[port]}] {text}\n")
+        self.stream.write("".join(lines))
+        self.stream.flush()
+
+    def close(self):
+        self.stream.flush()
+
+
+class RotatingLog:
+    """Base for logs that move on to a fresh file after max_bytes.
+
+    The full file is renamed to path.1 (older ones shift up to
+    path.<backups>) and a new one is started at path.
+    """
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, backups=5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.stream = None
+        self.size = 0
+
+    def start(self, port_names):
+        self.port_names = port_names
+        self._open()
+
+    def _shift(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def _rotate(self):
+        self.stream.close()
+        self._shift()
+        self._open()
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+
+class JsonlLog(RotatingLog):
+    """Rotating JSONL log, one {"t": ns, "p": port, "d": hex} line per message.
+
+    Every file starts with a {"ports": [...]} header so it can be read on
+    its own. An existing log is appended to.
+    """
+
+    def _open(self):
+        self.stream = open(self.path, 'a', encoding='utf-8')
+        self.size = self.stream.tell()
+        if self.size == 0:
+            header = json.dumps({"ports": self.port_names, "start_ns": time.perf_counter_ns()}) + "\n"
+            self.stream.write(header)
+            self.size = len(header)
+
+    def write(self, events):
+        chunk = "".join(f'{{"t":{stamp_ns},"p":{port},"d":"{data.hex()}"}}\n'
+                        for stamp_ns, port, data in events)
+        self.stream.write(chunk)
+        self.size += len(chunk)
+        if self.size >= self.max_bytes:
+            self._rotate()
+
+
+class CaptureLog(RotatingLog):
+    """Rotating binary capture (see util.capture), replayable with midi_replay.py.
+
+    Capture files cannot be appended to, so an existing one is rotated
+    away on start.
+    """
+
+    def _open(self):
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            self._shift()
+        self.stream = CaptureWriter(self.path, self.port_names)
+
+    def write(self, events):
+        for stamp_ns, port, data in events:
+            self.stream.write(stamp_ns, port, data)
+        self.stream.flush()
+        if self.stream.size >= self.max_bytes:
+            self._rotate()
+
+
+class MidiLogger:
+    """Logs every input port through one background writer.
+
+    rtmidi calls back on its own threads; each callback only stamps the
+    message (perf_counter_ns) and pushes it into that port's ring buffer.
+    The writer thread wakes every flush_interval, merges what all the
+    rings hold in time order and hands it to the log as one batch, so a
+    slow terminal or disk never blocks the callbacks. When the writer
+    falls behind, full rings drop new messages and the drops are counted
+    and reported instead of piling up in memory.
+    """
+
+    def __init__(self, log, port_names=None, capacity=65536, ignore_timing=False,
+                 flush_interval=FLUSH_INTERVAL, report_interval=REPORT_INTERVAL):
+        self.log = log
+        self.port_names = list(port_names if port_names is not None else mido.get_input_names())
+        self.capacity = capacity
+        self.ignore_timing = ignore_timing
+        self.flush_interval = flush_interval
+        self.report_interval = report_interval
+        self.inputs = []
+        self.rings = []
+        self.logged = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @property
+    def dropped(self):
+        return [ring.dropped for ring in self.rings]
+
+    def start(self):
+        self.stop_event.clear()
+        self.log.start(self.port_names)
+        for port, name in enumerate(self.port_names):
+            ring = RingBuffer(self.capacity)
+            midi_input = MidiInput(name, on_event=self._make_callback(ring), ignore_timing=self.ignore_timing)
+            try:
+                midi_input.open()
+            except Exception as e:
+                print(f"Error on {name}: {e}")
+            self.rings.append(ring)
+            self.inputs.append(midi_input)
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        for midi_input in self.inputs:
+            midi_input.close()
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.log.close()
+
+    @staticmethod
+    def _make_callback(ring):
+        def on_event(stamp_ns, data):
+            ring.push(stamp_ns, data)
+        return on_event
+
+    def _drain(self):
+        events = []
+        for port, ring in enumerate(self.rings):
+            events.extend((int(stamp), port, data) for stamp, data in ring.drain())
+        if events:
+            events.sort(key=lambda event: event[0])
+            self.log.write(events)
+            self.logged += len(events)
+
+    def _write_loop(self):
+        reported = [0] * len(self.rings)
+        next_report = time.perf_counter() + self.report_interval
+        while not self.stop_event.wait(self.flush_interval):
+            self._drain()
+            now = time.perf_counter()
+            if now >= next_report:
+                next_report = now + self.report_interval
+                dropped = self.dropped
+                for port, count in enumerate(dropped):
+                    if count > reported[port]:
+                        print(f"[{self.port_names[port]}] dropped {count - reported[port]} messages "
+                              f"({count} total), log cannot keep up", file=sys.stderr)
+                reported = dropped
+        self._drain()
@@ -0,0 +1,114 @@
+import itertools
+import queue
+import threading
+
+import mido
+
+from util.event_buffer import send_raw
+
+PANIC, NORMAL, CLOSE = 0, 1, 2  # Queue priorities, lowest goes first
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_output_service():
+    """The process-wide OutputService, created on first use."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = OutputService()
+        return _service
+
+
+def panic_messages():
+    """All notes off (CC123) on every channel."""
+    return tuple(bytes((0xB0 | channel, 123, 0)) for channel in range(16))
+
+
+class OutputService:
+    """One open port per device and a single thread that writes to them.
+
+    Any thread can send raw MIDI bytes; they go through a priority queue
+    to the dispatcher thread, so ports are never written concurrently.
+    Panic messages jump the queue and drop whatever normal messages were
+    still waiting for that port. Everything waiting when the dispatcher
+    wakes up is written in one batch.
+    """
+
+    def __init__(self):
+        self.ports = {}
+        self.queue = queue.PriorityQueue()
+        self.sent = 0
+        self.batches = 0
+        self._sequence = itertools.count()
+        self._open_lock = threading.Lock()
+        self._default_name = None
+        self.thread = threading.Thread(target=self._dispatch, daemon=True)
+        self.thread.start()
+
+    def resolve(self, port_name=None):
+        """Port name used for port_name; None means the first output."""
+        if port_name is None:
+            if self._default_name is None:
+                names = mido.get_output_names()
+                self._default_name = names[0] if names else ''
+            return self._default_name or None
+        return port_name
+
+    def open(self, port_name=None):
+        """Open a port ahead of time so the first send does not pay for it."""
+        port_name = self.resolve(port_name)
+        with self._open_lock:
+            port = self.ports.get(port_name)
+            if port is None:
+                port = mido.open_output(port_name)
+                self.ports[port_name] = port
+            return port
+
+    def send(self, data, port_name=None, priority=NORMAL):
+        self.queue.put((priority, next(self._sequence), port_name, (data,)))
+
+    def send_many(self, messages, port_name=None, priority=NORMAL):
+        """Queue several messages that are written back to back."""
+        self.queue.put((priority, next(self._sequence), port_name, tuple(messages)))
+
+    def panic(self, port_name=None):
+        self.queue.put((PANIC, next(self._sequence), port_name, panic_messages()))
+
+    def close(self):
+        """Write what is queued, then close every port."""
+        self.queue.put((CLOSE, next(self._sequence), None, None))
+        self.thread.join()
+
+    def _dispatch(self):
+        while True:
+            items = [self.queue.get()]
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            items.sort()
+
+            panics = {}
+            for priority, sequence, port_name, _ in items:
+                if priority == PANIC:
+                    panics[self.resolve(port_name)] = sequence
+            for priority, sequence, port_name, messages in items:
+                if priority == CLOSE:
+                    for port in self.ports.values():
+                        port.close()
+                    self.ports.clear()
+                    return
+                name = self.resolve(port_name)
+                if priority == NORMAL and sequence < panics.get(name, -1):
+                    continue  # Queued before a panic on this port
+                try:
+                    port = self.open(name)
+                    for data in messages:
+                        send_raw(port, data)
+                    self.sent += len(messages)
+                except Exception as e:
+                    print(f"Error sending MIDI to {name}: {e}")
+            self.batches += 1
@@ -0,0 +1,46 @@
+import numpy as np
+
+NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+
+def midi_note_to_name(note_number):
+    """Convert MIDI note number to note name."""
+    octave = (note_number // 12) - 1
+    note = NOTE_NAMES[note_number % 12]
+    return f"{note}{octave}"
+
+
+def _rank_within(keys):
+    """For each element, how many earlier elements share its key."""
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    ranks = np.empty(len(keys), dtype=np.int64)
+    ranks[order] = np.arange(len(keys)) - np.searchsorted(sorted_keys, sorted_keys, side='left')
+    return ranks
+
+
+def pair_notes(status, data1, data2):
+    """Match note-offs to note-ons in time-sorted event columns.
+
+    Returns (on_index, off_index): the index of every note-on, and of the
+    note-off that ends it or -1 if it never ends. The k-th note-off of a
+    (channel, note) closes its k-th note-on; a note-on with velocity 0
+    counts as a note-off.
+    """
+    status = np.asarray(status, dtype=np.int64)
+    data1 = np.asarray(data1, dtype=np.int64)
+    data2 = np.asarray(data2, dtype=np.int64)
+    kind = status & 0xF0
+    on_index = np.flatnonzero((kind == 0x90) & (data2 > 0))
+    off_index = np.flatnonzero((kind == 0x80) | ((kind == 0x90) & (data2 == 0)))
+    partner = np.full(len(on_index), -1, dtype=np.int64)
+    if len(on_index) and len(off_index):
+        keys = (status & 0x0F) * 128 + data1
+        stride = len(status) + 1
+        on_ids = keys[on_index] * stride + _rank_within(keys[on_index])
+        off_ids = keys[off_index] * stride + _rank_within(keys[off_index])
+        order = np.argsort(on_ids)
+        position = np.minimum(np.searchsorted(on_ids[order], off_ids), len(on_ids) - 1)
+        paired = on_ids[order][position] == off_ids
+        partner[order[position[paired]]] = off_index[paired]
+    return on_index, partner
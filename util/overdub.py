@@ -0,0 +1,83 @@
+import threading
+import time
+
+from util.ring_buffer import RingBuffer
+
+MERGE_INTERVAL = 0.02  # Seconds to collect captured events before merging
+
+
+class OverdubEngine:
+    """Captures events into a playing loop as a new, undoable layer.
+
+    The capture side only pushes (loop phase, bytes) into a lock-free
+    ring buffer. A merge thread drains it, merges the new events into a
+    copy of the loop buffer and hands the result to publish(), so the
+    playback thread never waits on a merge.
+    """
+
+    def __init__(self, capacity=4096):
+        self.ring = RingBuffer(capacity)
+        self.layer = None
+        self.wake = threading.Event()
+        self.active = False
+        self.thread = None
+        self._stop = None
+
+    def start(self, buffer, get_buffer, publish):
+        """Begin a new layer on top of buffer and start the merge thread."""
+        self.stop()  # The ring has a single consumer, never two merge threads
+        self.layer = buffer.layer_count
+        self.ring.drain()
+        self._stop = threading.Event()  # One per session, a quick restart cannot revive the old thread
+        self.active = True
+        self.thread = threading.Thread(target=self._merge_loop, args=(self._stop, get_buffer, publish), daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=1.0):
+        """Stop capturing and wait for the last merge."""
+        self.active = False
+        if self._stop is not None:
+            self._stop.set()
+        self.wake.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+            if self.thread.is_alive():
+                print("Overdub merge thread did not stop in time")
+            self.thread = None
+
+    def capture(self, phase, data):
+        """Called from the input thread with the loop phase in seconds."""
+        if self.active:
+            self.ring.push(phase, data)
+            self.wake.set()
+
+    def merge(self, buffer):
+        """Merge everything captured so far into buffer, or None if nothing was."""
+        events = self.ring.drain()
+        if not events:
+            return None
+        events.sort(key=lambda event: event[0])  # only the few new events
+        return buffer.merged([t for t, _ in events], [d for _, d in events], self.layer)
+
+    def _merge_loop(self, stop, get_buffer, publish):
+        while not stop.is_set():
+            self.wake.wait()
+            self.wake.clear()
+            if stop.is_set():
+                break
+            # Let a burst of notes collect so it becomes one merge
+            time.sleep(MERGE_INTERVAL)
+            merged = self.merge(get_buffer())
+            if merged is not None:
+                publish(merged)
+        merged = self.merge(get_buffer())
+        if merged is not None:
+            publish(merged)
+
+
+def undo_layer(buffer):
+    """Return buffer without its most recent overdub layer (never the base take)."""
+    layer = buffer.layer_count - 1
+    if layer <= 0:
+        return None
+    return buffer.without_layer(layer)
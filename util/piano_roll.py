@@ -0,0 +1,129 @@
+import numpy as np
+
+from util.notes import pair_notes
+
+BACKGROUND = 0xFF202020
+BLACK_KEY_ROW = 0xFF181818
+BLACK_KEYS = {1, 3, 6, 8, 10}
+LONG_BUCKETS = 64
+
+
+class NoteRects:
+    """Notes as rectangles (start, end in seconds, pitch), paired once.
+
+    Notes are also filed into fixed-width time buckets, a simple spatial
+    index: query() only looks at the buckets a time window touches, so
+    its cost follows the number of notes on screen, not in the file.
+    Notes longer than LONG_BUCKETS buckets (drones, stuck notes) are kept
+    in a short side list instead, so they cannot blow up the index.
+    """
+
+    def __init__(self, starts, ends, pitches, velocities, duration=None, buckets=4096):
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.maximum(np.asarray(ends, dtype=np.float64), self.starts)
+        self.pitches = np.asarray(pitches, dtype=np.int64)
+        self.velocities = np.asarray(velocities, dtype=np.int64)
+        if duration is None:
+            duration = float(self.ends.max()) if len(self.ends) else 0.0
+        self.duration = duration
+        self.bucket_seconds = max(duration / buckets, 0.05)
+
+        first = (self.starts / self.bucket_seconds).astype(np.int64)
+        last = (self.ends / self.bucket_seconds).astype(np.int64)
+        spans = last - first + 1
+        long = spans > LONG_BUCKETS
+        self._long = np.flatnonzero(long)
+        spans[long] = 0
+        notes = np.repeat(np.arange(len(self.starts)), spans)
+        # Bucket of every (note, bucket) pair: first bucket plus the offset inside the run
+        run_starts = np.repeat(np.cumsum(spans) - spans, spans)
+        bucket = np.repeat(first, spans) + (np.arange(len(notes)) - run_starts)
+        order = np.argsort(bucket, kind='stable')
+        self._bucket = bucket[order]
+        self._notes = notes[order]
+
+    def __len__(self):
+        return len(self.starts)
+
+    @classmethod
+    def from_events(cls, times, status, data1, data2, duration=None):
+        """Pair note-ons with their note-offs.
+
+        A note that is never switched off lasts until the next note-on of
+        the same key, or until duration.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        on_index, off_index = pair_notes(status, data1, data2)
+        end_time = duration if duration is not None else (float(times[-1]) if len(times) else 0.0)
+        ends = np.where(off_index >= 0, times[np.maximum(off_index, 0)], end_time)
+        unfinished = off_index < 0
+        if unfinished.any():
+            keys = (np.asarray(status, dtype=np.int64)[on_index] & 0x0F) * 128 + np.asarray(data1, dtype=np.int64)[on_index]
+            order = np.argsort(keys, kind='stable')
+            retrigger = np.full(len(on_index), end_time)
+            same_key = keys[order][1:] == keys[order][:-1]
+            retrigger[order[:-1][same_key]] = times[on_index[order[1:][same_key]]]
+            ends[unfinished] = retrigger[unfinished]
+        return cls(times[on_index], ends, np.asarray(data1)[on_index], np.asarray(data2)[on_index], duration)
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """Notes of an EventBuffer (the recorded loop)."""
+        # Copies, a view would stop the recording thread from growing the arrays
+        return cls.from_events(
+            np.array(buffer.times, dtype=np.float64),
+            np.array(buffer.status, dtype=np.uint8),
+            np.array(buffer.data1, dtype=np.uint8),
+            np.array(buffer.data2, dtype=np.uint8),
+            buffer.duration)
+
+    @property
+    def pitch_range(self):
+        if not len(self.pitches):
+            return 48, 72
+        return int(self.pitches.min()), int(self.pitches.max())
+
+    def query(self, start, end):
+        """Indices of the notes overlapping [start, end) seconds."""
+        low = np.searchsorted(self._bucket, int(start / self.bucket_seconds), side='left')
+        high = np.searchsorted(self._bucket, int(end / self.bucket_seconds), side='right')
+        if high - low > len(self.starts):
+            # Zoomed far out: one pass over every note beats deduplicating buckets
+            return np.flatnonzero((self.starts < end) & (self.ends > start))
+        index = np.union1d(self._notes[low:high], self._long)
+        return index[(self.starts[index] < end) & (self.ends[index] > start)]
+
+
+def render_tile(rects, start, end, width, low_pitch, high_pitch, color=(80, 200, 120)):
+    """ARGB32 pixels (one row per pitch, highest first) for [start, end) seconds.
+
+    Coverage is summed with a +1/-1 difference per note and a cumulative
+    sum along time, so the cost is the same for one note or thousands
+    per pixel. Where notes overlap the brightness follows their mean
+    velocity.
+    """
+    rows = high_pitch - low_pitch + 1
+    pixels = np.full((rows, width), BACKGROUND, dtype=np.uint32)
+    black = np.array([(high_pitch - row) % 12 in BLACK_KEYS for row in range(rows)])
+    pixels[black] = BLACK_KEY_ROW
+
+    index = rects.query(start, end)
+    if len(index):
+        scale = width / (end - start)
+        x0 = np.clip(np.floor((rects.starts[index] - start) * scale), 0, width).astype(np.int64)
+        x1 = np.clip(np.ceil((rects.ends[index] - start) * scale), 0, width).astype(np.int64)
+        x1 = np.maximum(x1, np.minimum(x0 + 1, width))  # Short notes still get a pixel
+        row = high_pitch - np.clip(rects.pitches[index], low_pitch, high_pitch)
+        size = rows * (width + 1)
+        start_cells = row * (width + 1) + x0
+        end_cells = row * (width + 1) + x1
+        velocity = rects.velocities[index].astype(np.float64)
+        count = (np.bincount(start_cells, minlength=size) - np.bincount(end_cells, minlength=size))
+        level = (np.bincount(start_cells, velocity, minlength=size) - np.bincount(end_cells, velocity, minlength=size))
+        count = np.cumsum(count.reshape(rows, width + 1), axis=1)[:, :width]
+        level = np.cumsum(level.reshape(rows, width + 1), axis=1)[:, :width]
+        on = count > 0
+        brightness = 0.35 + 0.65 * (level[on] / count[on] / 127)
+        red, green, blue = (np.clip(channel * brightness, 0, 255).astype(np.uint32) for channel in color)
+        pixels[on] = 0xFF000000 | (red << 16) | (green << 8) | blue
+    return pixels
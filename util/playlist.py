@@ -0,0 +1,253 @@
+from bisect import bisect_right
+import queue
+import threading
+
+import numpy as np
+
+from util.file_player import FileTimeline
+
+FADE_STEP = 0.05  # Seconds between CC7 steps of a fade
+DEFAULT_VOLUME = 100  # GM channel volume when a file sets none
+
+
+def with_fades(timeline, fade_in=0.0, fade_out=0.0, step=FADE_STEP):
+    """Copy of timeline with CC7 ramps over its first fade_in and last fade_out seconds.
+
+    Ramps go to every channel the file uses and follow the file's own
+    volume changes, which are scaled by the fade too.
+    """
+    length = timeline.length
+    fade_in = min(max(fade_in, 0.0), length / 2)
+    fade_out = min(max(fade_out, 0.0), length / 2)
+    if fade_in <= 0 and fade_out <= 0:
+        return timeline
+
+    def gain(t):
+        g = np.ones_like(t)
+        if fade_in > 0:
+            g = np.minimum(g, t / fade_in)
+        if fade_out > 0:
+            g = np.minimum(g, (length - t) / fade_out)
+        return np.clip(g, 0.0, 1.0)
+
+    payloads = list(timeline.payloads)
+    channels = set()
+    volumes = {}  # channel -> ([seconds], [value]) of the file's own CC7
+    for i, data in enumerate(payloads):
+        if data[0] >= 0xF0:
+            continue
+        channel = data[0] & 0x0F
+        channels.add(channel)
+        if data[0] & 0xF0 == 0xB0 and data[1] == 7:
+            t = timeline.seconds[i]
+            times, values = volumes.setdefault(channel, ([], []))
+            times.append(t)
+            values.append(data[2])
+            payloads[i] = bytes((data[0], 7, int(round(data[2] * gain(np.array([t]))[0]))))
+
+    ramp = np.concatenate([np.arange(0.0, fade_in, step), [fade_in],
+                           np.arange(length - fade_out, length, step), [length]])
+    ramp_gain = gain(ramp)
+    ramp_times = []
+    for channel in sorted(channels):
+        times, values = volumes.get(channel, ([], []))
+        for t, g in zip(ramp, ramp_gain):
+            i = bisect_right(times, t) - 1
+            base = values[i] if i >= 0 else DEFAULT_VOLUME
+            ramp_times.append(t)
+            payloads.append(bytes((0xB0 | channel, 7, int(round(base * g)))))
+
+    # Ramp steps first, so they go out before notes at the same time
+    count = len(timeline.payloads)
+    payloads = payloads[count:] + payloads[:count]
+    seconds = np.concatenate([ramp_times, timeline.seconds])
+    ticks = np.concatenate([np.rint(timeline.tempo_map.seconds_to_ticks(ramp_times)).astype(np.int64), timeline.ticks])
+    order = np.argsort(seconds, kind='stable')
+    return FileTimeline(seconds[order], ticks[order], [payloads[i] for i in order],
+                        timeline.tempo_map, timeline.end_tick, timeline.signatures)
+
+
+class Playlist:
+    """Queue of MIDI files played back to back through one FilePlayer.
+
+    Two threads live as long as the playlist: the player thread, which
+    runs FilePlayer.run() and idles between plays, and a prefetch thread
+    that loads the next file into a FileTimeline while the current one
+    plays. When the last event of a file is sent the player chains the
+    prefetched timeline onto the same clock, so the next file starts
+    exactly at the end of the previous one. With crossfade > 0 every file
+    fades out over its last and in over its first crossfade seconds with
+    CC7; everything plays on one channel, so the fades follow each other
+    rather than overlap. on_track(index, timeline) is called from the
+    player thread when a file starts. Files that fail to load are
+    skipped.
+    """
+
+    def __init__(self, player, crossfade=0.0, repeat=True, on_track=None, progress=None):
+        self.player = player
+        self.crossfade = crossfade
+        self.repeat = repeat
+        self.on_track = on_track
+        self.progress = progress
+        self.paths = []
+        self.current = -1
+        self._lock = threading.Condition()
+        self._loaded = {}  # path -> FileTimeline, or the exception loading it raised
+        self._upcoming = None  # (index, timeline) handed to the player, not started yet
+        self._requests = queue.Queue()
+        self._start = None  # (index, stop Event) play() asked for
+        self._idle = threading.Event()
+        self._idle.set()
+        self._stop = threading.Event()  # Of the latest run; every run gets its own, a stopped run stays stopped
+        self._closed = False
+        self._play_thread = threading.Thread(target=self._play_loop, daemon=True)
+        self._prefetch_thread = threading.Thread(target=self._prefetch_loop, daemon=True)
+        self._play_thread.start()
+        self._prefetch_thread.start()
+
+    @property
+    def playing(self):
+        return not self._idle.is_set()
+
+    def set_paths(self, paths):
+        with self._lock:
+            self.paths = list(paths)
+            # Give files that failed before another chance
+            for path in [path for path, result in self._loaded.items() if isinstance(result, Exception)]:
+                del self._loaded[path]
+
+    def set_crossfade(self, seconds):
+        """Fade length for files loaded from now on; drops the ones loaded with the old one."""
+        with self._lock:
+            if seconds != self.crossfade:
+                self.crossfade = seconds
+                for path in [path for path, result in self._loaded.items() if isinstance(result, FileTimeline)]:
+                    del self._loaded[path]
+
+    def play(self, index=0):
+        """Start (or restart) playing from index."""
+        self.stop()
+        with self._lock:
+            if not self.paths:
+                return
+            index = index % len(self.paths)
+            self._stop = threading.Event()
+            self._start = (index, self._stop)
+            self._idle.clear()
+            self._lock.notify_all()
+        self._prefetch(self.paths[index])
+
+    def skip(self, step=1):
+        if self.current >= 0:
+            self.play(self.current + step)
+
+    def stop(self):
+        with self._lock:
+            self._stop.set()
+            self._lock.notify_all()  # Wake a run waiting for its file in _take()
+        self.player.stop()
+        self._idle.wait(1.0)
+
+    def close(self):
+        self.stop()
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+        self._requests.put(None)
+
+    def _prefetch(self, path):
+        with self._lock:
+            if path in self._loaded:
+                return
+            self._loaded[path] = None  # Pending
+        self._requests.put(path)
+
+    def _prefetch_loop(self):
+        while True:
+            path = self._requests.get()
+            if path is None:
+                return
+            try:
+                result = FileTimeline.from_file(path)
+                if self.crossfade > 0:
+                    result = with_fades(result, self.crossfade, self.crossfade)
+            except Exception as e:
+                print(f"Error loading {path}: {e}")
+                result = e
+            with self._lock:
+                if path in self._loaded:
+                    self._loaded[path] = result
+                self._lock.notify_all()
+
+    def _take(self, index, stop):
+        """Timeline of paths[index], waiting for the prefetch; None if it failed or the run stopped."""
+        path = self.paths[index]
+        self._prefetch(path)
+        with self._lock:
+            while (self._loaded.get(path) is None and path in self._loaded
+                   and not self._closed and not stop.is_set()):
+                self._lock.wait()
+            result = self._loaded.get(path)
+        return result if isinstance(result, FileTimeline) and not stop.is_set() else None
+
+    def _advance(self, index, stop):
+        """(index, timeline) of the first file from index on that loads, or (None, None)."""
+        for _ in range(len(self.paths)):
+            if stop.is_set():
+                break
+            if index >= len(self.paths):
+                if not self.repeat:
+                    return None, None
+                index = 0
+            timeline = self._take(index, stop)
+            if timeline is not None:
+                return index, timeline
+            index += 1
+        return None, None
+
+    def _started(self, index, timeline):
+        self.current = index
+        with self._lock:
+            # Keep only what is playing, what comes next and the failures
+            following = self.paths[(index + 1) % len(self.paths)] if self.repeat or index + 1 < len(self.paths) else None
+            keep = {self.paths[index], following}
+            for path in [path for path, result in self._loaded.items()
+                         if path not in keep and not isinstance(result, Exception)]:
+                del self._loaded[path]
+        if following is not None:
+            self._prefetch(following)
+        if self.on_track is not None:
+            self.on_track(index, timeline)
+
+    def _next_timeline(self, stop):
+        index, timeline = self._advance(self.current + 1, stop)
+        self._upcoming = (index, timeline)
+        return timeline
+
+    def _chained(self, timeline):
+        index, _ = self._upcoming
+        self._upcoming = None
+        self._started(index, timeline)
+
+    def _play_loop(self):
+        while True:
+            with self._lock:
+                while self._start is None and not self._closed:
+                    self._lock.wait()
+                if self._closed:
+                    return
+                (start, stop), self._start = self._start, None
+            try:
+                index, timeline = self._advance(start, stop)
+                if timeline is not None:
+                    self._started(index, timeline)
+                    self.player.run(timeline, loop=False, progress=self.progress,
+                                    next_timeline=lambda: self._next_timeline(stop),
+                                    started=self._chained, stop_event=stop)
+            except Exception as e:
+                print(f"Error in playlist: {e}")
+            finally:
+                self.current = -1
+                with self._lock:
+                    if self._start is None:
+                        self._idle.set()
@@ -0,0 +1,108 @@
+from array import array
+
+import numpy as np
+
+from util.event_buffer import EventBuffer
+from util.notes import pair_notes
+
+PPQ = 480
+
+# Grid sizes in beats
+GRIDS = {
+    "1/4": 1.0,
+    "1/8": 0.5,
+    "1/8T": 1 / 3,
+    "1/16": 0.25,
+    "1/16T": 1 / 6,
+    "1/32": 0.125,
+}
+
+
+class QuantizeSettings:
+    """How to quantize a take.
+
+    grid is in beats, strength pulls notes that fraction of the way to the
+    grid (0-1), swing delays every second grid line by that fraction of a
+    grid step (0-0.5) and humanize adds random timing with that standard
+    deviation in milliseconds. The same seed gives the same humanize, so
+    changing the other settings does not reshuffle it.
+    """
+
+    def __init__(self, grid=0.25, strength=1.0, swing=0.0, humanize_ms=0.0, seed=0):
+        self.grid = grid
+        self.strength = strength
+        self.swing = swing
+        self.humanize_ms = humanize_ms
+        self.seed = seed
+
+
+def seconds_to_ticks(times, bpm, ppq=PPQ):
+    return np.asarray(times, dtype=np.float64) * (bpm / 60.0 * ppq)
+
+
+def ticks_to_seconds(ticks, bpm, ppq=PPQ):
+    return np.asarray(ticks, dtype=np.float64) / (bpm / 60.0 * ppq)
+
+
+def quantize_ticks(ticks, status, data1, data2, grid_ticks, strength=1.0, swing=0.0, humanize_ticks=0.0, rng=None):
+    """New tick times for a time-sorted take.
+
+    Note-ons move towards the (swung) grid; each note-off moves by the
+    same amount as its note-on so note lengths are kept. Other events
+    stay where they are.
+    """
+    ticks = np.asarray(ticks, dtype=np.float64)
+    on_index, off_index = pair_notes(status, data1, data2)
+
+    grid_line = np.rint(ticks[on_index] / grid_ticks)
+    target = (grid_line + np.where(grid_line % 2 == 1, swing, 0.0)) * grid_ticks
+    shift = strength * (target - ticks[on_index])
+    if humanize_ticks > 0:
+        rng = rng or np.random.default_rng()
+        shift += rng.normal(0.0, humanize_ticks, len(on_index))
+
+    shifts = np.zeros(len(ticks))
+    shifts[on_index] = shift
+    paired = off_index >= 0
+    shifts[off_index[paired]] = shift[paired]
+    return ticks + shifts
+
+
+def _reordered(column, dtype, order):
+    return array(column.typecode, np.frombuffer(column, dtype=dtype)[order].tobytes())
+
+
+def quantize_buffer(buffer, bpm, settings, ppq=PPQ):
+    """Quantized copy of an EventBuffer; the original is left untouched.
+
+    The loop length stays the same and events pushed past either end of
+    the loop wrap around to the other end.
+    """
+    if not buffer:
+        return buffer
+    length = buffer.duration
+    ticks = seconds_to_ticks(np.frombuffer(buffer.times, dtype=np.float64), bpm, ppq)
+    rng = np.random.default_rng(settings.seed)
+    humanize_ticks = seconds_to_ticks(settings.humanize_ms / 1000.0, bpm, ppq)
+    new_ticks = quantize_ticks(
+        ticks,
+        np.frombuffer(buffer.status, dtype=np.uint8),
+        np.frombuffer(buffer.data1, dtype=np.uint8),
+        np.frombuffer(buffer.data2, dtype=np.uint8),
+        settings.grid * ppq, settings.strength, settings.swing, float(humanize_ticks), rng)
+    times = ticks_to_seconds(new_ticks, bpm, ppq)
+    if length > 0:
+        times = np.where(times > length, times - length, times)
+        times = np.where(times < 0, times + length, times)
+        times = np.clip(times, 0.0, length)
+    order = np.argsort(times, kind='stable')
+
+    out = EventBuffer()
+    out.length = length
+    out.times = array('d', times[order].tobytes())
+    out.status = _reordered(buffer.status, np.uint8, order)
+    out.data1 = _reordered(buffer.data1, np.uint8, order)
+    out.data2 = _reordered(buffer.data2, np.uint8, order)
+    out.layers = _reordered(buffer.layers, np.uint16, order)
+    out.raw = [buffer.raw[i] for i in order.tolist()]
+    return out
@@ -0,0 +1,44 @@
+from array import array
+
+
+class RingBuffer:
+    """Preallocated single-producer/single-consumer ring of (time, bytes) events.
+
+    No locks: only the producer moves head and only the consumer moves
+    tail, so one capture thread can push while another thread drains.
+    When full, new events are dropped and counted instead of blocking.
+    """
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.times = array('d', bytes(8 * capacity))
+        self.data = [b''] * capacity
+        self.head = 0  # next slot to write, producer only
+        self.tail = 0  # next slot to read, consumer only
+        self.dropped = 0
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def push(self, time, data):
+        head = self.head
+        if head - self.tail >= self.capacity:
+            self.dropped += 1
+            return False
+        index = head % self.capacity
+        self.times[index] = time
+        self.data[index] = data
+        self.head = head + 1
+        return True
+
+    def drain(self):
+        """Remove and return all pending events as a list of (time, bytes)."""
+        head = self.head
+        tail = self.tail
+        events = []
+        for position in range(tail, head):
+            index = position % self.capacity
+            events.append((self.times[index], self.data[index]))
+            self.data[index] = b''
+        self.tail = head
+        return events
@@ -0,0 +1,162 @@
+import collections
+import hashlib
+import os
+import struct
+
+import numpy as np
+
+from util.sample_engine import CHANNELS, RATE, Sample, load_wav
+
+MMAP_THRESHOLD = 32 * 1024 * 1024  # Map WAVs at least this big instead of loading them
+
+
+def file_digest(path):
+    """blake2b of the file contents, read in 1 MB blocks."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def wav_layout(path):
+    """(format tag, channels, rate, bits, data offset, data size) from the RIFF chunks."""
+    with open(path, 'rb') as f:
+        riff, _, kind = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or kind != b'WAVE':
+            raise ValueError(f"{path} is not a WAV file")
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk_id, size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                fmt = struct.unpack('<HHIIHH', f.read(16))
+                f.seek(size - 16 + (size & 1), 1)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise ValueError(f"{path} has data before fmt")
+                tag, channels, rate, _, _, bits = fmt
+                return tag, channels, rate, bits, f.tell(), size
+            else:
+                f.seek(size + (size & 1), 1)
+
+
+def map_wav(path, rate=RATE, channels=CHANNELS):
+    """Memory-map a WAV that is already in the engine's rate and channel count.
+
+    Returns None when the file would need converting. Only pages that
+    are played get read, and the OS can drop them again under pressure.
+    """
+    tag, file_channels, file_rate, bits, offset, size = wav_layout(path)
+    if file_channels != channels or file_rate != rate:
+        return None
+    if tag == 1 and bits == 16:
+        dtype, scale = '<i2', 1 / 32768
+    elif tag == 3 and bits == 32:
+        dtype, scale = '<f4', 1.0
+    else:
+        return None
+    frames = size // (2 * channels) if bits == 16 else size // (4 * channels)
+    data = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(frames, channels))
+    return Sample(data, rate, path, scale)
+
+
+class SampleCache:
+    """Decoded samples keyed by content hash, bounded by a byte budget.
+
+    The same file (or a copy of it) on several pads is held once.
+    acquire() pins a sample while a pad uses it; release() unpins it and
+    unpinned samples stay cached until the least recently used ones have
+    to go to keep the decoded bytes within budget. Pinned samples are
+    never evicted, even over budget. Files of at least mmap_threshold
+    bytes are memory-mapped instead of decoded when their format allows,
+    and do not count towards the budget.
+    """
+
+    def __init__(self, budget_bytes=256 * 1024 * 1024, mmap_threshold=MMAP_THRESHOLD, rate=RATE, channels=CHANNELS):
+        self.budget_bytes = budget_bytes
+        self.mmap_threshold = mmap_threshold
+        self.rate = rate
+        self.channels = channels
+        self.entries = collections.OrderedDict()  # digest -> Sample, least recently used first
+        self.pins = collections.Counter()
+        self.bytes = 0
+        self.mapped_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._digests = {}  # (path, mtime, size) -> digest, to skip rehashing
+
+    def _digest(self, path):
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        digest = self._digests.get(key)
+        if digest is None:
+            digest = file_digest(path)
+            self._digests[key] = digest
+        return digest, stat.st_size
+
+    def acquire(self, path):
+        """The Sample for a WAV file, pinned until release()d."""
+        digest, size = self._digest(path)
+        sample = self.entries.get(digest)
+        if sample is not None:
+            self.hits += 1
+            self.entries.move_to_end(digest)
+        else:
+            self.misses += 1
+            sample = None
+            if self.mmap_threshold is not None and size >= self.mmap_threshold:
+                sample = map_wav(path, self.rate, self.channels)
+            if sample is not None:
+                self.mapped_bytes += sample.nbytes
+            else:
+                sample = load_wav(path, self.rate, self.channels)
+                self.bytes += sample.nbytes
+            sample.key = digest
+            self.entries[digest] = sample
+        self.pins[digest] += 1
+        self._evict()
+        return sample
+
+    def release(self, sample):
+        key = sample.key
+        if self.pins[key] > 0:
+            self.pins[key] -= 1
+            if not self.pins[key]:
+                del self.pins[key]
+                if sample.mapped and key in self.entries:
+                    # Mapping again is cheap, no need to keep it around
+                    del self.entries[key]
+                    self.mapped_bytes -= sample.nbytes
+        self._evict()
+
+    def _evict(self):
+        if self.bytes <= self.budget_bytes:
+            return
+        for digest in list(self.entries):
+            if self.bytes <= self.budget_bytes:
+                break
+            if self.pins[digest] or self.entries[digest].mapped:
+                continue
+            self.bytes -= self.entries.pop(digest).nbytes
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'pinned': len(self.pins),
+            'bytes': self.bytes,
+            'mapped_bytes': self.mapped_bytes,
+            'budget_bytes': self.budget_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def summary(self):
+        mb = 1024 * 1024
+        return (f"{len(self.entries)} samples, {self.bytes / mb:.1f}/{self.budget_bytes / mb:.0f} MB"
+                f" decoded, {self.mapped_bytes / mb:.1f} MB mapped, {self.hits} hits, {self.misses} misses")
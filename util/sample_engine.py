@@ -0,0 +1,183 @@
+import collections
+import wave
+
+import numpy as np
+
+try:
+    import sounddevice as sd
+except (ImportError, OSError):  # Not installed, or no PortAudio on this machine
+    sd = None
+
+try:
+    import simpleaudio as sa
+except ImportError:
+    sa = None
+
+RATE = 44100
+CHANNELS = 2
+VOICES = 32
+BLOCK_SIZE = 128  # Frames per audio callback, 2.9 ms at 44.1 kHz
+
+
+class Sample:
+    """A WAV decoded once into float32 frames shaped (frames, channels).
+
+    data can also be raw integer PCM (e.g. memory-mapped), with scale
+    bringing it to -1..1.
+    """
+
+    def __init__(self, data, rate, path=None, scale=1.0):
+        self.data = data
+        self.rate = rate
+        self.path = path
+        self.scale = scale
+        self.key = None  # Content hash when it comes from a SampleCache
+
+    @property
+    def mapped(self):
+        return isinstance(self.data, np.memmap)
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+
+def decode_pcm(raw, sample_width, channels):
+    """PCM bytes from a WAV file as float32 frames in -1..1."""
+    if sample_width == 1:
+        data = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif sample_width == 2:
+        data = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768
+    elif sample_width == 3:
+        padded = np.zeros((len(raw) // 3, 4), dtype=np.uint8)
+        padded[:, 1:] = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        data = padded.view('<i4').ravel().astype(np.float32) / 2147483648
+    elif sample_width == 4:
+        data = np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"Unsupported sample width: {sample_width}")
+    return data.reshape(-1, channels)
+
+
+def fit_sample(data, rate, target_rate=RATE, target_channels=CHANNELS):
+    """Resample (linear) and up/down-mix frames to the engine format."""
+    if data.shape[1] != target_channels:
+        mono = data.mean(axis=1, keepdims=True)
+        data = np.repeat(mono, target_channels, axis=1)
+    if rate != target_rate and len(data):
+        count = int(round(len(data) * target_rate / rate))
+        positions = np.arange(count) * (rate / target_rate)
+        source = np.arange(len(data))
+        data = np.stack([np.interp(positions, source, data[:, c]) for c in range(data.shape[1])], axis=1)
+    return np.ascontiguousarray(data, dtype=np.float32)
+
+
+def load_wav(path, rate=RATE, channels=CHANNELS):
+    """Decode a PCM WAV file into a Sample in the engine format."""
+    with wave.open(path, 'rb') as f:
+        raw = f.readframes(f.getnframes())
+        data = decode_pcm(raw, f.getsampwidth(), f.getnchannels())
+        source_rate = f.getframerate()
+    return Sample(fit_sample(data, source_rate, rate, channels), rate, path)
+
+
+class SampleEngine:
+    """Polyphonic sample player mixing every voice into one output stream.
+
+    trigger() only queues the hit; the audio callback starts it on the
+    next block, so pad-to-sound latency is one block plus the device
+    buffer. When all voices are busy the oldest one is stolen. Without
+    sounddevice (PortAudio) each hit falls back to its own simpleaudio
+    stream.
+    """
+
+    def __init__(self, rate=RATE, channels=CHANNELS, voices=VOICES, block_size=BLOCK_SIZE):
+        self.rate = rate
+        self.channels = channels
+        self.block_size = block_size
+        self.pads = {}
+        self.voice_samples = [None] * voices
+        self.voice_positions = [0] * voices
+        self.voice_gains = [0.0] * voices
+        self.voice_started = [0] * voices
+        self.stolen = 0
+        self.stream = None
+        self._triggers = collections.deque()
+        self._started = 0
+
+    @property
+    def active_voices(self):
+        return sum(sample is not None for sample in self.voice_samples)
+
+    def assign(self, pad, sample):
+        self.pads[pad] = sample
+
+    def unassign(self, pad):
+        self.pads.pop(pad, None)
+
+    def start(self):
+        if sd is None or self.stream is not None:
+            return
+        self.stream = sd.OutputStream(samplerate=self.rate, channels=self.channels, dtype='float32',
+                                      blocksize=self.block_size, latency='low', callback=self._callback)
+        self.stream.start()
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+
+    def trigger(self, pad, velocity=127):
+        """Play the sample on pad; False if nothing is assigned."""
+        sample = self.pads.get(pad)
+        if sample is None:
+            return False
+        if self.stream is None:
+            if sa is None:
+                return False
+            pcm = (np.clip(sample.data * (sample.scale * velocity / 127), -1, 1) * 32767).astype(np.int16)
+            sa.play_buffer(pcm, self.channels, 2, self.rate)
+            return True
+        self._triggers.append((sample, sample.scale * velocity / 127))
+        return True
+
+    def _start_voice(self, sample, gain):
+        free = [i for i, s in enumerate(self.voice_samples) if s is None]
+        if free:
+            voice = free[0]
+        else:
+            voice = min(range(len(self.voice_samples)), key=self.voice_started.__getitem__)
+            self.stolen += 1
+        self._started += 1
+        self.voice_samples[voice] = sample
+        self.voice_positions[voice] = 0
+        self.voice_gains[voice] = gain
+        self.voice_started[voice] = self._started
+
+    def render(self, frames, out=None):
+        """Mix the next frames of every voice into out (float32, frames x channels)."""
+        if out is None:
+            out = np.zeros((frames, self.channels), dtype=np.float32)
+        else:
+            out.fill(0)
+        while self._triggers:
+            self._start_voice(*self._triggers.popleft())
+        for voice, sample in enumerate(self.voice_samples):
+            if sample is None:
+                continue
+            position = self.voice_positions[voice]
+            chunk = sample.data[position:position + frames]
+            out[:len(chunk)] += chunk * self.voice_gains[voice]
+            position += frames
+            if position >= len(sample.data):
+                self.voice_samples[voice] = None
+            self.voice_positions[voice] = position
+        np.clip(out, -1.0, 1.0, out=out)
+        return out
+
+    def _callback(self, outdata, frames, time_info, status):
+        self.render(frames, outdata)
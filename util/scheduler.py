@@ -0,0 +1,148 @@
+import math
+from bisect import bisect_left
+import threading
+import time
+
+# Below this distance to the deadline we stop sleeping and spin instead,
+# OS sleep granularity is usually 0.5-2 ms.
+SPIN_THRESHOLD_NS = 2_000_000
+
+
+def wait_until(deadline_ns, stop_event=None, spin_threshold_ns=SPIN_THRESHOLD_NS):
+    """Hybrid wait: sleep most of the way, then spin to the deadline.
+
+    Returns False if stop_event was set while waiting.
+    """
+    while True:
+        remaining = deadline_ns - time.perf_counter_ns()
+        if remaining <= 0:
+            return True
+        if remaining > spin_threshold_ns:
+            timeout = (remaining - spin_threshold_ns) / 1e9
+            if stop_event is not None:
+                if stop_event.wait(timeout):
+                    return False
+            else:
+                time.sleep(timeout)
+        elif stop_event is not None and stop_event.is_set():
+            return False
+
+
+class LatenessStats:
+    """Running statistics of how late each event was sent (Welford)."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean_ns = 0.0
+        self._m2 = 0.0
+        self.min_ns = 0
+        self.max_ns = 0
+
+    def add(self, lateness_ns):
+        self.count += 1
+        if self.count == 1:
+            self.min_ns = self.max_ns = lateness_ns
+        else:
+            self.min_ns = min(self.min_ns, lateness_ns)
+            self.max_ns = max(self.max_ns, lateness_ns)
+        delta = lateness_ns - self.mean_ns
+        self.mean_ns += delta / self.count
+        self._m2 += delta * (lateness_ns - self.mean_ns)
+
+    @property
+    def stddev_ns(self):
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(self._m2 / (self.count - 1))
+
+    def summary(self):
+        return (f"{self.count} events, lateness mean {self.mean_ns / 1000:.1f} us, "
+                f"jitter {self.stddev_ns / 1000:.1f} us, "
+                f"min {self.min_ns / 1000:.1f} us, max {self.max_ns / 1000:.1f} us")
+
+
+class LoopScheduler:
+    """Plays a loop of timed events against absolute monotonic deadlines.
+
+    Every event is scheduled at origin + pass * loop_length + offset, so
+    sleep errors never accumulate and loop boundaries stay in phase no
+    matter how many times the loop repeats.
+
+    A new set of events can be handed over with publish() while playing.
+    The swap is a single attribute read on the playback thread and
+    continues from the current position, so it never blocks or skips.
+    """
+
+    def __init__(self, send, spin_threshold_ns=SPIN_THRESHOLD_NS):
+        self.send = send
+        self.spin_threshold_ns = spin_threshold_ns
+        self.stats = LatenessStats()
+        self.stop_event = threading.Event()
+        self.origin_ns = None
+        self.loop_ns = 0
+        self._published = (0, None, None)
+
+    def position(self, at_ns=None):
+        """Position inside the loop as a fraction 0..1, now or at a perf_counter_ns time."""
+        if self.origin_ns is None or self.loop_ns <= 0:
+            return 0.0
+        if at_ns is None:
+            at_ns = time.perf_counter_ns()
+        return ((at_ns - self.origin_ns) % self.loop_ns) / self.loop_ns
+
+    def phase(self, at_ns=None):
+        """Position inside the loop in seconds."""
+        return self.position(at_ns) * self.loop_ns / 1e9
+
+    def publish(self, times, payloads):
+        """Replace the events being played, e.g. after an overdub merge."""
+        version = self._published[0] + 1
+        self._published = (version, times, payloads)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self, times, payloads, loop_length, stop_event=None):
+        """Loop payloads at their times (in seconds) until stop() is called.
+
+        loop_length is in seconds; times are expected sorted. A stop_event
+        from the caller (e.g. a Worker's) is used instead of our own and
+        is never cleared, so a stop that comes before run() starts counts.
+        """
+        self.loop_ns = int(loop_length * 1e9)
+        if self.loop_ns <= 0 or not times:
+            return
+        self.publish(times, payloads)
+        version = 0
+
+        if stop_event is None:
+            stop_event = self.stop_event
+            stop_event.clear()
+        self.stats.reset()
+        self.origin_ns = time.perf_counter_ns()
+        loop_index = 0
+        while not stop_event.is_set():
+            base = self.origin_ns + loop_index * self.loop_ns
+            index = 0
+            while True:
+                published = self._published
+                if published[0] != version:
+                    # Carry on from where the loop is now, not from the old buffer's next event,
+                    # unless that one is overdue and still has to go out
+                    now = (time.perf_counter_ns() - base) / 1e9
+                    if index < len(times):
+                        now = min(now, times[index])
+                    version, times, payloads = published
+                    index = bisect_left(times, now)
+                if index >= len(times):
+                    break
+                deadline = base + int(times[index] * 1e9)
+                if not wait_until(deadline, stop_event, self.spin_threshold_ns):
+                    return
+                self.send(payloads[index])
+                self.stats.add(time.perf_counter_ns() - deadline)
+                index += 1
+            loop_index += 1
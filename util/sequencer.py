@@ -0,0 +1,173 @@
+import math
+import threading
+import time
+
+import numpy as np
+
+from util.envelope import EXPRESSION_CC, envelope_cc_events
+from util.scheduler import wait_until
+
+NOTE_OFF, CONTROL, NOTE_ON = 0, 1, 2  # Order of events that share a time
+
+
+class SequencerParams:
+    """Everything the step sequencer needs, read from the UI in one go.
+
+    swing delays every second step by that fraction of a step (0-0.5),
+    gate is the fraction of a step the note is held, envelope is an
+    optional (attack, decay, sustain, release) tuple sent as CC11.
+    """
+
+    def __init__(self, base_note=60, velocity=100, bpm=120, duration_beats=1, bars=4,
+                 direction="up", octave_range=1, swing=0.0, gate=0.9, envelope=None, channel=0):
+        self.base_note = base_note
+        self.velocity = velocity
+        self.bpm = bpm
+        self.duration_beats = duration_beats
+        self.bars = bars
+        self.direction = direction
+        self.octave_range = octave_range
+        self.swing = swing
+        self.gate = gate
+        self.envelope = envelope
+        self.channel = channel
+
+    @property
+    def step_seconds(self):
+        return self.duration_beats * 60.0 / self.bpm
+
+    @property
+    def total_steps(self):
+        return math.ceil(self.bars * 4 / self.duration_beats)
+
+
+def arp_pattern(base_note, direction, octave_range):
+    """Notes of one arp cycle for Up, Down or Up-Down over octave_range octaves."""
+    notes = [base_note + 12 * octave for octave in range(max(octave_range, 1))]
+    notes = [note for note in notes if note <= 127] or [base_note]
+    if direction == "down":
+        notes = sorted(notes, reverse=True)
+    elif direction == "up-down":
+        notes = notes + notes[::-1][1:-1]
+    return notes
+
+
+class Timeline:
+    """Sorted event arrays for a run of steps.
+
+    times are seconds from the start of first_step; every event belongs to
+    one step and happens before the next step starts.
+    """
+
+    def __init__(self, params, first_step=0):
+        self.params = params
+        self.first_step = first_step
+        step_sec = params.step_seconds
+        notes = np.array(arp_pattern(params.base_note, params.direction, params.octave_range))
+        steps = np.arange(first_step, params.total_steps)
+
+        starts = (steps - first_step) * step_sec
+        odd = steps % 2 == 1
+        delay = np.where(odd, params.swing * step_sec, 0.0)
+        length = step_sec - delay
+        gate = np.minimum(params.gate * step_sec, length)
+        pitches = notes[steps % len(notes)]
+
+        times = [starts + delay, starts + delay + gate]
+        owners = [steps, steps]
+        kinds = [np.full(len(steps), NOTE_ON), np.full(len(steps), NOTE_OFF)]
+        data1 = [pitches, pitches]
+        data2 = [np.full(len(steps), params.velocity), np.full(len(steps), params.velocity)]
+
+        if params.envelope is not None and len(steps):
+            # Even and odd steps only differ by swing, so render two CC templates
+            for mask in (~odd, odd):
+                if not mask.any():
+                    continue
+                first = np.flatnonzero(mask)[0]
+                cc_times, cc_values = envelope_cc_events(*params.envelope, gate[first], length[first])
+                count = len(cc_times)
+                step_times = (starts[mask] + delay[mask])[:, None] + cc_times[None, :]
+                times.append(step_times.ravel())
+                owners.append(np.repeat(steps[mask], count))
+                kinds.append(np.full(step_times.size, CONTROL))
+                data1.append(np.full(step_times.size, EXPRESSION_CC))
+                data2.append(np.tile(cc_values, int(mask.sum())))
+
+        times = np.concatenate(times)
+        kinds = np.concatenate(kinds)
+        order = np.lexsort((kinds, times))
+        self.times = times[order]
+        self.steps = np.concatenate(owners)[order]
+        self.kinds = kinds[order]
+        status_base = np.array([0x80, 0xB0, 0x90])[self.kinds]
+        self.status = status_base | params.channel
+        self.data1 = np.concatenate(data1)[order]
+        self.data2 = np.concatenate(data2)[order]
+
+    def __len__(self):
+        return len(self.times)
+
+    def step_start(self, step):
+        return (step - self.first_step) * self.params.step_seconds
+
+    def event_bytes(self, index):
+        return bytes((int(self.status[index]), int(self.data1[index]), int(self.data2[index])))
+
+
+class StepSequencer:
+    """Plays a precomputed Timeline against absolute deadlines.
+
+    Deadlines are anchor + event time, so sleep errors never pile up.
+    update() hands over new parameters; they apply at the next step
+    boundary by re-anchoring there, without restarting the thread.
+    """
+
+    def __init__(self, send):
+        self.send = send
+        self.stop_event = threading.Event()
+        self._pending = None
+        self.step = 0
+
+    def update(self, params):
+        self._pending = params
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self, params, stop_event=None):
+        """Play params until done or stopped; a caller's stop_event is used as is, never cleared."""
+        if stop_event is None:
+            stop_event = self.stop_event
+            stop_event.clear()
+        self._pending = None
+        timeline = Timeline(params)
+        anchor_ns = time.perf_counter_ns()
+        self.step = -1
+        sounding = None
+        index = 0
+        try:
+            while index < len(timeline):
+                step = int(timeline.steps[index])
+                if step != self.step:
+                    self.step = step
+                    pending = self._pending
+                    if pending is not None:
+                        self._pending = None
+                        anchor_ns += int(timeline.step_start(step) * 1e9)
+                        timeline = Timeline(pending, step)
+                        index = 0
+                        continue
+                deadline = anchor_ns + int(timeline.times[index] * 1e9)
+                if not wait_until(deadline, stop_event):
+                    break
+                data = timeline.event_bytes(index)
+                self.send(data)
+                if timeline.kinds[index] == NOTE_ON:
+                    sounding = data
+                elif timeline.kinds[index] == NOTE_OFF:
+                    sounding = None
+                index += 1
+        finally:
+            if sounding is not None:
+                self.send(bytes((0x80 | (sounding[0] & 0x0F), sounding[1], 0)))
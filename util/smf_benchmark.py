@@ -0,0 +1,62 @@
+"""Compare SmfFile with mido.MidiFile on one or more MIDI files.
+
+    python3 -m util.smf_benchmark big_file.mid [...]
+"""
+import sys
+import time
+import tracemalloc
+
+import mido
+
+from util.smf_reader import SmfFile
+
+
+def bench(label, func, path, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    # Measure memory in a separate run, tracing slows Python code down a lot
+    tracemalloc.start()
+    count = func(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<16} {best * 1000:9.1f} ms  {count:9d} events  peak {peak / 2**20:7.1f} MiB")
+
+
+def load_mido(path):
+    mid = mido.MidiFile(path)
+    return sum(len(track) for track in mid.tracks)
+
+
+def load_smf(path):
+    with SmfFile(path) as smf:
+        return len(smf.to_arrays())
+
+
+def tempo_mido(path):
+    mid = mido.MidiFile(path)
+    return len([msg for track in mid.tracks for msg in track if msg.type == 'set_tempo'])
+
+
+def tempo_smf(path):
+    with SmfFile(path) as smf:
+        return len(smf.tempo_changes())
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+    for path in sys.argv[1:]:
+        print(path)
+        bench("mido load", load_mido, path)
+        bench("SmfFile load", load_smf, path)
+        bench("mido tempo", tempo_mido, path)
+        bench("SmfFile tempo", tempo_smf, path)
+
+
+if __name__ == "__main__":
+    main()
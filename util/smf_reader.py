@@ -0,0 +1,263 @@
+import mmap
+import struct
+from array import array
+
+import numpy as np
+
+from util.tempo_map import TempoMap
+
+META = 0xFF
+SET_TEMPO = 0x51
+END_OF_TRACK = 0x2F
+
+
+class SmfEvents:
+    """Column arrays for every event of a file, merged in playback order.
+
+    status is the full status byte (0xFF for meta, 0xF0/0xF7 for sysex).
+    For meta events data1 is the meta type; for meta and sysex events
+    offset/length point at the payload inside the mapped file.
+    """
+
+    def __init__(self, ticks, track, status, data1, data2, offset, length, seconds):
+        self.ticks = ticks
+        self.track = track
+        self.status = status
+        self.data1 = data1
+        self.data2 = data2
+        self.offset = offset
+        self.length = length
+        self.seconds = seconds
+
+    def __len__(self):
+        return len(self.ticks)
+
+
+class SmfFile:
+    """Standard MIDI File reader working straight on a memory-mapped file.
+
+    Opening only indexes the MTrk chunks. Events are decoded on demand from
+    the mapped buffer (variable-length quantities, running status, sysex
+    and meta) without building mido.Message objects; to_arrays() packs a
+    whole file into NumPy columns in a single pass, which tempo_map(),
+    end_tick and length then reuse.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self._mmap)
+        try:
+            self._read_header()
+        except Exception:
+            self.close()
+            raise
+        self._columns = None  # Merged event columns, decoded once
+        self._end_ticks = None
+        self._tempo_changes = None
+        self._tempo_map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._mmap is not None:
+            self.buffer.release()
+            self._mmap.close()
+            self._mmap = None
+
+    def _read_header(self):
+        buf = self.buffer
+        if len(buf) < 14 or buf[0:4] != b'MThd':
+            raise IOError("Not a MIDI file")
+        length, = struct.unpack_from('>I', buf, 4)
+        self.format, ntracks, self.division = struct.unpack_from('>HHH', buf, 8)
+        pos = 8 + length
+        self.tracks = []  # (offset, length) of every MTrk chunk
+        while pos + 8 <= len(buf) and len(self.tracks) < ntracks:
+            chunk_type, chunk_length = struct.unpack_from('>4sI', buf, pos)
+            pos += 8
+            if chunk_type == b'MTrk':
+                self.tracks.append((pos, min(chunk_length, len(buf) - pos)))
+            pos += chunk_length
+
+    @property
+    def ticks_per_beat(self):
+        return self.division
+
+    @property
+    def is_smpte(self):
+        return bool(self.division & 0x8000)
+
+    def iter_track(self, index):
+        """Yield (tick, track, sequence, status, data1, data2, offset, length).
+
+        Tuples compare by (tick, track, sequence), so several tracks can be
+        merged with heapq.merge.
+        """
+        buf = self.buffer
+        pos, size = self.tracks[index]
+        end = pos + size
+        tick = 0
+        running_status = 0
+        sequence = 0
+        while pos < end:
+            value = 0
+            while True:
+                byte = buf[pos]
+                pos += 1
+                value = (value << 7) | (byte & 0x7F)
+                if byte < 0x80:
+                    break
+            tick += value
+            status = buf[pos]
+            pos += 1
+            if status == META:
+                meta_type = buf[pos]
+                pos += 1
+                length = 0
+                while True:
+                    byte = buf[pos]
+                    pos += 1
+                    length = (length << 7) | (byte & 0x7F)
+                    if byte < 0x80:
+                        break
+                yield tick, index, sequence, META, meta_type, 0, pos, length
+                pos += length
+                if meta_type == END_OF_TRACK:
+                    return
+            elif status == 0xF0 or status == 0xF7:
+                length = 0
+                while True:
+                    byte = buf[pos]
+                    pos += 1
+                    length = (length << 7) | (byte & 0x7F)
+                    if byte < 0x80:
+                        break
+                yield tick, index, sequence, status, 0, 0, pos, length
+                pos += length
+            else:
+                if status < 0x80:
+                    if not running_status:
+                        raise IOError("Running status without a previous status byte")
+                    data1 = status
+                    status = running_status
+                else:
+                    running_status = status
+                    data1 = buf[pos]
+                    pos += 1
+                if status & 0xF0 == 0xC0 or status & 0xF0 == 0xD0:
+                    data2 = 0
+                else:
+                    data2 = buf[pos]
+                    pos += 1
+                yield tick, index, sequence, status, data1, data2, 0, 0
+            sequence += 1
+
+    def event_bytes(self, status, data1, data2, offset, length):
+        """Raw MIDI bytes for one decoded channel or sysex event."""
+        if status == 0xF0:
+            return b'\xf0' + bytes(self.buffer[offset:offset + length])
+        if status == 0xF7:
+            return bytes(self.buffer[offset:offset + length])
+        if status & 0xF0 == 0xC0 or status & 0xF0 == 0xD0:
+            return bytes((status, data1))
+        return bytes((status, data1, data2))
+
+    def meta_data(self, offset, length):
+        return bytes(self.buffer[offset:offset + length])
+
+    def tempo_changes(self):
+        """[(tick, microseconds per beat)] from all tracks, in tick order."""
+        if self._tempo_changes is None:
+            ticks, _, status, data1, _, offset, length = self._decode()
+            buf = self.buffer
+            self._tempo_changes = [
+                (int(ticks[i]), (buf[offset[i]] << 16) | (buf[offset[i] + 1] << 8) | buf[offset[i] + 2])
+                for i in np.flatnonzero((status == META) & (data1 == SET_TEMPO) & (length == 3))]
+        return self._tempo_changes
+
+    def end_ticks(self):
+        """Tick of the last event (usually end_of_track) of every track."""
+        if self._end_ticks is None:
+            self._decode()
+        return self._end_ticks
+
+    def _track_offsets(self):
+        """Start tick of every track; format 2 tracks play one after another."""
+        if self.format != 2:
+            return [0] * len(self.tracks)
+        offsets = []
+        start = 0
+        for end in self.end_ticks():
+            offsets.append(start)
+            start += end
+        return offsets
+
+    def tempo_map(self):
+        """TempoMap built from the merged tempo changes of every track."""
+        if self._tempo_map is None:
+            self._tempo_map = TempoMap(self.division, self.tempo_changes())
+        return self._tempo_map
+
+    def ticks_to_seconds(self, ticks):
+        """Convert an array of absolute ticks to seconds using the tempo map."""
+        return self.tempo_map().ticks_to_seconds(ticks)
+
+    @property
+    def end_tick(self):
+        """Tick where the whole file ends."""
+        if not self.tracks:
+            return 0
+        return max(offset + end for offset, end in zip(self._track_offsets(), self.end_ticks()))
+
+    @property
+    def length(self):
+        """Playback length in seconds, like mido.MidiFile.length."""
+        return self.tempo_map().tick2second(self.end_tick)
+
+    def to_arrays(self):
+        """Decode every track into SmfEvents columns, merged by tick."""
+        columns = self._decode()
+        return SmfEvents(*columns, seconds=self.ticks_to_seconds(columns[0]))
+
+    def _decode(self):
+        """The one pass over the file; tempo changes and end ticks come from its columns."""
+        if self._columns is not None:
+            return self._columns
+        ticks = array('q')
+        track = array('H')
+        status = array('B')
+        data1 = array('B')
+        data2 = array('B')
+        offset = array('Q')
+        length = array('I')
+        counts = []
+        ends = []
+        for index in range(len(self.tracks)):
+            before = len(ticks)
+            for event in self.iter_track(index):
+                ticks.append(event[0])
+                track.append(index)
+                status.append(event[3])
+                data1.append(event[4])
+                data2.append(event[5])
+                offset.append(event[6])
+                length.append(event[7])
+            counts.append(len(ticks) - before)
+            ends.append(ticks[-1] if len(ticks) > before else 0)
+        self._end_ticks = ends
+
+        columns = [np.frombuffer(column, dtype=column.typecode) if len(column) else
+                   np.zeros(0, dtype=column.typecode)
+                   for column in (ticks, track, status, data1, data2, offset, length)]
+        if self.format == 2:
+            columns[0] = columns[0] + np.repeat(np.array(self._track_offsets(), dtype=np.int64), counts)
+        # Tracks were appended in order, so a stable sort keeps (tick, track, sequence)
+        order = np.argsort(columns[0], kind='stable')
+        self._columns = [column[order] for column in columns]
+        return self._columns
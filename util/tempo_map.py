@@ -0,0 +1,99 @@
+from bisect import bisect_right
+
+import numpy as np
+from mido import bpm2tempo, tempo2bpm
+
+DEFAULT_TEMPO = bpm2tempo(120)
+
+
+class TempoMap:
+    """Tick <-> seconds conversion for a whole file.
+
+    Built once from the merged tempo changes of every track. Each tempo
+    segment stores its start tick, its start time in seconds and its
+    seconds per tick, so a single conversion is a bisect (O(log n)) and
+    whole arrays convert at once with NumPy.
+    """
+
+    def __init__(self, ticks_per_beat, changes=()):
+        """changes is [(tick, microseconds per beat)] sorted by tick."""
+        self.ticks_per_beat = ticks_per_beat
+        self.ticks = [0]
+        self.tempos = [DEFAULT_TEMPO]
+        if ticks_per_beat & 0x8000:
+            # SMPTE division: frames per second times ticks per frame, no tempo
+            fps = 256 - (ticks_per_beat >> 8)
+            self.scales = [1.0 / (fps * (ticks_per_beat & 0xFF))]
+            self.starts = [0.0]
+            return
+        for tick, tempo in changes:
+            if tick == self.ticks[-1]:
+                self.tempos[-1] = tempo  # Last change at a tick wins
+            elif tempo != self.tempos[-1]:
+                self.ticks.append(tick)
+                self.tempos.append(tempo)
+        self.scales = [tempo / (ticks_per_beat * 1e6) for tempo in self.tempos]
+        self.starts = [0.0]
+        for i in range(1, len(self.ticks)):
+            self.starts.append(self.starts[-1] + (self.ticks[i] - self.ticks[i - 1]) * self.scales[i - 1])
+
+    def __len__(self):
+        return len(self.ticks)
+
+    def _segment(self, tick):
+        return max(bisect_right(self.ticks, tick) - 1, 0)
+
+    def tempo_at(self, tick):
+        return self.tempos[self._segment(tick)]
+
+    def tick2second(self, tick):
+        i = self._segment(tick)
+        return self.starts[i] + (tick - self.ticks[i]) * self.scales[i]
+
+    def second2tick(self, seconds):
+        i = max(bisect_right(self.starts, seconds) - 1, 0)
+        return self.ticks[i] + (seconds - self.starts[i]) / self.scales[i]
+
+    def ticks_to_seconds(self, ticks):
+        """Vectorised tick2second for an array of absolute ticks."""
+        ticks = np.asarray(ticks, dtype=np.float64)
+        segment = np.maximum(np.searchsorted(self.ticks, ticks, side='right') - 1, 0)
+        return (np.asarray(self.starts)[segment]
+                + (ticks - np.asarray(self.ticks, dtype=np.float64)[segment]) * np.asarray(self.scales)[segment])
+
+    def seconds_to_ticks(self, seconds):
+        """Vectorised second2tick for an array of times in seconds."""
+        seconds = np.asarray(seconds, dtype=np.float64)
+        segment = np.maximum(np.searchsorted(self.starts, seconds, side='right') - 1, 0)
+        return (np.asarray(self.ticks, dtype=np.float64)[segment]
+                + (seconds - np.asarray(self.starts)[segment]) / np.asarray(self.scales)[segment])
+
+    def bpm_segments(self, end_tick):
+        """[(bpm, seconds)] for every tempo segment up to end_tick."""
+        segments = []
+        for i, start in enumerate(self.ticks):
+            if start >= end_tick and segments:
+                break
+            stop = self.ticks[i + 1] if i + 1 < len(self.ticks) else end_tick
+            stop = min(stop, end_tick)
+            segments.append((tempo2bpm(self.tempos[i]), max(stop - start, 0) * self.scales[i]))
+        return segments
+
+    def average_bpm(self, end_tick):
+        """BPM averaged over playing time (seconds) up to end_tick."""
+        segments = self.bpm_segments(end_tick)
+        total = sum(seconds for _, seconds in segments)
+        if total <= 0:
+            return segments[0][0]
+        return sum(bpm * seconds for bpm, seconds in segments) / total
+
+    def median_bpm(self, end_tick):
+        """Time-weighted median: half of the playing time is at or below this BPM."""
+        segments = sorted(self.bpm_segments(end_tick))
+        total = sum(seconds for _, seconds in segments)
+        elapsed = 0.0
+        for bpm, seconds in segments:
+            elapsed += seconds
+            if elapsed >= total / 2:
+                return bpm
+        return segments[-1][0]
@@ -0,0 +1,407 @@
+import os
+import threading
+import time
+
+from util.event_buffer import EventBuffer, rechannel
+from util.file_player import FilePlayer, FileTimeline
+from util.midi_export import export_buffer
+from util.midi_input import MidiInput
+from util.midi_output import get_output_service
+from util.overdub import OverdubEngine, undo_layer
+from util.playlist import Playlist
+from util.quantize import QuantizeSettings, quantize_buffer
+from util.scheduler import LoopScheduler
+from util.workers import WorkerManager
+
+# LED colour of every state, the looper and the file player share them
+STATE_COLORS = {
+    "stopped": "gray",
+    "recording": "red",
+    "playing": "green",
+    "overdubbing": "yellow",
+}
+
+
+class Transport:
+    """The looper and the file player, without any widgets.
+
+    Owns the output, the worker threads, the loop buffer and the file
+    player and playlist; midi_looper.py and midi_looper_cli.py are both
+    just clients. Nothing here imports Qt. The callbacks may be called
+    from any thread:
+
+    on_status(text, color) for messages, color may be None
+    on_state(part, state) when "looper" or "player" changes to one of STATE_COLORS
+    on_progress(percent) while a file plays
+    on_loop_changed() after the loop buffer was swapped
+    on_track(index, timeline) when the queue moves to another file
+    """
+
+    def __init__(self, port=None, bpm=120, on_status=None, on_state=None, on_progress=None,
+                 on_loop_changed=None, on_track=None):
+        self.on_status = on_status
+        self.on_state = on_state
+        self.on_progress = on_progress
+        self.on_loop_changed = on_loop_changed
+        self.on_track = on_track
+        self.output = get_output_service()  # Shared by every player in the process
+        self.port = self.output.resolve(port)  # Everything goes here, the output's default may differ
+        self.output.open(self.port)
+        self.workers = WorkerManager()  # Record, loop and file threads, one of each at a time
+        self.bpm = bpm
+        self.loop_buffer = EventBuffer()
+        self.take_buffer = self.loop_buffer  # Loop before any quantize preview
+        # Held while take_buffer/loop_buffer are swapped, the overdub merge thread does it too
+        self._buffer_lock = threading.RLock()
+        self.quantize = None  # QuantizeSettings while quantize is on
+        self.quantize_seed = 0
+        self.looper_channel = 0
+        self.player_channel = 0
+        self.is_recording = False
+        self.is_playing = False
+        self.is_overdubbing = False
+        self.loop_scheduler = LoopScheduler(self._send_loop_message)
+        self.overdub_engine = OverdubEngine()
+        self.overdub_input = None
+        self.input_latency = None  # Summary of the last take's input, see stats()
+        self.overdub_latency = None
+        self.file_bpm = 120  # Tempo of the playing file, the override is relative to it
+        self.playing_file = False
+        self.file_player = FilePlayer(self._send_file_message, self.panic)
+        # Plays the queue on its own long-lived thread through the same player
+        self.playlist = Playlist(self.file_player, on_track=self._track_started, progress=self._progress)
+
+    def _status(self, text, color=None):
+        if self.on_status is not None:
+            self.on_status(text, color)
+
+    def _state(self, part, state):
+        if self.on_state is not None:
+            self.on_state(part, state)
+
+    def _progress(self, percent):
+        if self.on_progress is not None:
+            self.on_progress(percent)
+
+    # Looper
+
+    def record(self):
+        if self.workers.is_running("record"):
+            self._status("Already recording", "red")
+            return False
+        with self._buffer_lock:
+            self.loop_buffer.clear()
+            self.take_buffer = self.loop_buffer
+        self.quantize_seed += 1
+        self.is_recording = True
+        self._state("looper", "recording")
+        self._status("Pre-counting...", "gray")
+        return self.workers.start("record", self._record_thread) is not None
+
+    def record_and_loop(self):
+        """Record one bar after the count-in, then loop it."""
+        if self.record():
+            self.workers.start("auto_stop", self._auto_stop_and_play)
+
+    def _auto_stop_and_play(self, worker):
+        if worker.wait(4 * 60 / self.bpm):  # one bar pre-count
+            return
+        self.is_recording = False
+        self.workers.stop("record")
+        self.play()
+
+    def play_pre_count(self, worker):
+        """Count in four beats; True if stopped meanwhile."""
+        beat_interval = 60 / self.bpm
+        for _ in range(4):  # 4 beat count-in
+            self._status(f"{_+1}", "gray")
+            if worker.wait(beat_interval):
+                return True
+        return False
+
+    def _record_thread(self, worker):
+        if self.play_pre_count(worker):
+            return
+        start = time.perf_counter_ns() / 1e9
+        self._status("Recording...", "red")
+        try:
+            with MidiInput() as capture:
+                worker.on_stop = capture.ready.set  # Wake the wait below when stopped
+                while not worker.stopping:
+                    capture.wait()
+                    for stamp, data in capture.ring.drain():
+                        self.loop_buffer.append(stamp - start, data)
+            for stamp, data in capture.ring.drain():
+                self.loop_buffer.append(stamp - start, data)
+            if self.loop_buffer:
+                self.input_latency = f"{capture.latency.summary()}, dropped {capture.ring.dropped}"
+        except Exception as e:
+            self._state("looper", "stopped")
+            self._status(f"Recording failed: {e}", "red")
+        finally:
+            self.is_recording = False  # Also on failure, or play() would wait for this take forever
+
+    def play(self):
+        """Loop the recorded take; False if there is none or it already plays."""
+        if not self.loop_buffer:
+            self._status("Nothing to play", "gray")
+            return False
+        if self.workers.is_running("loop"):
+            self._status("Already playing", "green")
+            return False
+        if self.is_recording or self.workers.is_running("record"):
+            # The take is still being appended to, the scheduler needs it finished
+            self._status("Stop recording before playing", "red")
+            return False
+        self.apply_quantize()
+        self.is_playing = True
+        self._state("looper", "playing")
+        self._status("Looping playback...", "green")
+        return self.workers.start("loop", self._loop_play) is not None
+
+    def _loop_play(self, worker):
+        buffer = self.loop_buffer
+        self.loop_scheduler.run(buffer.times, buffer.raw_for_channel(self.looper_channel), buffer.duration,
+                                stop_event=worker.stop_event)
+
+    def _send_loop_message(self, data):
+        self.output.send(data, self.port)
+
+    def stop(self):
+        """Stop recording, overdubbing and the loop; a playing file keeps going."""
+        self.is_recording = False
+        self.is_playing = False
+        self.is_overdubbing = False
+        self.stop_overdub_input()
+        self.workers.stop("auto_stop")
+        self.workers.stop("record")
+        self.workers.stop("loop")
+        self._state("looper", "stopped")
+        self._status("Stop", "gray")
+
+    def set_loop_buffer(self, buffer, take=True):
+        """Swap in a new loop buffer; the playing loop picks it up without stopping.
+
+        take=False is for previews derived from the take, like quantize.
+        """
+        with self._buffer_lock:
+            raw = buffer.raw_for_channel(self.looper_channel)
+            if take:
+                self.take_buffer = buffer
+            self.loop_buffer = buffer
+            self.loop_scheduler.publish(buffer.times, raw)
+        if self.on_loop_changed is not None:
+            self.on_loop_changed()
+
+    def loop_position(self):
+        """Seconds into the loop, or None when it is not playing."""
+        return self.loop_scheduler.phase() if self.is_playing else None
+
+    def set_bpm(self, bpm):
+        self.bpm = bpm
+        self.apply_quantize()
+
+    def set_quantize(self, settings):
+        """Quantize the take with settings from now on, or play it as recorded with None."""
+        self.quantize = settings
+        self.apply_quantize()
+
+    def apply_quantize(self):
+        """Play a quantized copy of the take, or the take itself when quantize is off."""
+        with self._buffer_lock:
+            take = self.take_buffer
+            if self.is_recording or not take:
+                return
+            if self.quantize is not None:
+                # Every take gets its own humanize, the same one for every setting
+                settings = QuantizeSettings(self.quantize.grid, self.quantize.strength, self.quantize.swing,
+                                            self.quantize.humanize_ms, self.quantize_seed)
+                buffer = quantize_buffer(take, self.bpm, settings)
+            else:
+                buffer = take
+            self.set_loop_buffer(buffer, take=False)
+
+    def set_looper_channel(self, channel):
+        with self._buffer_lock:
+            self.looper_channel = channel
+            if self.is_playing:
+                self.set_loop_buffer(self.loop_buffer, take=False)
+
+    def overdub(self):
+        """Start overdubbing onto the playing loop, or stop if already overdubbing."""
+        if self.is_overdubbing:
+            self.is_overdubbing = False
+            self.stop_overdub_input()
+            self._state("looper", "playing")
+            self._status("Looping playback...", "green")
+            return
+        if not self.is_playing:
+            self._status("Nothing playing to overdub", "gray")
+            return
+        scheduler = self.loop_scheduler
+        overdub_input = MidiInput(
+            on_event=lambda stamp, data: self.overdub_engine.capture(scheduler.phase(stamp), data))
+        try:
+            overdub_input.open()
+        except IOError as e:
+            self._status(f"Overdub failed: {e}", "red")
+            return
+        self.overdub_input = overdub_input
+        self.is_overdubbing = True
+        # Layers go into the take as played, the quantize preview is rebuilt from it
+        self.overdub_engine.start(self.take_buffer, lambda: self.take_buffer, self.set_take)
+        self._state("looper", "overdubbing")
+        self._status(f"Overdubbing layer {self.overdub_engine.layer}...", "yellow")
+
+    def stop_overdub_input(self):
+        if self.overdub_input is not None:
+            self.overdub_input.close()
+            self.overdub_latency = self.overdub_input.latency.summary()
+            self.overdub_input = None
+        self.overdub_engine.stop()
+
+    def set_take(self, buffer):
+        """Replace the recorded take, and the loop with it (quantized if quantize is on)."""
+        with self._buffer_lock:
+            self.take_buffer = buffer
+            if self.quantize is None:
+                self.set_loop_buffer(buffer)
+            else:
+                self.apply_quantize()
+
+    def undo_overdub(self):
+        if self.is_overdubbing:
+            self._status("Stop overdubbing before undo", "gray")
+            return
+        with self._buffer_lock:
+            buffer = undo_layer(self.take_buffer)
+            if buffer is not None:
+                self.set_take(buffer)
+        if buffer is None:
+            self._status("No overdub to undo", "gray")
+            return
+        self._status(f"Removed overdub layer {buffer.layer_count}", "green")
+
+    def export(self, path, buffer=None, progress=None):
+        """Write the loop (or a snapshot of it taken earlier) as a MIDI file, blocking."""
+        if buffer is None:
+            buffer = self.loop_buffer.snapshot()
+        export_buffer(buffer, path, self.bpm, split_layers=buffer.layer_count > 1, progress=progress)
+        return path
+
+    # File player
+
+    def load_file(self, path):
+        """Load a file and play it in a loop, blocking while it loads."""
+        self._status("Loading MIDI file...", "gray")
+        try:
+            timeline = FileTimeline.from_file(path)
+        except Exception as e:
+            self._status(f"Failed to load MIDI file: {e}", "red")
+            return False
+        if not len(timeline):
+            self._status("Failed to load MIDI file: No MIDI events in file", "red")
+            return False
+        return self.play_file(timeline)
+
+    def play_file(self, timeline):
+        """Play a loaded FileTimeline in a loop, instead of whatever file plays now."""
+        self.file_player.set_speed(1.0)
+        self.file_bpm = max(round(timeline.bpm), 1)
+        self.playlist.stop()
+        self.panic()
+        if self.workers.start("file", self._loop_play_file, timeline,
+                              replace=True, on_stop=self.file_player.stop) is None:
+            self._status("Previous file is still stopping, try again", "red")
+            return False
+        self.playing_file = True
+        self._state("player", "playing")
+        self._status("MIDI file loaded", "green")
+        return True
+
+    def _loop_play_file(self, worker, timeline):
+        """Play the loaded file in a loop until stopped."""
+        self.file_player.run(timeline, loop=True, progress=self._progress, stop_event=worker.stop_event)
+
+    def _send_file_message(self, data):
+        self.output.send(rechannel(data, self.player_channel), self.port)
+
+    def stop_file(self):
+        """Stop the playing file or queue."""
+        self.playing_file = False
+        self.workers.stop("file")
+        self.playlist.stop()
+        self.panic()
+        self._progress(0)
+        self._state("player", "stopped")
+
+    def set_player_channel(self, channel):
+        self.player_channel = channel
+
+    def set_file_bpm(self, bpm):
+        self.file_player.set_speed(bpm / self.file_bpm)
+
+    def seek_bar(self, bar):
+        """Jump to bar (counted from 0) of the playing file."""
+        if self.playing_file:
+            self.file_player.seek_bar(bar)
+
+    def file_position(self):
+        """Seconds into the playing file, or None."""
+        return self.file_player.position() if self.playing_file else None
+
+    def play_queue(self, paths, index=0, crossfade=None):
+        """Play paths back to back from index, fading over crossfade seconds if given."""
+        if not paths:
+            self._status("No MIDI files in the queue", "red")
+            return False
+        self.stop_file()
+        if crossfade is not None:
+            self.playlist.set_crossfade(crossfade)
+        self.playlist.set_paths(paths)
+        # Before play(): the first track may start on the player thread straight away
+        self.playing_file = True
+        self._state("player", "playing")
+        self.panic()
+        self.playlist.play(index)
+        return True
+
+    def next_in_queue(self):
+        """Skip to the next file of the playing queue; False if no queue plays."""
+        if not self.playlist.playing:
+            return False
+        self.playlist.skip()
+        return True
+
+    def _track_started(self, index, timeline):
+        if not self.playing_file:
+            return
+        self.file_bpm = max(round(timeline.bpm), 1)
+        paths = self.playlist.paths
+        if index < len(paths):
+            self._status(f"Playing {os.path.basename(paths[index])}", "green")
+        if self.on_track is not None:
+            self.on_track(index, timeline)
+
+    def send(self, data):
+        """Send one message straight to the transport's port, e.g. from a keyboard."""
+        self.output.send(data, self.port)
+
+    def panic(self):
+        self.output.panic(self.port)
+
+    def close(self, timeout=2.0):
+        """Stop everything and wait up to timeout seconds for the threads."""
+        self.stop_overdub_input()
+        self.playlist.close()
+        self.workers.stop_all(timeout)
+
+    def stats(self):
+        """Timing and latency summaries of the last (or current) runs, by name."""
+        return {
+            'loop timing': self.loop_scheduler.stats.summary(),
+            'file timing': self.file_player.stats.summary(),
+            'input latency': self.input_latency or "no take recorded",
+            'overdub latency': self.overdub_latency or "no overdub recorded",
+            'workers': self.workers.summary(),
+        }
@@ -0,0 +1,159 @@
+import threading
+import time
+
+
+class Worker:
+    """A named thread with its own stop Event.
+
+    The target gets the Worker as its first argument and should wait on
+    stop_event (or worker.wait()) instead of sleeping or polling a flag.
+    on_stop, if set, is called by stop() to wake anything the target
+    blocks on that is not the stop_event itself, e.g. an input's ready
+    event; targets may set it once they have something to wake.
+    """
+
+    def __init__(self, name, target, args=(), on_stop=None):
+        self.name = name
+        self.stop_event = threading.Event()
+        self.on_stop = on_stop
+        self.started_ns = None
+        self.thread = threading.Thread(target=target, args=(self,) + tuple(args), name=name, daemon=True)
+
+    @property
+    def stopping(self):
+        return self.stop_event.is_set()
+
+    def is_alive(self):
+        return self.thread.is_alive()
+
+    def wait(self, timeout):
+        """Sleep up to timeout seconds; True if asked to stop meanwhile."""
+        return self.stop_event.wait(timeout)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.on_stop is not None:
+            try:
+                self.on_stop()
+            except Exception as e:
+                print(f"Error stopping {self.name}: {e}")
+
+    def join(self, timeout=None):
+        if self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+        return not self.thread.is_alive()
+
+
+class WorkerManager:
+    """Owns the worker threads of an app, at most one per name.
+
+    start() rejects a second worker under a name that is still running,
+    or with replace=True stops and joins the old one first, so a
+    double click can never leave two threads sending the same notes.
+    Joins take a deadline; a worker that misses it is reported and left
+    to finish on its own (workers are daemon threads).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._workers = {}  # name -> Worker
+        self.started = 0
+        self.rejected = 0
+        self.replaced = 0
+        self.timed_out = 0
+
+    def _run(self, worker, target, args):
+        try:
+            target(worker, *args)
+        except Exception as e:
+            print(f"Error in worker {worker.name}: {e}")
+        finally:
+            with self._lock:
+                if self._workers.get(worker.name) is worker:
+                    del self._workers[worker.name]
+
+    def start(self, name, target, *args, replace=False, on_stop=None, timeout=1.0):
+        """Run target(worker, *args) on a new thread; None if name is busy and replace is False."""
+        with self._lock:
+            running = self._workers.get(name)
+        if running is not None:
+            if not replace:
+                self.rejected += 1
+                return None
+            self.replaced += 1
+            if not self._stop(running, timeout):
+                self.rejected += 1  # Better no new worker than two at once
+                return None
+        worker = Worker(name, self._run, (target, args), on_stop)
+        with self._lock:
+            current = self._workers.get(name)
+            if current is not None and current is not running:
+                # Someone else started one meanwhile
+                self.rejected += 1
+                return None
+            # Registered until its thread finishes, also before it gets going
+            self._workers[name] = worker
+            self.started += 1
+        worker.started_ns = time.perf_counter_ns()
+        worker.thread.start()
+        return worker
+
+    def _stop(self, worker, timeout):
+        worker.stop()
+        if not worker.join(timeout):
+            self.timed_out += 1
+            print(f"Worker {worker.name} did not stop within {timeout:.1f} s")
+            return False
+        return True
+
+    def stop(self, name, timeout=1.0):
+        """Stop a worker and wait up to timeout seconds; True once it is gone."""
+        with self._lock:
+            worker = self._workers.get(name)
+        if worker is None:
+            return True
+        return self._stop(worker, timeout)
+
+    def stop_all(self, timeout=2.0):
+        """Stop every worker, joining them all within one overall deadline."""
+        with self._lock:
+            workers = list(self._workers.values())
+        for worker in workers:
+            worker.stop()
+        deadline = time.monotonic() + timeout
+        stopped = True
+        for worker in workers:
+            if not worker.join(max(deadline - time.monotonic(), 0)):
+                self.timed_out += 1
+                print(f"Worker {worker.name} did not stop within {timeout:.1f} s")
+                stopped = False
+        return stopped
+
+    def get(self, name):
+        with self._lock:
+            return self._workers.get(name)
+
+    def is_running(self, name):
+        return self.get(name) is not None
+
+    def running(self):
+        """Names of the workers running right now."""
+        with self._lock:
+            return sorted(self._workers)
+
+    def __len__(self):
+        return len(self.running())
+
+    def stats(self):
+        return {
+            'running': len(self),
+            'started': self.started,
+            'rejected': self.rejected,
+            'replaced': self.replaced,
+            'timed_out': self.timed_out,
+        }
+
+    def summary(self):
+        names = self.running()
+        return (f"{len(names)} running ({', '.join(names) or 'none'}), {self.started} started, "
+                f"{self.rejected} rejected, {self.replaced} replaced, {self.timed_out} timed out")